@@ -0,0 +1,22 @@
+-- Registro de archivos subidos y derivados de imágenes (miniaturas WebP, placeholder)
+CREATE TABLE IF NOT EXISTS archivo (
+    ruta VARCHAR(500) PRIMARY KEY,
+    url VARCHAR(500) UNIQUE NOT NULL,
+    id_user VARCHAR(36) REFERENCES usuario(id_user) ON DELETE SET NULL,
+    content_type VARCHAR(100) NOT NULL,
+    tamano BIGINT NOT NULL,
+    variantes JSONB,
+    placeholder TEXT,
+    ancho INTEGER,
+    alto INTEGER,
+    fecha_subida TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE archivo IS 'Objetos del bucket media subidos por la API';
+COMMENT ON COLUMN archivo.variantes IS 'URLs de las variantes WebP: {"thumb": ..., "card": ..., "full": ...}';
+
+-- Derivados copiados a cada media al crear la publicación
+ALTER TABLE media ADD COLUMN IF NOT EXISTS variantes JSONB;
+ALTER TABLE media ADD COLUMN IF NOT EXISTS placeholder TEXT;
+ALTER TABLE media ADD COLUMN IF NOT EXISTS ancho INTEGER;
+ALTER TABLE media ADD COLUMN IF NOT EXISTS alto INTEGER;
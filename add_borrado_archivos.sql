@@ -0,0 +1,59 @@
+-- Borrado de archivos en dos pasos: marcar la fila, eliminar los objetos del
+-- bucket y recién entonces borrar la fila
+-- Requiere add_recoleccion_archivos.sql
+--
+-- Si el bucket falla después de borrar la fila, sus objetos quedan huérfanos
+-- sin nada que los vuelva a recolectar. Con la fila marcada (eliminando_en)
+-- el archivo deja de ofrecerse como duplicado y la recolección reintenta los
+-- marcados que no llegaron a borrarse.
+ALTER TABLE archivo ADD COLUMN IF NOT EXISTS eliminando_en TIMESTAMP;
+
+COMMENT ON COLUMN archivo.eliminando_en IS 'Momento en que se decidió borrar el archivo; la fila se borra tras eliminar los objetos del bucket';
+
+CREATE INDEX IF NOT EXISTS idx_archivo_eliminando ON archivo(eliminando_en) WHERE eliminando_en IS NOT NULL;
+
+-- Marca un archivo para borrar solo si nadie lo usa: sin media que lo
+-- referencie, sin ser foto de perfil y sin haberse entregado como duplicado
+-- dentro de p_gracia. Devuelve la fila marcada (nada si sigue en uso); el
+-- llamador elimina los objetos del bucket y luego borra la fila.
+CREATE OR REPLACE FUNCTION marcar_archivo_sin_uso(p_ruta VARCHAR, p_gracia INTERVAL)
+RETURNS SETOF archivo AS $$
+    UPDATE archivo a SET eliminando_en = now()
+    WHERE a.ruta = p_ruta
+      AND a.eliminando_en IS NULL
+      AND a.referencias = 0
+      AND (a.reutilizado_en IS NULL OR a.reutilizado_en < now() - p_gracia)
+      AND NOT EXISTS (SELECT 1 FROM usuario u WHERE u.foto_perfil = a.url)
+    RETURNING a.*;
+$$ LANGUAGE sql;
+
+-- Recolección periódica: marca hasta p_limite archivos subidos hace más de
+-- p_gracia que nunca se enlazaron (o dejaron de estarlo), más los marcados
+-- hace más de p_reintento cuyo borrado quedó a medias. Las filas bloqueadas
+-- por otra transacción se saltan y se recogen en la siguiente pasada.
+CREATE OR REPLACE FUNCTION marcar_archivos_sin_uso(p_gracia INTERVAL, p_reintento INTERVAL, p_limite INTEGER)
+RETURNS SETOF archivo AS $$
+    UPDATE archivo a SET eliminando_en = now()
+    WHERE a.ruta IN (
+        SELECT c.ruta FROM archivo c
+        WHERE c.referencias = 0
+          AND (
+              c.eliminando_en < now() - p_reintento
+              OR (
+                  c.eliminando_en IS NULL
+                  AND c.fecha_subida < now() - p_gracia
+                  AND (c.reutilizado_en IS NULL OR c.reutilizado_en < now() - p_gracia)
+                  AND NOT EXISTS (SELECT 1 FROM usuario u WHERE u.foto_perfil = c.url)
+              )
+          )
+        ORDER BY c.fecha_subida
+        LIMIT p_limite
+        FOR UPDATE SKIP LOCKED
+    )
+    AND a.referencias = 0
+    RETURNING a.*;
+$$ LANGUAGE sql;
+
+-- Las versiones anteriores borraban la fila antes que los objetos
+DROP FUNCTION IF EXISTS eliminar_archivo_sin_uso(VARCHAR, INTERVAL);
+DROP FUNCTION IF EXISTS recolectar_archivos(INTERVAL, INTEGER);
@@ -0,0 +1,57 @@
+-- Contadores desnormalizados de comentarios y reacciones por publicación
+ALTER TABLE publicacion
+ADD COLUMN IF NOT EXISTS comentarios_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE publicacion
+ADD COLUMN IF NOT EXISTS reacciones_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE publicacion
+ADD COLUMN IF NOT EXISTS reacciones_por_tipo JSONB NOT NULL DEFAULT '{}'::jsonb;
+
+COMMENT ON COLUMN publicacion.comentarios_count IS 'Cantidad de comentarios (mantenida por la API)';
+COMMENT ON COLUMN publicacion.reacciones_count IS 'Cantidad total de reacciones (mantenida por la API)';
+COMMENT ON COLUMN publicacion.reacciones_por_tipo IS 'Reacciones por tipo_reac, ej: {"like": 3, "love": 1}';
+
+-- Ajuste atómico de contadores (llamado vía RPC desde comentarios y reacciones)
+CREATE OR REPLACE FUNCTION ajustar_contadores_publicacion(
+    p_id_publicacion VARCHAR,
+    p_delta_comentarios INTEGER DEFAULT 0,
+    p_tipo_reac VARCHAR DEFAULT NULL,
+    p_delta_reacciones INTEGER DEFAULT 0
+) RETURNS VOID AS $$
+    UPDATE publicacion SET
+        comentarios_count = GREATEST(comentarios_count + p_delta_comentarios, 0),
+        reacciones_count = GREATEST(reacciones_count + p_delta_reacciones, 0),
+        reacciones_por_tipo = CASE
+            WHEN p_tipo_reac IS NULL THEN reacciones_por_tipo
+            ELSE jsonb_set(
+                reacciones_por_tipo,
+                ARRAY[p_tipo_reac],
+                to_jsonb(GREATEST(COALESCE((reacciones_por_tipo->>p_tipo_reac)::INTEGER, 0) + p_delta_reacciones, 0))
+            )
+        END
+    WHERE id_publicacion = p_id_publicacion;
+$$ LANGUAGE sql;
+
+-- Recalcular todos los contadores desde cero (corrige desvíos)
+CREATE OR REPLACE FUNCTION recalcular_contadores_publicacion() RETURNS VOID AS $$
+    UPDATE publicacion p SET
+        comentarios_count = (
+            SELECT COUNT(*) FROM comentario c WHERE c.id_publicacion = p.id_publicacion
+        ),
+        reacciones_count = (
+            SELECT COUNT(*) FROM reaccion r WHERE r.id_publicacion = p.id_publicacion
+        ),
+        reacciones_por_tipo = COALESCE((
+            SELECT jsonb_object_agg(t.tipo_reac, t.total)
+            FROM (
+                SELECT tipo_reac, COUNT(*) AS total
+                FROM reaccion r
+                WHERE r.id_publicacion = p.id_publicacion
+                GROUP BY tipo_reac
+            ) t
+        ), '{}'::jsonb);
+$$ LANGUAGE sql;
+
+-- Carga inicial
+SELECT recalcular_contadores_publicacion();
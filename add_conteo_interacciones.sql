@@ -0,0 +1,36 @@
+-- Conteo agrupado de comentarios y reacciones para una página del feed
+-- Lo usa completar_contadores (app/utils/contadores.py) para las publicaciones
+-- sin contadores desnormalizados. Devuelve una fila por publicación, así el
+-- resultado nunca se corta por el límite de filas de PostgREST.
+CREATE OR REPLACE FUNCTION contar_interacciones_publicaciones(
+    p_ids VARCHAR[],
+    p_id_user VARCHAR
+) RETURNS TABLE (
+    id_publicacion VARCHAR,
+    comentarios_count INTEGER,
+    reacciones_por_tipo JSONB,
+    mis_reacciones VARCHAR[]
+) AS $$
+    SELECT
+        ids.id,
+        (
+            SELECT COUNT(*)::INTEGER FROM comentario c WHERE c.id_publicacion = ids.id
+        ),
+        COALESCE((
+            SELECT jsonb_object_agg(t.tipo_reac, t.total)
+            FROM (
+                SELECT r.tipo_reac, COUNT(*) AS total
+                FROM reaccion r
+                WHERE r.id_publicacion = ids.id
+                GROUP BY r.tipo_reac
+            ) t
+        ), '{}'::jsonb),
+        COALESCE((
+            SELECT array_agg(r.tipo_reac::VARCHAR)
+            FROM reaccion r
+            WHERE r.id_publicacion = ids.id AND r.id_user = p_id_user
+        ), ARRAY[]::VARCHAR[])
+    FROM unnest(p_ids) AS ids(id);
+$$ LANGUAGE sql STABLE;
+
+CREATE INDEX IF NOT EXISTS idx_reaccion_publicacion ON reaccion(id_publicacion);
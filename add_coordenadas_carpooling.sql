@@ -0,0 +1,24 @@
+-- Coordenadas (WGS84) de rutas, paradas y puntos de recogida para buscar
+-- viajes por cercanía. Los textos existentes se mantienen como descripción.
+ALTER TABLE ruta ADD COLUMN IF NOT EXISTS lat_inicio DOUBLE PRECISION;
+ALTER TABLE ruta ADD COLUMN IF NOT EXISTS lon_inicio DOUBLE PRECISION;
+ALTER TABLE ruta ADD COLUMN IF NOT EXISTS lat_destino DOUBLE PRECISION;
+ALTER TABLE ruta ADD COLUMN IF NOT EXISTS lon_destino DOUBLE PRECISION;
+
+ALTER TABLE parada ADD COLUMN IF NOT EXISTS latitud DOUBLE PRECISION;
+ALTER TABLE parada ADD COLUMN IF NOT EXISTS longitud DOUBLE PRECISION;
+
+ALTER TABLE pasajeroruta ADD COLUMN IF NOT EXISTS lat_recogida DOUBLE PRECISION;
+ALTER TABLE pasajeroruta ADD COLUMN IF NOT EXISTS lon_recogida DOUBLE PRECISION;
+
+COMMENT ON COLUMN ruta.lat_inicio IS 'Latitud de punto_inicio';
+COMMENT ON COLUMN ruta.lon_inicio IS 'Longitud de punto_inicio';
+COMMENT ON COLUMN ruta.lat_destino IS 'Latitud de punto_destino';
+COMMENT ON COLUMN ruta.lon_destino IS 'Longitud de punto_destino';
+COMMENT ON COLUMN parada.latitud IS 'Latitud de ubicacion_parada';
+COMMENT ON COLUMN parada.longitud IS 'Longitud de ubicacion_parada';
+COMMENT ON COLUMN pasajeroruta.lat_recogida IS 'Latitud de ubicacion_recogida';
+COMMENT ON COLUMN pasajeroruta.lon_recogida IS 'Longitud de ubicacion_recogida';
+
+-- El índice geográfico en memoria recarga las paradas por ruta
+CREATE INDEX IF NOT EXISTS idx_parada_ruta ON parada(id_ruta, orden_parada);
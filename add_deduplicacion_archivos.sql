@@ -0,0 +1,33 @@
+-- Deduplicación de archivos por contenido (SHA-256) con conteo de referencias
+-- Requiere add_archivos_media.sql
+ALTER TABLE archivo ADD COLUMN IF NOT EXISTS sha256 CHAR(64);
+ALTER TABLE archivo ADD COLUMN IF NOT EXISTS referencias INTEGER NOT NULL DEFAULT 0;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_archivo_sha256 ON archivo(sha256);
+CREATE INDEX IF NOT EXISTS idx_media_url ON media(url);
+
+COMMENT ON COLUMN archivo.sha256 IS 'Hash del contenido subido; la ruta en el bucket se deriva de él';
+COMMENT ON COLUMN archivo.referencias IS 'Filas de media que apuntan a este archivo (mantenido por triggers)';
+
+-- Las referencias se mantienen en la base de datos para cubrir también los
+-- borrados en cascada de media al eliminar una publicación
+CREATE OR REPLACE FUNCTION actualizar_referencias_archivo()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE archivo SET referencias = referencias + 1 WHERE url = NEW.url;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE archivo SET referencias = GREATEST(referencias - 1, 0) WHERE url = OLD.url;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_media_referencias ON media;
+CREATE TRIGGER trg_media_referencias
+AFTER INSERT OR DELETE OR UPDATE OF url ON media
+FOR EACH ROW EXECUTE FUNCTION actualizar_referencias_archivo();
+
+-- Carga inicial de referencias
+UPDATE archivo a SET referencias = (SELECT COUNT(*) FROM media m WHERE m.url = a.url);
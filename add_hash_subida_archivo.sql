@@ -0,0 +1,16 @@
+-- Hash del contenido subido, separado del hash de lo almacenado
+-- Requiere add_deduplicacion_archivos.sql
+--
+-- Las imágenes se reescriben sin EXIF antes de guardarlas, así que los bytes
+-- del bucket no son los que envió el cliente. archivo.sha256 (y la ruta) se
+-- derivan de lo almacenado; sha256_subida permite reconocer una subida
+-- repetida sin volver a procesarla.
+ALTER TABLE archivo ADD COLUMN IF NOT EXISTS sha256_subida CHAR(64);
+
+COMMENT ON COLUMN archivo.sha256 IS 'Hash de los bytes almacenados; la ruta en el bucket se deriva de él';
+COMMENT ON COLUMN archivo.sha256_subida IS 'Hash del contenido tal como lo envió el cliente';
+
+CREATE INDEX IF NOT EXISTS idx_archivo_sha256_subida ON archivo(sha256_subida);
+
+-- En las filas anteriores sha256 es el hash de lo subido
+UPDATE archivo SET sha256_subida = sha256 WHERE sha256_subida IS NULL AND sha256 IS NOT NULL;
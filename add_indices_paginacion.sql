@@ -0,0 +1,6 @@
+-- Índices para la paginación por cursor (fecha, id) de los listados
+CREATE INDEX IF NOT EXISTS idx_publicacion_fecha_id ON publicacion(fecha_creacion DESC, id_publicacion DESC);
+CREATE INDEX IF NOT EXISTS idx_comentario_publicacion_fecha_id ON comentario(id_publicacion, fecha_creacion DESC, id_comentario DESC);
+CREATE INDEX IF NOT EXISTS idx_mensaje_conversacion_fecha_id ON mensaje(id_conversacion, fecha_envio, id_mensaje);
+CREATE INDEX IF NOT EXISTS idx_notificacion_usuario_fecha_id ON notificacion(id_user, fecha_envio DESC, id_notificacion DESC);
+CREATE INDEX IF NOT EXISTS idx_ruta_activa_fecha_id ON ruta(activa, fecha_creacion DESC, id_ruta DESC);
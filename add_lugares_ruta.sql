@@ -0,0 +1,102 @@
+-- Pasajeros aceptados por ruta, mantenido al aceptar / cancelar pasajeros
+ALTER TABLE ruta
+ADD COLUMN IF NOT EXISTS pasajeros_aceptados INTEGER NOT NULL DEFAULT 0 CHECK (pasajeros_aceptados >= 0);
+
+COMMENT ON COLUMN ruta.pasajeros_aceptados IS 'Pasajeros con estado aceptado (mantenido por cambiar_estado_pasajero)';
+
+-- El contador guarda siempre la cantidad real de aceptados, aunque una ruta
+-- ya estuviera sobrevendida antes de la migración; por eso no hay un CHECK
+-- pasajeros_aceptados <= capacidad_ruta (impediría guardar ese valor y
+-- cualquier otro cambio de esas rutas). La capacidad se protege con
+-- actualizaciones condicionadas: cambiar_estado_pasajero no acepta si la ruta
+-- está llena y la API solo baja la capacidad si sigue cubriendo a los
+-- aceptados (ver app/utils/lugares.py).
+ALTER TABLE ruta DROP CONSTRAINT IF EXISTS ruta_lugares_check;
+
+CREATE INDEX IF NOT EXISTS idx_pasajeroruta_ruta_estado ON pasajeroruta(id_ruta, estado);
+
+-- Cambia el estado de una solicitud y ajusta el contador de la ruta en la
+-- misma transacción (llamado vía RPC). El UPDATE de la ruta bloquea su fila,
+-- así que dos aceptaciones simultáneas se serializan y la segunda falla con
+-- 'ruta_llena' si ya no hay lugar (también si la ruta ya está sobrevendida).
+CREATE OR REPLACE FUNCTION cambiar_estado_pasajero(
+    p_id_pasajero_ruta VARCHAR,
+    p_estado VARCHAR
+) RETURNS SETOF pasajeroruta AS $$
+DECLARE
+    v_anterior VARCHAR;
+    v_id_ruta VARCHAR;
+    v_delta INTEGER;
+BEGIN
+    SELECT estado, id_ruta INTO v_anterior, v_id_ruta
+    FROM pasajeroruta
+    WHERE id_pasajero_ruta = p_id_pasajero_ruta
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    v_delta := (p_estado = 'aceptado')::INTEGER - (v_anterior = 'aceptado')::INTEGER;
+    IF v_delta <> 0 THEN
+        UPDATE ruta SET pasajeros_aceptados = pasajeros_aceptados + v_delta
+        WHERE id_ruta = v_id_ruta
+          AND (v_delta < 0 OR pasajeros_aceptados < capacidad_ruta);
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'ruta_llena';
+        END IF;
+    END IF;
+
+    RETURN QUERY
+    UPDATE pasajeroruta SET estado = p_estado
+    WHERE id_pasajero_ruta = p_id_pasajero_ruta
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recalcula los contadores desde pasajeroruta (corrige desvíos); devuelve
+-- cuántas rutas se corrigieron.
+--
+-- Primero bloquea todas las rutas (en orden, para no cruzarse con otros
+-- bloqueos) y cuenta en una sentencia posterior: su instantánea ya incluye
+-- todo cambio de estado confirmado antes de obtener los bloqueos, y los que
+-- lleguen después esperan y ajustan el contador ya corregido. Contar y
+-- actualizar en una sola sentencia podía escribir un conteo viejo sobre un
+-- contador recién incrementado.
+--
+-- Las rutas ya sobrevendidas (datos anteriores al contador) guardan su
+-- cantidad real, así no aceptan a nadie hasta volver a tener lugar, y se
+-- avisan.
+CREATE OR REPLACE FUNCTION recalcular_pasajeros_aceptados() RETURNS INTEGER AS $$
+DECLARE
+    v_corregidas INTEGER;
+    v_sobrevendidas INTEGER;
+BEGIN
+    PERFORM 1 FROM ruta ORDER BY id_ruta FOR UPDATE;
+
+    WITH reales AS (
+        SELECT r.id_ruta, COUNT(p.id_pasajero_ruta)::INTEGER AS total
+        FROM ruta r
+        LEFT JOIN pasajeroruta p ON p.id_ruta = r.id_ruta AND p.estado = 'aceptado'
+        GROUP BY r.id_ruta
+    ), corregidas AS (
+        UPDATE ruta r SET pasajeros_aceptados = reales.total
+        FROM reales
+        WHERE reales.id_ruta = r.id_ruta AND r.pasajeros_aceptados <> reales.total
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER INTO v_corregidas FROM corregidas;
+
+    SELECT COUNT(*)::INTEGER INTO v_sobrevendidas
+    FROM ruta
+    WHERE pasajeros_aceptados > capacidad_ruta;
+    IF v_sobrevendidas > 0 THEN
+        RAISE WARNING '% rutas tienen más pasajeros aceptados que su capacidad', v_sobrevendidas;
+    END IF;
+
+    RETURN v_corregidas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Carga inicial
+SELECT recalcular_pasajeros_aceptados();
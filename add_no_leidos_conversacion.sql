@@ -0,0 +1,15 @@
+-- Mensajes no leídos por conversación para la bandeja de entrada
+-- Devuelve una fila por conversación con mensajes sin leer de otros
+-- participantes, así el conteo no depende del límite de filas de PostgREST
+-- ni de descargar los mensajes.
+CREATE OR REPLACE FUNCTION contar_no_leidos(p_ids VARCHAR[], p_id_user VARCHAR)
+RETURNS TABLE (id_conversacion VARCHAR, no_leidos INTEGER) AS $$
+    SELECT m.id_conversacion, COUNT(*)::INTEGER
+    FROM mensaje m
+    WHERE m.id_conversacion = ANY(p_ids)
+      AND m.leido = FALSE
+      AND m.id_user <> p_id_user
+    GROUP BY m.id_conversacion;
+$$ LANGUAGE sql STABLE;
+
+CREATE INDEX IF NOT EXISTS idx_mensaje_no_leidos ON mensaje(id_conversacion) WHERE leido = FALSE;
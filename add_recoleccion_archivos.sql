@@ -0,0 +1,47 @@
+-- Borrado seguro y recolección de archivos sin uso
+-- Requiere add_deduplicacion_archivos.sql
+--
+-- Un archivo deduplicado puede entregarse como `duplicado` a otro usuario
+-- antes de que exista la fila de media que lo referencia; reutilizado_en
+-- marca ese momento para no borrarlo mientras tanto.
+ALTER TABLE archivo ADD COLUMN IF NOT EXISTS reutilizado_en TIMESTAMP;
+
+COMMENT ON COLUMN archivo.reutilizado_en IS 'Última vez que el contenido se entregó como duplicado a una subida';
+
+CREATE INDEX IF NOT EXISTS idx_archivo_sin_referencias ON archivo(fecha_subida) WHERE referencias = 0;
+CREATE INDEX IF NOT EXISTS idx_usuario_foto_perfil ON usuario(foto_perfil);
+
+-- Borra la fila de un archivo solo si nadie lo usa: sin media que lo
+-- referencie, sin ser foto de perfil y sin haberse entregado como duplicado
+-- dentro de p_gracia. Devuelve la fila borrada (nada si sigue en uso); el
+-- llamador elimina los objetos del bucket solo en ese caso.
+CREATE OR REPLACE FUNCTION eliminar_archivo_sin_uso(p_ruta VARCHAR, p_gracia INTERVAL)
+RETURNS SETOF archivo AS $$
+    DELETE FROM archivo a
+    WHERE a.ruta = p_ruta
+      AND a.referencias = 0
+      AND (a.reutilizado_en IS NULL OR a.reutilizado_en < now() - p_gracia)
+      AND NOT EXISTS (SELECT 1 FROM usuario u WHERE u.foto_perfil = a.url)
+    RETURNING a.*;
+$$ LANGUAGE sql;
+
+-- Recolección periódica: borra hasta p_limite archivos subidos hace más de
+-- p_gracia que nunca se enlazaron (o dejaron de estarlo). Las filas
+-- bloqueadas por otra transacción se saltan y se recogen en la siguiente
+-- pasada.
+CREATE OR REPLACE FUNCTION recolectar_archivos(p_gracia INTERVAL, p_limite INTEGER)
+RETURNS SETOF archivo AS $$
+    DELETE FROM archivo a
+    WHERE a.ruta IN (
+        SELECT c.ruta FROM archivo c
+        WHERE c.referencias = 0
+          AND c.fecha_subida < now() - p_gracia
+          AND (c.reutilizado_en IS NULL OR c.reutilizado_en < now() - p_gracia)
+          AND NOT EXISTS (SELECT 1 FROM usuario u WHERE u.foto_perfil = c.url)
+        ORDER BY c.fecha_subida
+        LIMIT p_limite
+        FOR UPDATE SKIP LOCKED
+    )
+    AND a.referencias = 0
+    RETURNING a.*;
+$$ LANGUAGE sql;
@@ -0,0 +1,23 @@
+-- Resumen del último mensaje por conversación (usado por la bandeja de entrada)
+ALTER TABLE conversacion
+ADD COLUMN IF NOT EXISTS ultimo_mensaje_id VARCHAR(36) REFERENCES mensaje(id_mensaje) ON DELETE SET NULL;
+
+ALTER TABLE conversacion
+ADD COLUMN IF NOT EXISTS fecha_ultimo_mensaje TIMESTAMP;
+
+COMMENT ON COLUMN conversacion.ultimo_mensaje_id IS 'Último mensaje enviado (mantenido por la API)';
+COMMENT ON COLUMN conversacion.fecha_ultimo_mensaje IS 'Fecha del último mensaje, para ordenar la bandeja';
+
+CREATE INDEX IF NOT EXISTS idx_mensaje_conversacion_fecha ON mensaje(id_conversacion, fecha_envio DESC);
+CREATE INDEX IF NOT EXISTS idx_usuarioconversacion_usuario ON usuarioconversacion(id_usuario);
+
+-- Carga inicial del resumen
+UPDATE conversacion c SET
+    ultimo_mensaje_id = u.id_mensaje,
+    fecha_ultimo_mensaje = u.fecha_envio
+FROM (
+    SELECT DISTINCT ON (id_conversacion) id_conversacion, id_mensaje, fecha_envio
+    FROM mensaje
+    ORDER BY id_conversacion, fecha_envio DESC
+) u
+WHERE u.id_conversacion = c.id_conversacion;
@@ -0,0 +1,33 @@
+-- Subidas firmadas pendientes de completar
+-- Requiere add_recoleccion_archivos.sql
+--
+-- POST /upload/firmar registra la ruta del objeto y POST /upload/completar la
+-- quita. Si el cliente sube los bytes a la URL firmada pero nunca completa, el
+-- objeto queda en el bucket sin validar ni registrar en `archivo`; la
+-- recolección periódica borra esas rutas una vez vencido el token de subida
+-- más el período de gracia (que cubre también la validez de la URL firmada).
+CREATE TABLE IF NOT EXISTS subida_firmada (
+    ruta VARCHAR(500) PRIMARY KEY,
+    id_user VARCHAR(36) NOT NULL,
+    fecha_creacion TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_subida_firmada_fecha ON subida_firmada(fecha_creacion);
+
+COMMENT ON TABLE subida_firmada IS 'Subidas firmadas aún no completadas (mantenida por la API)';
+
+-- Borra hasta p_limite subidas creadas hace más de p_antiguedad y devuelve
+-- sus rutas; el llamador elimina los objetos del bucket. Las filas bloqueadas
+-- (una subida completándose) se saltan.
+CREATE OR REPLACE FUNCTION recolectar_subidas_firmadas(p_antiguedad INTERVAL, p_limite INTEGER)
+RETURNS SETOF subida_firmada AS $$
+    DELETE FROM subida_firmada s
+    WHERE s.ruta IN (
+        SELECT c.ruta FROM subida_firmada c
+        WHERE c.fecha_creacion < now() - p_antiguedad
+        ORDER BY c.fecha_creacion
+        LIMIT p_limite
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING s.*;
+$$ LANGUAGE sql;
@@ -0,0 +1,52 @@
+-- Timelines personalizados (fan-out al escribir): una fila por publicación y
+-- por lector (el autor, sus amigos y los estudiantes de su grupo)
+CREATE TABLE IF NOT EXISTS timeline (
+    id_user VARCHAR(36) NOT NULL REFERENCES usuario(id_user) ON DELETE CASCADE,
+    id_publicacion VARCHAR(36) NOT NULL REFERENCES publicacion(id_publicacion) ON DELETE CASCADE,
+    fecha_creacion TIMESTAMP NOT NULL,
+    PRIMARY KEY (id_user, id_publicacion)
+);
+
+COMMENT ON TABLE timeline IS 'Publicaciones visibles en el feed de cada usuario (mantenida por la API)';
+COMMENT ON COLUMN timeline.fecha_creacion IS 'Copia de publicacion.fecha_creacion, para paginar sin join';
+
+-- Una página del feed es un solo rango sobre este índice
+CREATE INDEX IF NOT EXISTS idx_timeline_usuario_fecha ON timeline(id_user, fecha_creacion DESC, id_publicacion DESC);
+
+-- Para leer al momento las publicaciones de cuentas populares (sin fan-out)
+CREATE INDEX IF NOT EXISTS idx_publicacion_usuario_fecha ON publicacion(id_user, fecha_creacion DESC, id_publicacion DESC);
+
+-- Deja como mucho p_max publicaciones por usuario (llamado vía RPC periódicamente)
+CREATE OR REPLACE FUNCTION recortar_timelines(p_max INTEGER) RETURNS VOID AS $$
+    DELETE FROM timeline t
+    USING (
+        SELECT id_user, id_publicacion
+        FROM (
+            SELECT id_user, id_publicacion,
+                   ROW_NUMBER() OVER (PARTITION BY id_user ORDER BY fecha_creacion DESC, id_publicacion DESC) AS posicion
+            FROM timeline
+        ) r
+        WHERE r.posicion > p_max
+    ) sobrantes
+    WHERE t.id_user = sobrantes.id_user AND t.id_publicacion = sobrantes.id_publicacion;
+$$ LANGUAGE sql;
+
+-- Carga inicial: publicaciones existentes para el autor, sus amigos y su grupo
+INSERT INTO timeline (id_user, id_publicacion, fecha_creacion)
+SELECT DISTINCT lector.id_user, p.id_publicacion, p.fecha_creacion
+FROM publicacion p
+CROSS JOIN LATERAL (
+    SELECT p.id_user
+    UNION
+    SELECT CASE WHEN r.id_usuario1 = p.id_user THEN r.id_usuario2 ELSE r.id_usuario1 END
+    FROM relacionusuario r
+    WHERE r.estado = 'aceptado' AND p.id_user IN (r.id_usuario1, r.id_usuario2)
+    UNION
+    SELECT otro.id_user
+    FROM estudiante autor
+    JOIN estudiante otro ON otro.id_grupo = autor.id_grupo
+    WHERE autor.id_user = p.id_user
+) lector(id_user)
+ON CONFLICT DO NOTHING;
+
+SELECT recortar_timelines(500);
@@ -0,0 +1,10 @@
+-- Tipos de notificación que usa el backend y que el CHECK original no admitía
+-- ('amistad_aceptada' en amigos.responder_solicitud, 'respuesta_ruta' en
+-- pasajeros.update_estado_pasajero). Deben coincidir con TipoNotificacionEnum.
+ALTER TABLE notificacion DROP CONSTRAINT IF EXISTS notificacion_tipo_check;
+
+ALTER TABLE notificacion
+ADD CONSTRAINT notificacion_tipo_check CHECK (tipo IN (
+    'comentario', 'reaccion', 'solicitud_amistad', 'amistad_aceptada',
+    'solicitud_ruta', 'respuesta_ruta', 'mensaje', 'nota_nueva', 'otro'
+));
@@ -6,6 +6,7 @@ from pydantic_settings import BaseSettings
 from typing import Optional
 from dotenv import load_dotenv
 import os
+import tempfile
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -25,12 +26,71 @@ class Settings(BaseSettings):
     SUPABASE_ANON_KEY: Optional[str] = os.getenv("SUPABASE_ANON_KEY")
     SUPABASE_SERVICE_ROLE: Optional[str] = os.getenv("SUPABASE_SERVICE_ROLE")
     SUPABASE_SERVICE_KEY: Optional[str] = os.getenv("SUPABASE_SERVICE_KEY")
-    
+
+    # Pool HTTP compartido hacia Supabase (cliente asíncrono)
+    DB_POOL_MAX_CONNECTIONS: int = int(os.getenv("DB_POOL_MAX_CONNECTIONS", "100"))
+    DB_POOL_MAX_KEEPALIVE: int = int(os.getenv("DB_POOL_MAX_KEEPALIVE", "20"))
+    DB_POOL_KEEPALIVE_EXPIRY: float = float(os.getenv("DB_POOL_KEEPALIVE_EXPIRY", "30"))  # segundos
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "5"))  # espera por una conexión libre
+    DB_CONNECT_TIMEOUT: float = float(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+    DB_TIMEOUT: float = float(os.getenv("DB_TIMEOUT", "15"))  # timeout por llamada a PostgREST
+    STORAGE_TIMEOUT: int = int(os.getenv("STORAGE_TIMEOUT", "60"))
+
     # Configuración de seguridad
     SECRET_KEY: str = os.getenv("SECRET_KEY", "red-social-univalle-2025-super-secret-key-change-in-production")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "43200"))  # 30 días
     REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "90"))  # 90 días
+
+    # Caché de usuarios autenticados
+    USER_CACHE_MAXSIZE: int = int(os.getenv("USER_CACHE_MAXSIZE", "10000"))
+    USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", "300"))  # segundos
+    
+    # Caché de respuestas de catálogos académicos (materias, grupos, horarios, docentes)
+    CATALOGO_CACHE_MAXSIZE: int = int(os.getenv("CATALOGO_CACHE_MAXSIZE", "2000"))
+    CATALOGO_CACHE_TTL: float = float(os.getenv("CATALOGO_CACHE_TTL", "600"))  # segundos
+    CATALOGO_CACHE_MAX_AGE: int = int(os.getenv("CATALOGO_CACHE_MAX_AGE", "60"))  # Cache-Control del cliente
+    
+    # Índice de búsqueda de usuarios (recarga completa periódica)
+    BUSQUEDA_REFRESH_SECONDS: float = float(os.getenv("BUSQUEDA_REFRESH_SECONDS", "900"))
+    
+    # Grafo de amistades en memoria (recarga completa periódica)
+    GRAFO_REFRESH_SECONDS: float = float(os.getenv("GRAFO_REFRESH_SECONDS", "900"))
+    
+    # Sugerencias de compañeros por grupo y materias (recarga completa periódica)
+    COMPANEROS_REFRESH_SECONDS: float = float(os.getenv("COMPANEROS_REFRESH_SECONDS", "1800"))
+    
+    # Índice geográfico de rutas de carpooling (recarga completa periódica)
+    RUTAS_CELDA_GRADOS: float = float(os.getenv("RUTAS_CELDA_GRADOS", "0.01"))  # ~1.1 km
+    RUTAS_INDICE_REFRESH_SECONDS: float = float(os.getenv("RUTAS_INDICE_REFRESH_SECONDS", "600"))
+    LUGARES_RECALCULO_SECONDS: float = float(os.getenv("LUGARES_RECALCULO_SECONDS", "3600"))  # corrige desvíos
+    ASIGNACION_CACHE_TTL: float = float(os.getenv("ASIGNACION_CACHE_TTL", "60"))  # propuestas de asignación
+    
+    # Nomenclátor local para geocodificar ubicaciones de carpooling sin conexión
+    LUGARES_ARCHIVO: str = os.getenv("LUGARES_ARCHIVO", os.path.join(os.path.dirname(__file__), "data", "lugares.json"))
+    GEOCODIFICACION_CACHE_SIZE: int = int(os.getenv("GEOCODIFICACION_CACHE_SIZE", "4096"))
+    
+    # Caché de horarios por grupo
+    HORARIO_CACHE_MAXSIZE: int = int(os.getenv("HORARIO_CACHE_MAXSIZE", "2000"))
+    HORARIO_CACHE_TTL: float = float(os.getenv("HORARIO_CACHE_TTL", "3600"))  # segundos
+    
+    # Tiempo real (WebSocket / SSE)
+    REALTIME_BACKEND: str = os.getenv("REALTIME_BACKEND", "memory")  # memory | redis
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    REALTIME_QUEUE_SIZE: int = int(os.getenv("REALTIME_QUEUE_SIZE", "100"))
+    REALTIME_HEARTBEAT: float = float(os.getenv("REALTIME_HEARTBEAT", "25"))  # segundos
+    
+    # Outbox de notificaciones (inserción en lote en segundo plano)
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+    OUTBOX_FLUSH_INTERVAL: float = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "0.2"))  # segundos
+    OUTBOX_MAX_PENDING: int = int(os.getenv("OUTBOX_MAX_PENDING", "10000"))
+    
+    # Timelines del feed (fan-out al escribir)
+    TIMELINE_MAX_POR_USUARIO: int = int(os.getenv("TIMELINE_MAX_POR_USUARIO", "500"))
+    TIMELINE_UMBRAL_POPULAR: int = int(os.getenv("TIMELINE_UMBRAL_POPULAR", "1000"))  # amigos
+    TIMELINE_BATCH_SIZE: int = int(os.getenv("TIMELINE_BATCH_SIZE", "1000"))  # filas por inserción
+    TIMELINE_RECORTE_SECONDS: float = float(os.getenv("TIMELINE_RECORTE_SECONDS", "3600"))
+    TIMELINE_MAX_RETRIES: int = int(os.getenv("TIMELINE_MAX_RETRIES", "8"))  # intentos por publicación
     
     # Configuración de CORS
     CORS_ORIGINS: Optional[str] = '["http://localhost:3000", "http://127.0.0.1:3000"]'
@@ -39,6 +99,13 @@ class Settings(BaseSettings):
     # Configuración de archivos
     UPLOADS_DIR: str = "uploads"
     MAX_UPLOAD_SIZE: int = 5242880  # 5MB en bytes
+    UPLOAD_CONCURRENCY: int = int(os.getenv("UPLOAD_CONCURRENCY", "4"))  # subidas simultáneas a Storage
+    SIGNED_UPLOAD_EXPIRE_MINUTES: int = int(os.getenv("SIGNED_UPLOAD_EXPIRE_MINUTES", "15"))
+    RESUMABLE_UPLOAD_DIR: str = os.getenv("RESUMABLE_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "subidas_reanudables"))
+    RESUMABLE_UPLOAD_EXPIRE_HOURS: int = int(os.getenv("RESUMABLE_UPLOAD_EXPIRE_HOURS", "24"))
+    RESUMABLE_CHUNK_SIZE: int = int(os.getenv("RESUMABLE_CHUNK_SIZE", str(1024 * 1024)))  # tamaño sugerido de cada bloque
+    ARCHIVOS_GRACIA_SECONDS: float = float(os.getenv("ARCHIVOS_GRACIA_SECONDS", "86400"))  # antes de borrar archivos sin uso
+    ARCHIVOS_RECOLECCION_SECONDS: float = float(os.getenv("ARCHIVOS_RECOLECCION_SECONDS", "3600"))
     
     # Configuración de base de datos
     DATABASE_URL: Optional[str] = None
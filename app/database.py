@@ -1,22 +1,110 @@
 """
 Configuración de la base de datos con Supabase
+
+Las rutas usan un cliente asíncrono (`AsyncClient`) para que cada consulta a
+PostgREST libere el event loop mientras espera la respuesta. Todas las
+peticiones comparten un único pool HTTP acotado, con keep-alive y timeouts
+por llamada definidos en la configuración.
 """
-from supabase import create_client, Client
+from typing import Dict, Optional, Union
+import asyncio
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from supabase import AsyncClient, AsyncClientOptions, Client, create_client
 from app.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Cliente de Supabase
-supabase: Client = None
+# Cliente asíncrono de Supabase (compartido por todo el proceso)
+supabase: Optional[AsyncClient] = None
+_init_lock = asyncio.Lock()
+
+
+def _http_limits() -> httpx.Limits:
+    """
+    Límites del pool de conexiones HTTP hacia Supabase
+    """
+    return httpx.Limits(
+        max_connections=settings.DB_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.DB_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.DB_POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _http_timeout() -> httpx.Timeout:
+    """
+    Timeouts aplicados a cada llamada (conexión, lectura, escritura y espera del pool)
+    """
+    return httpx.Timeout(
+        settings.DB_TIMEOUT,
+        connect=settings.DB_CONNECT_TIMEOUT,
+        pool=settings.DB_POOL_TIMEOUT,
+    )
+
+
+class _PooledPostgrestClient(AsyncPostgrestClient):
+    """
+    Cliente PostgREST cuya sesión HTTP usa los límites del pool compartido
+    """
+
+    def create_session(
+        self,
+        base_url: str,
+        headers: Dict[str, str],
+        timeout: Union[int, float, httpx.Timeout],
+        verify: bool = True,
+        proxy: Optional[str] = None,
+    ) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=verify,
+            proxy=proxy,
+            follow_redirects=True,
+            http2=True,
+            limits=_http_limits(),
+        )
+
+
+class _PooledAsyncClient(AsyncClient):
+    """
+    AsyncClient de Supabase que reutiliza el pool HTTP acotado para PostgREST
+    """
+
+    @staticmethod
+    def _init_postgrest_client(
+        rest_url: str,
+        headers: Dict[str, str],
+        schema: str,
+        timeout: Union[int, float, httpx.Timeout] = settings.DB_TIMEOUT,
+        verify: bool = True,
+        proxy: Optional[str] = None,
+    ) -> AsyncPostgrestClient:
+        return _PooledPostgrestClient(
+            rest_url,
+            headers=headers,
+            schema=schema,
+            timeout=timeout,
+            verify=verify,
+            proxy=proxy,
+        )
 
 
-def get_supabase_client() -> Client:
+async def get_supabase_client() -> AsyncClient:
     """
-    Obtiene o crea el cliente de Supabase
+    Obtiene o crea el cliente asíncrono de Supabase
     """
     global supabase
-    if supabase is None:
+    if supabase is not None:
+        return supabase
+
+    async with _init_lock:
+        if supabase is not None:
+            return supabase
+
         # Intentar usar en orden la KEY de servicio (más permisos), luego la KEY estándar y por último la ANON
         keys_to_try = [
             settings.SUPABASE_SERVICE_KEY,
@@ -29,7 +117,13 @@ def get_supabase_client() -> Client:
             if not key:
                 continue
             try:
-                supabase = create_client(settings.SUPABASE_URL, key)
+                options = AsyncClientOptions(
+                    postgrest_client_timeout=_http_timeout(),
+                    storage_client_timeout=settings.STORAGE_TIMEOUT,
+                    auto_refresh_token=False,
+                    persist_session=False,
+                )
+                supabase = await _PooledAsyncClient.create(settings.SUPABASE_URL, key, options)
                 logger.info("✅ Conexión a Supabase establecida (key used)")
                 last_exc = None
                 break
@@ -44,24 +138,54 @@ def get_supabase_client() -> Client:
             )
             logger.error(f"❌ Error al conectar con Supabase: {last_exc}")
             raise RuntimeError(msg) from last_exc
-    return supabase
+        return supabase
+
+
+def get_supabase_client_sync() -> Client:
+    """
+    Crea un cliente síncrono de Supabase para scripts de mantenimiento
+
+    Los scripts se ejecutan fuera del event loop, así que no usan el cliente
+    asíncrono compartido de la API.
+    """
+    key = settings.SUPABASE_SERVICE_KEY or settings.SUPABASE_KEY or settings.SUPABASE_ANON_KEY
+    return create_client(settings.SUPABASE_URL, key)
 
 
-def init_db():
+async def init_db():
     """
     Inicializa la conexión a la base de datos
     """
     try:
-        get_supabase_client()
+        await get_supabase_client()
         logger.info("✅ Base de datos inicializada correctamente")
     except Exception as e:
         logger.error(f"❌ Error al inicializar la base de datos: {e}")
         raise
 
 
+async def close_db():
+    """
+    Cierra las conexiones HTTP abiertas del pool
+    """
+    global supabase
+    if supabase is None:
+        return
+    try:
+        if supabase._postgrest is not None:
+            await supabase._postgrest.aclose()
+        if supabase._storage is not None:
+            await supabase._storage.session.aclose()
+        logger.info("✅ Conexiones a Supabase cerradas")
+    except Exception as e:
+        logger.warning(f"Error al cerrar conexiones de Supabase: {e}")
+    finally:
+        supabase = None
+
+
 # Dependencia para obtener el cliente de Supabase en las rutas
-async def get_db() -> Client:
+async def get_db() -> AsyncClient:
     """
-    Dependencia para inyectar el cliente de Supabase en las rutas
+    Dependencia para inyectar el cliente asíncrono de Supabase en las rutas
     """
-    return get_supabase_client()
+    return await get_supabase_client()
@@ -11,7 +11,22 @@ import logging
 import time
 
 from app.config import settings
-from app.database import init_db
+from app.database import init_db, close_db
+from app.utils.dependencies import usuarios_cache
+from app.utils.cache_http import catalogo_cache
+from app.utils.cache_horarios import horarios_cache
+from app.utils.realtime import hub
+from app.utils.outbox import outbox
+from app.utils.reanudables import sesiones
+from app.utils.busqueda import indice_usuarios
+from app.utils.grafo_amigos import grafo_amigos
+from app.utils.companeros import companeros
+from app.utils.timelines import timelines
+from app.utils.indice_rutas import indice_rutas
+from app.utils.lugares import recalculo_lugares
+from app.utils.archivos import recoleccion_archivos
+from app.utils.asignacion import propuestas_asignacion
+from app.utils.geocodificacion import nomenclator
 
 # Importar routers
 from app.routes import auth, usuarios, estudiantes, docentes
@@ -36,15 +51,40 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Iniciando aplicación...")
     try:
-        init_db()
+        await init_db()
         logger.info("✅ Base de datos inicializada")
     except Exception as e:
         logger.error(f"❌ Error al inicializar base de datos: {e}")
+    try:
+        await hub.iniciar()
+        logger.info(f"✅ Tiempo real iniciado (backend: {hub.backend.nombre})")
+    except Exception as e:
+        logger.error(f"❌ Error al iniciar tiempo real: {e}")
+    await outbox.iniciar()
+    await indice_usuarios.iniciar()
+    await grafo_amigos.iniciar()
+    await companeros.iniciar()
+    await timelines.iniciar()
+    await indice_rutas.iniciar()
+    await recalculo_lugares.iniciar()
+    await recoleccion_archivos.iniciar()
+    await sesiones.iniciar()
     
     yield
     
     # Shutdown
     logger.info("👋 Cerrando aplicación...")
+    await indice_usuarios.cerrar()
+    await grafo_amigos.cerrar()
+    await companeros.cerrar()
+    await timelines.cerrar()
+    await indice_rutas.cerrar()
+    await recalculo_lugares.cerrar()
+    await recoleccion_archivos.cerrar()
+    await sesiones.cerrar()
+    await outbox.cerrar()
+    await hub.cerrar()
+    await close_db()
 
 
 # Crear la aplicación FastAPI
@@ -161,7 +201,24 @@ async def health_check():
     return {
         "status": "healthy",
         "version": settings.VERSION,
-        "environment": settings.ENVIRONMENT
+        "environment": settings.ENVIRONMENT,
+        "cache": {
+            "usuarios": usuarios_cache.stats(),
+            "catalogos": catalogo_cache.stats(),
+            "horarios": horarios_cache.stats()
+        },
+        "realtime": hub.stats(),
+        "outbox": outbox.stats(),
+        "busqueda": indice_usuarios.stats(),
+        "grafo_amigos": grafo_amigos.stats(),
+        "companeros": companeros.stats(),
+        "timelines": timelines.stats(),
+        "rutas": indice_rutas.stats(),
+        "lugares": recalculo_lugares.stats(),
+        "archivos": recoleccion_archivos.stats(),
+        "reanudables": sesiones.stats(),
+        "asignacion": propuestas_asignacion.stats(),
+        "geocodificacion": nomenclator.stats()
     }
 
 
@@ -7,6 +7,10 @@ from datetime import datetime, time
 from enum import Enum
 
 
+# Días válidos en `dias_disponibles`, en orden (lunes = 0)
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+
 # ============= RUTA =============
 
 class RutaBase(BaseModel):
@@ -16,15 +20,19 @@ class RutaBase(BaseModel):
     hora_salida: str = Field(..., pattern=r'^\d{2}:\d{2}:\d{2}$')  # Formato HH:MM:SS
     dias_disponibles: str = Field(..., max_length=100)  # Ej: "Lunes,Martes,Viernes"
     capacidad_ruta: int = Field(..., ge=1, le=8)
+    # Coordenadas opcionales; sin ellas la ruta no aparece en /buscar
+    lat_inicio: Optional[float] = Field(None, ge=-90, le=90)
+    lon_inicio: Optional[float] = Field(None, ge=-180, le=180)
+    lat_destino: Optional[float] = Field(None, ge=-90, le=90)
+    lon_destino: Optional[float] = Field(None, ge=-180, le=180)
     
     @validator('dias_disponibles')
     def validate_dias(cls, v):
         """Validar formato de días disponibles"""
-        dias_validos = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
         dias = [d.strip() for d in v.split(',')]
         for dia in dias:
-            if dia not in dias_validos:
-                raise ValueError(f'Día inválido: {dia}. Días válidos: {", ".join(dias_validos)}')
+            if dia not in DIAS_SEMANA:
+                raise ValueError(f'Día inválido: {dia}. Días válidos: {", ".join(DIAS_SEMANA)}')
         return v
 
 
@@ -40,6 +48,10 @@ class RutaUpdate(BaseModel):
     hora_salida: Optional[str] = Field(None, pattern=r'^\d{2}:\d{2}:\d{2}$')
     dias_disponibles: Optional[str] = Field(None, max_length=100)
     capacidad_ruta: Optional[int] = Field(None, ge=1, le=8)
+    lat_inicio: Optional[float] = Field(None, ge=-90, le=90)
+    lon_inicio: Optional[float] = Field(None, ge=-180, le=180)
+    lat_destino: Optional[float] = Field(None, ge=-90, le=90)
+    lon_destino: Optional[float] = Field(None, ge=-180, le=180)
     activa: Optional[bool] = None
 
 
@@ -59,6 +71,13 @@ class Ruta(RutaBase):
         from_attributes = True
 
 
+class RutaCercana(Ruta):
+    """Ruta encontrada por cercanía al origen y destino del pasajero"""
+    distancia_origen_m: int
+    distancia_destino_m: int
+    desvio_m: int
+
+
 # ============= PARADA =============
 
 class ParadaBase(BaseModel):
@@ -66,6 +85,8 @@ class ParadaBase(BaseModel):
     orden_parada: int = Field(..., ge=1)
     ubicacion_parada: str = Field(..., min_length=3, max_length=200)
     id_ruta: str
+    latitud: Optional[float] = Field(None, ge=-90, le=90)
+    longitud: Optional[float] = Field(None, ge=-180, le=180)
 
 
 class ParadaCreate(ParadaBase):
@@ -77,6 +98,8 @@ class ParadaUpdate(BaseModel):
     """Modelo para actualizar una parada"""
     orden_parada: Optional[int] = Field(None, ge=1)
     ubicacion_parada: Optional[str] = Field(None, min_length=3, max_length=200)
+    latitud: Optional[float] = Field(None, ge=-90, le=90)
+    longitud: Optional[float] = Field(None, ge=-180, le=180)
 
 
 class Parada(ParadaBase):
@@ -101,12 +124,18 @@ class PasajeroRutaBase(BaseModel):
     """Modelo base de pasajero en ruta"""
     id_ruta: str
     estado: EstadoPasajeroEnum = EstadoPasajeroEnum.PENDIENTE
+    ubicacion_recogida: Optional[str] = Field(None, max_length=200)
+    lat_recogida: Optional[float] = Field(None, ge=-90, le=90)
+    lon_recogida: Optional[float] = Field(None, ge=-180, le=180)
 
 
 class PasajeroRutaCreate(BaseModel):
     """Modelo para postular como pasajero"""
     id_ruta: str
     estado: EstadoPasajeroEnum = EstadoPasajeroEnum.PENDIENTE
+    ubicacion_recogida: Optional[str] = Field(None, max_length=200)
+    lat_recogida: Optional[float] = Field(None, ge=-90, le=90)
+    lon_recogida: Optional[float] = Field(None, ge=-180, le=180)
 
 
 class PasajeroRutaUpdate(BaseModel):
@@ -44,6 +44,7 @@ class Conversacion(ConversacionBase):
     fecha_creacion: datetime
     participantes: Optional[List[dict]] = []  # Lista de usuarios participantes
     ultimo_mensaje: Optional[dict] = None  # Último mensaje de la conversación
+    fecha_ultimo_mensaje: Optional[datetime] = None  # Última actividad, para ordenar la bandeja
     mensajes_no_leidos: Optional[int] = 0
 
     class Config:
@@ -16,6 +16,7 @@ class TipoNotificacionEnum(str, Enum):
     SOLICITUD_AMISTAD = "solicitud_amistad"
     AMISTAD_ACEPTADA = "amistad_aceptada"
     SOLICITUD_RUTA = "solicitud_ruta"
+    RESPUESTA_RUTA = "respuesta_ruta"
     MENSAJE = "mensaje"
     NOTA_NUEVA = "nota_nueva"
     OTRO = "otro"
@@ -44,6 +44,7 @@ class Publicacion(PublicacionBase):
     media: Optional[List[dict]] = []  # Lista de archivos multimedia
     comentarios_count: Optional[int] = 0
     reacciones_count: Optional[int] = 0
+    reacciones_por_tipo: Optional[dict] = {}  # Ej: {"like": 3, "love": 1}
     mis_reacciones: Optional[List[str]] = []  # Reacciones del usuario actual
 
     class Config:
@@ -104,6 +105,10 @@ class MediaCreate(MediaBase):
 class Media(MediaBase):
     """Modelo de media para respuestas"""
     id_media: str
+    variantes: Optional[dict] = None  # URLs WebP por tamaño (thumb, card, full)
+    placeholder: Optional[str] = None  # Imagen diminuta en base64 para mostrar mientras carga
+    ancho: Optional[int] = None
+    alto: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -0,0 +1,40 @@
+"""
+Modelos para subidas directas a Storage
+"""
+from pydantic import BaseModel, Field
+
+
+class SubidaFirmadaCreate(BaseModel):
+    """Solicitud de una URL firmada para subir un archivo directamente a Storage"""
+    filename: str = Field(..., min_length=1, max_length=255)
+    content_type: str
+    size: int = Field(..., gt=0)
+
+
+class SubidaFirmada(BaseModel):
+    """URL firmada y token para completar la subida"""
+    signed_url: str
+    path: str
+    token: str
+    expira_en: int  # segundos
+
+
+class SubidaCompletar(BaseModel):
+    """Confirmación de una subida directa"""
+    token: str
+
+
+class SesionReanudableCreate(BaseModel):
+    """Inicio de una subida reanudable por partes"""
+    filename: str = Field(..., min_length=1, max_length=255)
+    content_type: str
+    size: int = Field(..., gt=0)
+
+
+class SesionReanudable(BaseModel):
+    """Estado de una subida reanudable"""
+    id_sesion: str
+    offset: int  # bytes recibidos
+    size: int
+    tam_bloque: int  # tamaño sugerido de cada bloque
+    expira: str
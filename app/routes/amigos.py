@@ -1,13 +1,18 @@
 """
 Rutas para gestión de amigos y solicitudes de amistad
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from supabase import Client
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from supabase import AsyncClient
 from typing import List
 from datetime import datetime
 
 from app.database import get_db
 from app.utils.dependencies import get_current_active_user
+from app.utils.loaders import UserLoader, get_user_loader, CAMPOS_USUARIO_PUBLICO
+from app.utils.outbox import outbox
+from app.utils.busqueda import indice_usuarios
+from app.utils.grafo_amigos import grafo_amigos
+from app.utils.companeros import companeros
 from app.models.relacion import (
     RelacionUsuario,
     RelacionUsuarioCreate,
@@ -21,7 +26,7 @@ router = APIRouter(prefix="/amigos", tags=["amigos"])
 @router.post("/solicitud", response_model=RelacionUsuario)
 async def enviar_solicitud_amistad(
     id_usuario_destino: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Enviar solicitud de amistad a otro usuario"""
@@ -34,7 +39,7 @@ async def enviar_solicitud_amistad(
             )
         
         # Verificar si ya existe una relación
-        existing = db.table("relacionusuario")\
+        existing = await db.table("relacionusuario")\
             .select("*")\
             .or_(
                 f"and(id_usuario1.eq.{current_user['id_user']},id_usuario2.eq.{id_usuario_destino}),"
@@ -57,29 +62,23 @@ async def enviar_solicitud_amistad(
             "fecha_solicitud": datetime.utcnow().isoformat()
         }
         
-        response = db.table("relacionusuario").insert(nueva_solicitud).execute()
+        response = await db.table("relacionusuario").insert(nueva_solicitud).execute()
         
         if not response.data:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error al crear la solicitud"
             )
+        grafo_amigos.registrar(response.data[0])
         
         # Crear notificación para el destinatario
-        try:
-            # Obtener el nombre completo del usuario
-            nombre_completo = f"{current_user.get('nombre', '')} {current_user.get('apellido', '')}".strip() or 'Un usuario'
-            notificacion = {
-                "id_user": id_usuario_destino,
-                "contenido": f"{nombre_completo} te envió una solicitud de amistad",
-                "tipo": "solicitud_amistad",
-                "leida": False,
-                "fecha_envio": datetime.utcnow().isoformat(),
-                "id_referencia": response.data[0].get('id_relacion_usuario')
-            }
-            db.table("notificacion").insert(notificacion).execute()
-        except Exception as e:
-            print(f"Error al crear notificación: {e}")
+        nombre_completo = f"{current_user.get('nombre', '')} {current_user.get('apellido', '')}".strip() or 'Un usuario'
+        outbox.encolar(
+            id_usuario_destino,
+            f"{nombre_completo} te envió una solicitud de amistad",
+            "solicitud_amistad",
+            id_referencia=response.data[0].get('id_relacion_usuario')
+        )
         
         return response.data[0]
     
@@ -94,28 +93,29 @@ async def enviar_solicitud_amistad(
 
 @router.get("/solicitudes-recibidas", response_model=List[RelacionUsuario])
 async def obtener_solicitudes_recibidas(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
+    loader: UserLoader = Depends(get_user_loader),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener solicitudes de amistad recibidas pendientes"""
     try:
-        response = db.table("relacionusuario")\
+        response = await db.table("relacionusuario")\
             .select("*")\
             .eq("id_usuario2", current_user["id_user"])\
             .eq("estado", "pendiente")\
             .eq("tipo", "amistad")\
             .execute()
         
-        # Obtener datos de los usuarios que enviaron las solicitudes
+        # Obtener datos de los usuarios que enviaron las solicitudes (una sola consulta)
+        usuarios = await loader.load_many(
+            [rel["id_usuario1"] for rel in response.data],
+            campos=CAMPOS_USUARIO_PUBLICO
+        )
+        
         solicitudes = []
         for rel in response.data:
-            usuario = db.table("usuario")\
-                .select("id_user, nombre, apellido, correo, rol, foto_perfil")\
-                .eq("id_user", rel["id_usuario1"])\
-                .execute()
-            
-            if usuario.data:
-                rel["usuario1"] = usuario.data[0]
+            if rel["id_usuario1"] in usuarios:
+                rel["usuario1"] = usuarios[rel["id_usuario1"]]
                 solicitudes.append(rel)
         
         return solicitudes
@@ -129,28 +129,29 @@ async def obtener_solicitudes_recibidas(
 
 @router.get("/solicitudes-enviadas", response_model=List[RelacionUsuario])
 async def obtener_solicitudes_enviadas(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
+    loader: UserLoader = Depends(get_user_loader),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener solicitudes de amistad enviadas pendientes"""
     try:
-        response = db.table("relacionusuario")\
+        response = await db.table("relacionusuario")\
             .select("*")\
             .eq("id_usuario1", current_user["id_user"])\
             .eq("estado", "pendiente")\
             .eq("tipo", "amistad")\
             .execute()
         
-        # Obtener datos de los usuarios a quienes se enviaron las solicitudes
+        # Obtener datos de los usuarios a quienes se enviaron las solicitudes (una sola consulta)
+        usuarios = await loader.load_many(
+            [rel["id_usuario2"] for rel in response.data],
+            campos=CAMPOS_USUARIO_PUBLICO
+        )
+        
         solicitudes = []
         for rel in response.data:
-            usuario = db.table("usuario")\
-                .select("id_user, nombre, apellido, correo, rol, foto_perfil")\
-                .eq("id_user", rel["id_usuario2"])\
-                .execute()
-            
-            if usuario.data:
-                rel["usuario2"] = usuario.data[0]
+            if rel["id_usuario2"] in usuarios:
+                rel["usuario2"] = usuarios[rel["id_usuario2"]]
                 solicitudes.append(rel)
         
         return solicitudes
@@ -171,13 +172,13 @@ async def obtener_solicitudes_enviadas(
 async def responder_solicitud(
     id_relacion: str,
     accion: str,  # "aceptar" o "rechazar"
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Aceptar o rechazar una solicitud de amistad"""
     try:
         # Verificar que la solicitud existe y es para el usuario actual
-        solicitud = db.table("relacionusuario")\
+        solicitud = await db.table("relacionusuario")\
             .select("*")\
             .eq("id_relacion_usuario", id_relacion)\
             .eq("id_usuario2", current_user["id_user"])\
@@ -193,30 +194,24 @@ async def responder_solicitud(
         # Actualizar estado
         nuevo_estado = "aceptado" if accion == "aceptar" else "rechazado"
         
-        response = db.table("relacionusuario")\
+        response = await db.table("relacionusuario")\
             .update({
                 "estado": nuevo_estado,
                 "fecha_respuesta": datetime.utcnow().isoformat()
             })\
             .eq("id_relacion_usuario", id_relacion)\
             .execute()
+        grafo_amigos.registrar(response.data[0])
         
         # Crear notificación si se aceptó
         if accion == "aceptar":
-            try:
-                # Obtener el nombre completo del usuario
-                nombre_completo = f"{current_user.get('nombre', '')} {current_user.get('apellido', '')}".strip() or 'Un usuario'
-                notificacion = {
-                    "id_user": solicitud.data[0]['id_usuario1'],
-                    "contenido": f"{nombre_completo} aceptó tu solicitud de amistad",
-                    "tipo": "amistad_aceptada",
-                    "leida": False,
-                    "fecha_envio": datetime.utcnow().isoformat(),
-                    "id_referencia": id_relacion
-                }
-                db.table("notificacion").insert(notificacion).execute()
-            except Exception as e:
-                print(f"Error al crear notificación: {e}")
+            nombre_completo = f"{current_user.get('nombre', '')} {current_user.get('apellido', '')}".strip() or 'Un usuario'
+            outbox.encolar(
+                solicitud.data[0]['id_usuario1'],
+                f"{nombre_completo} aceptó tu solicitud de amistad",
+                "amistad_aceptada",
+                id_referencia=id_relacion
+            )
         
         return response.data[0]
     
@@ -231,7 +226,8 @@ async def responder_solicitud(
 
 @router.get("/lista", response_model=List[dict])
 async def obtener_amigos(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
+    loader: UserLoader = Depends(get_user_loader),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener lista de amigos aceptados"""
@@ -239,7 +235,7 @@ async def obtener_amigos(
         print(f"Obteniendo amigos para usuario: {current_user['id_user']}")
         
         # Obtener relaciones donde el usuario es usuario1
-        amigos1 = db.table("relacionusuario")\
+        amigos1 = await db.table("relacionusuario")\
             .select("*")\
             .eq("id_usuario1", current_user["id_user"])\
             .eq("estado", "aceptado")\
@@ -249,7 +245,7 @@ async def obtener_amigos(
         print(f"Amigos1 encontrados: {len(amigos1.data)}")
         
         # Obtener relaciones donde el usuario es usuario2
-        amigos2 = db.table("relacionusuario")\
+        amigos2 = await db.table("relacionusuario")\
             .select("*")\
             .eq("id_usuario2", current_user["id_user"])\
             .eq("estado", "aceptado")\
@@ -258,36 +254,18 @@ async def obtener_amigos(
         
         print(f"Amigos2 encontrados: {len(amigos2.data)}")
         
-        # Combinar y formatear resultados
-        amigos = []
+        # Combinar relaciones como (relación, id del amigo)
+        relaciones = [(rel, rel["id_usuario2"]) for rel in amigos1.data]
+        relaciones += [(rel, rel["id_usuario1"]) for rel in amigos2.data]
         
-        for relacion in amigos1.data:
-            usuario = db.table("usuario")\
-                .select("id_user, nombre, apellido, correo, rol, foto_perfil")\
-                .eq("id_user", relacion["id_usuario2"])\
-                .execute()
-            
-            if usuario.data:
-                amigo = usuario.data[0]
-                amigos.append({
-                    "id_relacion": relacion['id_relacion_usuario'],
-                    "id_user": amigo['id_user'],
-                    "nombre": amigo['nombre'],
-                    "apellido": amigo.get('apellido', ''),
-                    "correo": amigo.get('correo', ''),
-                    "rol": amigo.get('rol', ''),
-                    "foto_perfil": amigo.get('foto_perfil'),
-                    "fecha_amistad": relacion.get('fecha_respuesta')
-                })
+        # Obtener datos de todos los amigos en una sola consulta
+        usuarios = await loader.load_many([id_amigo for _, id_amigo in relaciones])
         
-        for relacion in amigos2.data:
-            usuario = db.table("usuario")\
-                .select("id_user, nombre, apellido, correo, rol, foto_perfil")\
-                .eq("id_user", relacion["id_usuario1"])\
-                .execute()
-            
-            if usuario.data:
-                amigo = usuario.data[0]
+        # Formatear resultados
+        amigos = []
+        for relacion, id_amigo in relaciones:
+            amigo = usuarios.get(id_amigo)
+            if amigo:
                 amigos.append({
                     "id_relacion": relacion['id_relacion_usuario'],
                     "id_user": amigo['id_user'],
@@ -315,13 +293,13 @@ async def obtener_amigos(
 @router.delete("/eliminar/{id_relacion}")
 async def eliminar_amigo(
     id_relacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar un amigo"""
     try:
         # Verificar que la relación existe y pertenece al usuario
-        relacion = db.table("relacionusuario")\
+        relacion = await db.table("relacionusuario")\
             .select("*")\
             .eq("id_relacion_usuario", id_relacion)\
             .or_(f"id_usuario1.eq.{current_user['id_user']},id_usuario2.eq.{current_user['id_user']}")\
@@ -334,10 +312,11 @@ async def eliminar_amigo(
             )
         
         # Eliminar relación
-        db.table("relacionusuario")\
+        await db.table("relacionusuario")\
             .delete()\
             .eq("id_relacion_usuario", id_relacion)\
             .execute()
+        grafo_amigos.eliminar(relacion.data[0])
         
         return {"message": "Amigo eliminado exitosamente"}
     
@@ -353,41 +332,54 @@ async def eliminar_amigo(
 @router.get("/buscar")
 async def buscar_usuarios(
     q: str,
-    db: Client = Depends(get_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Buscar usuarios por nombre, apellido o correo"""
+    """Buscar usuarios por nombre, apellido o correo (ordenados por relevancia)"""
     try:
-        print(f"Buscando usuarios con query: {q}")
-        print(f"Usuario actual: {current_user['id_user']}")
-        
-        # Buscar usuarios - usar ilike con porcentajes en el valor
-        usuarios = db.table("usuario")\
-            .select("id_user, nombre, apellido, correo, rol, foto_perfil")\
-            .neq("id_user", current_user["id_user"])\
-            .or_(f"nombre.ilike.*{q}*,apellido.ilike.*{q}*,correo.ilike.*{q}*")\
-            .limit(20)\
-            .execute()
-        
-        print(f"Usuarios encontrados: {len(usuarios.data)}")
+        if indice_usuarios.cargado:
+            encontrados = [
+                {campo: u.get(campo) for campo in CAMPOS_USUARIO_PUBLICO}
+                for u in indice_usuarios.buscar(q, skip=skip, limit=limit, excluir=[current_user["id_user"]])
+            ]
+        else:
+            # Buscar usuarios - usar ilike con porcentajes en el valor
+            usuarios = await db.table("usuario")\
+                .select("id_user, nombre, apellido, correo, rol, foto_perfil")\
+                .neq("id_user", current_user["id_user"])\
+                .or_(f"nombre.ilike.*{q}*,apellido.ilike.*{q}*,correo.ilike.*{q}*")\
+                .range(skip, skip + limit - 1)\
+                .execute()
+            encontrados = usuarios.data
         
-        # Obtener todas las relaciones del usuario actual
-        relaciones = db.table("relacionusuario")\
-            .select("id_usuario1, id_usuario2, estado")\
-            .or_(f"id_usuario1.eq.{current_user['id_user']},id_usuario2.eq.{current_user['id_user']}")\
-            .execute()
+        if not encontrados:
+            return []
         
         # Crear un mapa de estados de relación
         estados_relacion = {}
-        for rel in relaciones.data:
-            if rel['id_usuario1'] == current_user['id_user']:
-                estados_relacion[rel['id_usuario2']] = rel['estado']
-            else:
-                estados_relacion[rel['id_usuario1']] = rel['estado']
+        if grafo_amigos.cargado:
+            for usuario in encontrados:
+                relacion = grafo_amigos.estado(current_user["id_user"], usuario["id_user"])
+                if relacion:
+                    estados_relacion[usuario["id_user"]] = relacion["estado"]
+        else:
+            # Obtener todas las relaciones del usuario actual
+            relaciones = await db.table("relacionusuario")\
+                .select("id_usuario1, id_usuario2, estado")\
+                .or_(f"id_usuario1.eq.{current_user['id_user']},id_usuario2.eq.{current_user['id_user']}")\
+                .execute()
+            
+            for rel in relaciones.data:
+                if rel['id_usuario1'] == current_user['id_user']:
+                    estados_relacion[rel['id_usuario2']] = rel['estado']
+                else:
+                    estados_relacion[rel['id_usuario1']] = rel['estado']
         
         # Agregar estado de relación a cada usuario
         resultado = []
-        for usuario in usuarios.data:
+        for usuario in encontrados:
             usuario_con_estado = dict(usuario)
             usuario_con_estado['estadoRelacion'] = estados_relacion.get(usuario['id_user'])
             resultado.append(usuario_con_estado)
@@ -402,3 +394,100 @@ async def buscar_usuarios(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
+
+
+@router.get("/en-comun/{id_user}")
+async def obtener_amigos_en_comun(
+    id_user: str,
+    db: AsyncClient = Depends(get_db),
+    loader: UserLoader = Depends(get_user_loader),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Amigos que el usuario actual comparte con otro usuario"""
+    try:
+        await grafo_amigos.asegurar_cargado(db)
+        ids = grafo_amigos.en_comun(current_user["id_user"], id_user)
+        usuarios = await loader.load_many(ids, campos=CAMPOS_USUARIO_PUBLICO)
+        amigos = [usuarios[i] for i in ids if i in usuarios]
+        return {"amigos": amigos, "total": len(amigos)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.get("/sugerencias")
+async def obtener_sugerencias(
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncClient = Depends(get_db),
+    loader: UserLoader = Depends(get_user_loader),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Personas que quizás conozcas: amigos de amigos ordenados por amigos en común"""
+    try:
+        await grafo_amigos.asegurar_cargado(db)
+        sugeridos = grafo_amigos.sugerencias(current_user["id_user"], limit=limit)
+        usuarios = await loader.load_many([i for i, _ in sugeridos], campos=CAMPOS_USUARIO_PUBLICO)
+        return [
+            {**usuarios[i], "amigos_en_comun": n}
+            for i, n in sugeridos
+            if i in usuarios
+        ]
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.get("/companeros")
+async def obtener_companeros_sugeridos(
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncClient = Depends(get_db),
+    loader: UserLoader = Depends(get_user_loader),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Compañeros sugeridos: estudiantes del mismo grupo o que comparten
+    materias, ordenados por grupo, materias y amigos en común
+    """
+    try:
+        await companeros.asegurar_cargado(db)
+        await grafo_amigos.asegurar_cargado(db)
+        sugeridos = companeros.sugerencias(current_user["id_user"], grafo_amigos, limit=limit)
+        usuarios = await loader.load_many([s["id_user"] for s in sugeridos], campos=CAMPOS_USUARIO_PUBLICO)
+        return [
+            {**usuarios[s["id_user"]], **s}
+            for s in sugeridos
+            if s["id_user"] in usuarios
+        ]
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.get("/estado/{id_user}")
+async def obtener_estado_relacion(
+    id_user: str,
+    db: AsyncClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Estado de la relación del usuario actual con otro usuario"""
+    try:
+        await grafo_amigos.asegurar_cargado(db)
+        relacion = grafo_amigos.estado(current_user["id_user"], id_user)
+        if relacion is None:
+            return {"estado": None, "id_relacion": None, "enviada_por_mi": None}
+        return {
+            "estado": relacion["estado"],
+            "id_relacion": relacion["id_relacion_usuario"],
+            "enviada_por_mi": relacion["id_usuario1"] == current_user["id_user"]
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
@@ -6,7 +6,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
 from datetime import timedelta
 from typing import Optional
-from supabase import Client
+from supabase import AsyncClient
 
 from app.database import get_db
 from app.config import settings
@@ -18,6 +18,7 @@ from app.utils.security import (
     verify_token
 )
 from app.utils.dependencies import get_current_user
+from app.utils.busqueda import indice_usuarios
 from app.models.usuario import UsuarioCreate, Usuario, RolEnum
 
 router = APIRouter(prefix="/auth")
@@ -39,14 +40,14 @@ class RefreshTokenRequest(BaseModel):
 @router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     user_data: UsuarioCreate,
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     """
     Registrar un nuevo usuario
     """
     try:
         # Verificar si el correo ya existe
-        existing = db.table("usuario").select("id_user").eq("correo", user_data.correo).execute()
+        existing = await db.table("usuario").select("id_user").eq("correo", user_data.correo).execute()
         
         if existing.data:
             raise HTTPException(
@@ -67,7 +68,7 @@ async def register(
             "activo": True
         }
         
-        response = db.table("usuario").insert(user_dict).execute()
+        response = await db.table("usuario").insert(user_dict).execute()
         
         if not response.data:
             raise HTTPException(
@@ -76,6 +77,7 @@ async def register(
             )
         
         created_user = response.data[0]
+        indice_usuarios.actualizar(created_user)
         
         # 🔧 SINCRONIZACIÓN AUTOMÁTICA: Crear registro en estudiante/docente si corresponde
         try:
@@ -87,7 +89,7 @@ async def register(
                     "carrera": "Sin especificar",
                     "semestre": 1
                 }
-                db.table("estudiante").insert(estudiante_data).execute()
+                await db.table("estudiante").insert(estudiante_data).execute()
                 print(f"✅ Registro de estudiante creado automáticamente para {created_user['correo']}")
             
             elif created_user["rol"] == "docente":
@@ -97,7 +99,7 @@ async def register(
                     "id_user": created_user["id_user"],
                     "especialidad_doc": "Sin especificar"
                 }
-                db.table("docente").insert(docente_data).execute()
+                await db.table("docente").insert(docente_data).execute()
                 print(f"✅ Registro de docente creado automáticamente para {created_user['correo']}")
         except Exception as sync_error:
             # Log del error pero no fallar el registro
@@ -133,14 +135,14 @@ async def register(
 @router.post("/login", response_model=TokenResponse)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     """
     Iniciar sesión (username es el correo electrónico)
     """
     try:
         # Buscar usuario por correo
-        response = db.table("usuario").select("*").eq("correo", form_data.username).execute()
+        response = await db.table("usuario").select("*").eq("correo", form_data.username).execute()
         
         if not response.data:
             raise HTTPException(
@@ -196,7 +198,7 @@ async def login(
 @router.post("/refresh", response_model=TokenResponse)
 async def refresh_token(
     token_data: RefreshTokenRequest,
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     """
     Refrescar el access token usando el refresh token
@@ -214,7 +216,7 @@ async def refresh_token(
     
     # Obtener usuario
     try:
-        response = db.table("usuario").select("*").eq("id_user", user_id).execute()
+        response = await db.table("usuario").select("*").eq("id_user", user_id).execute()
         
         if not response.data:
             raise HTTPException(
@@ -260,7 +262,7 @@ async def refresh_token(
 
 @router.get("/me", response_model=Usuario)
 async def get_me(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -274,7 +276,7 @@ async def get_me(
 @router.post("/validate-token")
 async def validate_token(
     authorization: Optional[str] = Header(None),
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     """
     Valida un access token y retorna información sobre su estado.
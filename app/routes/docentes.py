@@ -1,14 +1,17 @@
 """
 Rutas para gestión de docentes
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from typing import List, Optional
-from supabase import Client
+from supabase import AsyncClient
 
 from app.database import get_db
 from app.models.usuario import Docente, DocenteCreate, DocenteUpdate
 from app.utils.dependencies import get_current_active_user, require_admin
+from app.utils.loaders import UserLoader, get_user_loader
 from app.utils.security import get_password_hash
+from app.utils.cache_http import catalogo_cache, DOCENTES, MATERIAS
+from app.utils.busqueda import indice_usuarios
 
 router = APIRouter(prefix="/docentes")
 
@@ -16,7 +19,7 @@ router = APIRouter(prefix="/docentes")
 @router.post("", response_model=Docente, status_code=status.HTTP_201_CREATED)
 async def create_docente(
     docente_data: DocenteCreate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """
@@ -24,7 +27,7 @@ async def create_docente(
     """
     try:
         # Verificar que el CI no existe
-        existing_ci = db.table("docente").select("ci_doc").eq("ci_doc", docente_data.ci_doc).execute()
+        existing_ci = await db.table("docente").select("ci_doc").eq("ci_doc", docente_data.ci_doc).execute()
         if existing_ci.data:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -32,7 +35,7 @@ async def create_docente(
             )
         
         # Verificar que el correo no existe
-        existing_email = db.table("usuario").select("id_user").eq("correo", docente_data.correo).execute()
+        existing_email = await db.table("usuario").select("id_user").eq("correo", docente_data.correo).execute()
         if existing_email.data:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -49,7 +52,7 @@ async def create_docente(
             "activo": True
         }
         
-        user_response = db.table("usuario").insert(user_dict).execute()
+        user_response = await db.table("usuario").insert(user_dict).execute()
         if not user_response.data:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -57,6 +60,7 @@ async def create_docente(
             )
         
         user = user_response.data[0]
+        indice_usuarios.actualizar(user)
         
         # Crear docente
         docente_dict = {
@@ -65,7 +69,7 @@ async def create_docente(
             "especialidad_doc": docente_data.especialidad_doc
         }
         
-        doc_response = db.table("docente").insert(docente_dict).execute()
+        doc_response = await db.table("docente").insert(docente_dict).execute()
         if not doc_response.data:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -75,6 +79,7 @@ async def create_docente(
         docente = doc_response.data[0]
         docente["usuario"] = {k: v for k, v in user.items() if k != "contrasena"}
         
+        catalogo_cache.invalidar(DOCENTES)
         return docente
         
     except HTTPException:
@@ -88,49 +93,51 @@ async def create_docente(
 
 @router.get("")
 async def get_docentes(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
     especialidad: Optional[str] = None,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
+    loader: UserLoader = Depends(get_user_loader),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
-    Obtener lista de docentes
+    Obtener lista de docentes (con ETag)
     """
     try:
-        # Obtener docentes
-        query = db.table("docente").select("*")
-        
-        if especialidad:
-            query = query.eq("especialidad_doc", especialidad)
-        
-        query = query.range(skip, skip + limit - 1)
-        docentes_response = query.execute()
-        
-        if not docentes_response.data:
-            return []
-        
-        # Obtener IDs de usuario únicos
-        user_ids = [doc["id_user"] for doc in docentes_response.data if doc.get("id_user")]
-        
-        if not user_ids:
-            return docentes_response.data
-        
-        # Obtener datos de usuarios
-        usuarios_response = db.table("usuario").select("*").in_("id_user", user_ids).execute()
-        
-        # Crear mapa de usuarios
-        usuarios_map = {u["id_user"]: {k: v for k, v in u.items() if k != "contrasena"} for u in usuarios_response.data}
-        
-        # Combinar datos
-        result = []
-        for doc in docentes_response.data:
-            docente = {**doc}
-            if doc.get("id_user") in usuarios_map:
-                docente["id_user"] = usuarios_map[doc["id_user"]]
-            result.append(docente)
+        async def cargar():
+            # Obtener docentes
+            query = db.table("docente").select("*")
+            
+            if especialidad:
+                query = query.eq("especialidad_doc", especialidad)
+            
+            query = query.range(skip, skip + limit - 1)
+            docentes_response = await query.execute()
+            
+            if not docentes_response.data:
+                return []
+            
+            # Obtener IDs de usuario únicos
+            user_ids = [doc["id_user"] for doc in docentes_response.data if doc.get("id_user")]
+            
+            if not user_ids:
+                return docentes_response.data
+            
+            # Obtener datos de usuarios (consulta única, sin contraseña)
+            usuarios_map = await loader.load_many(user_ids)
+            
+            # Combinar datos
+            result = []
+            for doc in docentes_response.data:
+                docente = {**doc}
+                if doc.get("id_user") in usuarios_map:
+                    docente["id_user"] = usuarios_map[doc["id_user"]]
+                result.append(docente)
+            
+            return result
         
-        return result
+        return await catalogo_cache.responder(request, DOCENTES, (skip, limit, especialidad), cargar)
         
     except Exception as e:
         raise HTTPException(
@@ -141,7 +148,7 @@ async def get_docentes(
 
 @router.get("/me", response_model=Docente)
 async def get_my_docente_data(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -155,7 +162,7 @@ async def get_my_docente_data(
     
     try:
         # Obtener docente
-        response = db.table("docente").select("*").eq("id_user", current_user["id_user"]).execute()
+        response = await db.table("docente").select("*").eq("id_user", current_user["id_user"]).execute()
         
         if not response.data:
             raise HTTPException(
@@ -166,7 +173,7 @@ async def get_my_docente_data(
         docente = response.data[0]
         
         # Obtener datos del usuario
-        user_response = db.table("usuario").select("*").eq("id_user", current_user["id_user"]).execute()
+        user_response = await db.table("usuario").select("*").eq("id_user", current_user["id_user"]).execute()
         if user_response.data:
             usuario_data = {k: v for k, v in user_response.data[0].items() if k != "contrasena"}
             docente["id_user"] = usuario_data
@@ -185,7 +192,7 @@ async def get_my_docente_data(
 @router.get("/{ci_doc}")
 async def get_docente(
     ci_doc: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -193,7 +200,7 @@ async def get_docente(
     """
     try:
         # Obtener el docente
-        docente_response = db.table("docente").select("*").eq("ci_doc", ci_doc).execute()
+        docente_response = await db.table("docente").select("*").eq("ci_doc", ci_doc).execute()
         
         if not docente_response.data:
             raise HTTPException(
@@ -204,7 +211,7 @@ async def get_docente(
         docente = docente_response.data[0]
         
         # Obtener los datos del usuario asociado
-        user_response = db.table("usuario").select("*").eq("id_user", docente["id_user"]).execute()
+        user_response = await db.table("usuario").select("*").eq("id_user", docente["id_user"]).execute()
         
         if not user_response.data:
             raise HTTPException(
@@ -236,7 +243,7 @@ async def get_docente(
 async def update_docente(
     ci_doc: str,
     docente_data: DocenteUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -244,7 +251,7 @@ async def update_docente(
     """
     try:
         # 1. Verificar que el docente existe
-        doc_response = db.table("docente").select("*").eq("ci_doc", ci_doc).execute()
+        doc_response = await db.table("docente").select("*").eq("ci_doc", ci_doc).execute()
         if not doc_response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -266,16 +273,18 @@ async def update_docente(
             update_data["especialidad_doc"] = docente_data.especialidad_doc
             
         if update_data:
-            update_response = db.table("docente").update(update_data).eq("ci_doc", ci_doc).execute()
+            update_response = await db.table("docente").update(update_data).eq("ci_doc", ci_doc).execute()
             if not update_response.data:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="Error al actualizar docente"
                 )
             docente = update_response.data[0]
+            # Las materias incluyen los datos de su docente
+            catalogo_cache.invalidar(DOCENTES, MATERIAS)
         
         # 4. Obtener datos del usuario asociado
-        user_response = db.table("usuario").select("*").eq("id_user", docente["id_user"]).execute()
+        user_response = await db.table("usuario").select("*").eq("id_user", docente["id_user"]).execute()
         if not user_response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -293,7 +302,7 @@ async def update_docente(
         
         # Actualizar
         update_data = docente_data.dict(exclude_unset=True)
-        response = db.table("docente").update(update_data).eq("ci_doc", ci_doc).execute()
+        response = await db.table("docente").update(update_data).eq("ci_doc", ci_doc).execute()
         
         if not response.data:
             raise HTTPException(
@@ -3,12 +3,17 @@ Rutas para gestión de estudiantes
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from typing import List, Optional
-from supabase import Client
+from supabase import AsyncClient
 
 from app.database import get_db
 from app.models.usuario import Estudiante, EstudianteCreate, EstudianteUpdate, RolEnum
 from app.utils.dependencies import get_current_active_user, require_estudiante, require_admin
+from app.utils.loaders import UserLoader, get_user_loader
 from app.utils.security import get_password_hash
+from app.utils.cache_http import catalogo_cache, HORARIOS
+from app.utils.cache_horarios import horarios_cache
+from app.utils.busqueda import indice_usuarios
+from app.utils.companeros import companeros
 
 router = APIRouter(prefix="/estudiantes")
 
@@ -16,7 +21,7 @@ router = APIRouter(prefix="/estudiantes")
 @router.post("", response_model=Estudiante, status_code=status.HTTP_201_CREATED)
 async def create_estudiante(
     estudiante_data: EstudianteCreate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """
@@ -24,7 +29,7 @@ async def create_estudiante(
     """
     try:
         # Verificar que el CI no existe
-        existing_ci = db.table("estudiante").select("ci_est").eq("ci_est", estudiante_data.ci_est).execute()
+        existing_ci = await db.table("estudiante").select("ci_est").eq("ci_est", estudiante_data.ci_est).execute()
         if existing_ci.data:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -32,7 +37,7 @@ async def create_estudiante(
             )
         
         # Verificar que el correo no existe
-        existing_email = db.table("usuario").select("id_user").eq("correo", estudiante_data.correo).execute()
+        existing_email = await db.table("usuario").select("id_user").eq("correo", estudiante_data.correo).execute()
         if existing_email.data:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -49,12 +54,13 @@ async def create_estudiante(
             "activo": True
         }
         
-        user_response = db.table("usuario").insert(user_dict).execute()
+        user_response = await db.table("usuario").insert(user_dict).execute()
         if not user_response.data:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error al crear usuario"
             )
+        indice_usuarios.actualizar(user_response.data[0])
         
         user = user_response.data[0]
         
@@ -67,7 +73,7 @@ async def create_estudiante(
             "id_grupo": estudiante_data.id_grupo
         }
         
-        est_response = db.table("estudiante").insert(estudiante_dict).execute()
+        est_response = await db.table("estudiante").insert(estudiante_dict).execute()
         if not est_response.data:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -75,6 +81,7 @@ async def create_estudiante(
             )
         
         estudiante = est_response.data[0]
+        companeros.actualizar_estudiante(estudiante)
         estudiante["usuario"] = {k: v for k, v in user.items() if k != "contrasena"}
         
         return estudiante
@@ -94,7 +101,8 @@ async def get_estudiantes(
     limit: int = Query(100, ge=1, le=100),
     carrera: Optional[str] = None,
     semestre: Optional[int] = None,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
+    loader: UserLoader = Depends(get_user_loader),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -110,7 +118,7 @@ async def get_estudiantes(
             query = query.eq("semestre", semestre)
         
         query = query.range(skip, skip + limit - 1)
-        estudiantes_response = query.execute()
+        estudiantes_response = await query.execute()
         
         if not estudiantes_response.data:
             return []
@@ -121,11 +129,8 @@ async def get_estudiantes(
         if not user_ids:
             return estudiantes_response.data
         
-        # Obtener datos de usuarios
-        usuarios_response = db.table("usuario").select("*").in_("id_user", user_ids).execute()
-        
-        # Crear mapa de usuarios
-        usuarios_map = {u["id_user"]: {k: v for k, v in u.items() if k != "contrasena"} for u in usuarios_response.data}
+        # Obtener datos de usuarios (consulta única, sin contraseña)
+        usuarios_map = await loader.load_many(user_ids)
         
         # Combinar datos
         result = []
@@ -146,7 +151,7 @@ async def get_estudiantes(
 
 @router.get("/me", response_model=Estudiante)
 async def get_my_estudiante_data(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -160,7 +165,7 @@ async def get_my_estudiante_data(
     
     try:
         # Obtener estudiante
-        response = db.table("estudiante").select("*").eq("id_user", current_user["id_user"]).execute()
+        response = await db.table("estudiante").select("*").eq("id_user", current_user["id_user"]).execute()
         
         if not response.data:
             raise HTTPException(
@@ -171,7 +176,7 @@ async def get_my_estudiante_data(
         estudiante = response.data[0]
         
         # Obtener datos del usuario
-        user_response = db.table("usuario").select("*").eq("id_user", current_user["id_user"]).execute()
+        user_response = await db.table("usuario").select("*").eq("id_user", current_user["id_user"]).execute()
         if user_response.data:
             usuario_data = {k: v for k, v in user_response.data[0].items() if k != "contrasena"}
             estudiante["id_user"] = usuario_data
@@ -190,7 +195,7 @@ async def get_my_estudiante_data(
 @router.get("/{ci_est}", response_model=Estudiante)
 async def get_estudiante(
     ci_est: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -198,7 +203,7 @@ async def get_estudiante(
     """
     try:
         # Obtener estudiante
-        response = db.table("estudiante").select("*").eq("ci_est", ci_est).execute()
+        response = await db.table("estudiante").select("*").eq("ci_est", ci_est).execute()
         
         if not response.data:
             raise HTTPException(
@@ -210,7 +215,7 @@ async def get_estudiante(
         
         # Obtener datos del usuario
         if estudiante.get("id_user"):
-            user_response = db.table("usuario").select("*").eq("id_user", estudiante["id_user"]).execute()
+            user_response = await db.table("usuario").select("*").eq("id_user", estudiante["id_user"]).execute()
             if user_response.data:
                 usuario_data = {k: v for k, v in user_response.data[0].items() if k != "contrasena"}
                 estudiante["id_user"] = usuario_data
@@ -230,7 +235,7 @@ async def get_estudiante(
 async def update_estudiante(
     ci_est: str,
     estudiante_data: EstudianteUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -238,7 +243,7 @@ async def update_estudiante(
     """
     try:
         # Verificar que existe
-        existing = db.table("estudiante").select("*").eq("ci_est", ci_est).execute()
+        existing = await db.table("estudiante").select("*").eq("ci_est", ci_est).execute()
         if not existing.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -256,13 +261,14 @@ async def update_estudiante(
         
         # Actualizar
         update_data = estudiante_data.dict(exclude_unset=True)
-        response = db.table("estudiante").update(update_data).eq("ci_est", ci_est).execute()
+        response = await db.table("estudiante").update(update_data).eq("ci_est", ci_est).execute()
         
         if not response.data:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error al actualizar estudiante"
             )
+        companeros.actualizar_estudiante(response.data[0])
         
         return response.data[0]
         
@@ -278,7 +284,7 @@ async def update_estudiante(
 @router.post("/materias", status_code=status.HTTP_201_CREATED)
 async def asignar_materia_estudiante(
     asignacion: dict,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """
@@ -296,7 +302,7 @@ async def asignar_materia_estudiante(
             )
         
         # Verificar que el estudiante existe y obtener su grupo
-        estudiante = db.table("estudiante").select("ci_est, id_grupo").eq("ci_est", ci_estudiante).execute()
+        estudiante = await db.table("estudiante").select("ci_est, id_grupo").eq("ci_est", ci_estudiante).execute()
         if not estudiante.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -311,7 +317,7 @@ async def asignar_materia_estudiante(
             )
         
         # Verificar que la materia existe
-        materia = db.table("materia").select("id_materia").eq("id_materia", id_materia).execute()
+        materia = await db.table("materia").select("id_materia").eq("id_materia", id_materia).execute()
         if not materia.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -319,7 +325,7 @@ async def asignar_materia_estudiante(
             )
         
         # Verificar si la materia ya está asignada al grupo
-        existing = db.table("grupomateria")\
+        existing = await db.table("grupomateria")\
             .select("*")\
             .eq("id_grupo", id_grupo)\
             .eq("id_materia", id_materia)\
@@ -338,7 +344,7 @@ async def asignar_materia_estudiante(
             "origen": "MANUAL"
         }
         
-        response = db.table("grupomateria").insert(asignacion_data).execute()
+        response = await db.table("grupomateria").insert(asignacion_data).execute()
         
         if not response.data:
             raise HTTPException(
@@ -346,6 +352,11 @@ async def asignar_materia_estudiante(
                 detail="Error al asignar materia al grupo"
             )
         
+        # Los horarios del grupo listan sus materias
+        horarios_cache.invalidar(id_grupo)
+        catalogo_cache.invalidar(HORARIOS)
+        companeros.agregar_materia(response.data[0])
+        
         return {
             "message": f"Materia asignada exitosamente al grupo del estudiante",
             "data": response.data[0]
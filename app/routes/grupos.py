@@ -1,13 +1,14 @@
 """
 Rutas para gestión de grupos
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from typing import List
-from supabase import Client
+from supabase import AsyncClient
 
 from app.database import get_db
 from app.models.academico import Grupo, GrupoCreate, GrupoUpdate
 from app.utils.dependencies import get_current_active_user, require_admin
+from app.utils.cache_http import catalogo_cache, GRUPOS
 
 router = APIRouter(prefix="/grupos")
 
@@ -15,7 +16,7 @@ router = APIRouter(prefix="/grupos")
 @router.post("", response_model=Grupo, status_code=status.HTTP_201_CREATED)
 async def create_grupo(
     grupo_data: GrupoCreate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """Crear un nuevo grupo"""
@@ -24,7 +25,7 @@ async def create_grupo(
         data = grupo_data.dict(exclude_none=True)
         print(f"📝 Creando grupo: {data}")
         
-        response = db.table("grupo").insert(data).execute()
+        response = await db.table("grupo").insert(data).execute()
         
         if not response.data:
             raise HTTPException(
@@ -33,6 +34,7 @@ async def create_grupo(
             )
         
         print(f"✅ Grupo creado: {response.data[0]}")
+        catalogo_cache.invalidar(GRUPOS)
         return response.data[0]
     except HTTPException:
         raise
@@ -46,15 +48,19 @@ async def create_grupo(
 
 @router.get("", response_model=List[Grupo])
 async def get_grupos(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Obtener lista de grupos"""
+    """Obtener lista de grupos (con ETag)"""
     try:
-        response = db.table("grupo").select("*").range(skip, skip + limit - 1).execute()
-        return response.data
+        async def cargar():
+            response = await db.table("grupo").select("*").range(skip, skip + limit - 1).execute()
+            return response.data
+        
+        return await catalogo_cache.responder(request, GRUPOS, (skip, limit), cargar, List[Grupo])
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -62,12 +68,12 @@ async def get_grupos(
 @router.get("/{id_grupo}", response_model=Grupo)
 async def get_grupo(
     id_grupo: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener un grupo por ID"""
     try:
-        response = db.table("grupo").select("*").eq("id_grupo", id_grupo).execute()
+        response = await db.table("grupo").select("*").eq("id_grupo", id_grupo).execute()
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Grupo no encontrado")
         return response.data[0]
@@ -81,15 +87,16 @@ async def get_grupo(
 async def update_grupo(
     id_grupo: str,
     grupo_data: GrupoUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """Actualizar un grupo"""
     try:
         update_data = grupo_data.dict(exclude_unset=True)
-        response = db.table("grupo").update(update_data).eq("id_grupo", id_grupo).execute()
+        response = await db.table("grupo").update(update_data).eq("id_grupo", id_grupo).execute()
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Grupo no encontrado")
+        catalogo_cache.invalidar(GRUPOS)
         return response.data[0]
     except HTTPException:
         raise
@@ -1,27 +1,38 @@
 """
 Rutas para gestión de horarios
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from typing import List
 from datetime import datetime
-from supabase import Client
+from supabase import AsyncClient
 
 from app.database import get_db
 from app.models.academico import Horario, HorarioCreate, HorarioUpdate
 from app.utils.dependencies import get_current_active_user, require_docente_or_admin
+from app.utils.cache_http import catalogo_cache, HORARIOS
+from app.utils.cache_horarios import horarios_cache
 
 router = APIRouter(prefix="/horarios")
 
 
+def _invalidar_horarios(*id_grupos: str) -> None:
+    """Descarta los horarios cacheados de los grupos afectados por una escritura"""
+    for id_grupo in set(id_grupos):
+        if id_grupo:
+            horarios_cache.invalidar(id_grupo)
+    catalogo_cache.invalidar(HORARIOS)
+
+
 @router.post("", response_model=Horario, status_code=status.HTTP_201_CREATED)
 async def create_horario(
     horario_data: HorarioCreate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
     """Crear un nuevo horario"""
     try:
-        response = db.table("horario").insert(horario_data.dict()).execute()
+        response = await db.table("horario").insert(horario_data.dict()).execute()
+        _invalidar_horarios(horario_data.id_grupo)
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -29,7 +40,7 @@ async def create_horario(
 
 @router.get("/mi-horario", response_model=List[Horario])
 async def get_my_horario(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener horario del estudiante actual con información de materias"""
@@ -38,34 +49,14 @@ async def get_my_horario(
     
     try:
         # Obtener grupo del estudiante
-        est_response = db.table("estudiante").select("id_grupo").eq("id_user", current_user["id_user"]).execute()
+        est_response = await db.table("estudiante").select("id_grupo").eq("id_user", current_user["id_user"]).execute()
         if not est_response.data or not est_response.data[0].get("id_grupo"):
             return []
         
         id_grupo = est_response.data[0]["id_grupo"]
         
-        # Obtener horarios del grupo
-        response = db.table("horario").select("*").eq("id_grupo", id_grupo).order("dia_semana, hora_inicio").execute()
-        
-        # Obtener todas las materias del grupo con sus datos completos
-        materias_response = db.table("grupomateria").select("*, materia(*)").eq("id_grupo", id_grupo).execute()
-        materias_list = [gm["materia"] for gm in materias_response.data if gm.get("materia")]
-        
-        # Agregar información de materias a cada horario
-        horarios = []
-        for h in response.data:
-            horario = dict(h)
-            # Si hay materias, añadir la lista completa para que el frontend elija
-            if materias_list:
-                horario["materias"] = materias_list
-                # Por compatibilidad, también añadir la primera como "materia"
-                horario["materia"] = materias_list[0] if materias_list else None
-            else:
-                horario["materias"] = []
-                horario["materia"] = None
-            horarios.append(horario)
-        
-        return horarios
+        # Horario compartido por todos los estudiantes del grupo
+        return await horarios_cache.obtener(db, id_grupo)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -73,31 +64,16 @@ async def get_my_horario(
 @router.get("/grupo/{id_grupo}", response_model=List[Horario])
 async def get_horario_grupo(
     id_grupo: str,
-    db: Client = Depends(get_db),
+    request: Request,
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Obtener horarios de un grupo específico con información de materias"""
+    """Obtener horarios de un grupo específico con información de materias (con ETag)"""
     try:
-        # Obtener horarios del grupo
-        response = db.table("horario").select("*").eq("id_grupo", id_grupo).order("dia_semana, hora_inicio").execute()
-        
-        # Obtener todas las materias del grupo con sus datos completos
-        materias_response = db.table("grupomateria").select("*, materia(*)").eq("id_grupo", id_grupo).execute()
-        materias_list = [gm["materia"] for gm in materias_response.data if gm.get("materia")]
+        async def cargar():
+            return await horarios_cache.obtener(db, id_grupo)
         
-        # Agregar información de materias a cada horario
-        horarios = []
-        for h in response.data:
-            horario = dict(h)
-            if materias_list:
-                horario["materias"] = materias_list
-                horario["materia"] = materias_list[0] if materias_list else None
-            else:
-                horario["materias"] = []
-                horario["materia"] = None
-            horarios.append(horario)
-        
-        return horarios
+        return await catalogo_cache.responder(request, HORARIOS, id_grupo, cargar, List[Horario])
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -105,38 +81,19 @@ async def get_horario_grupo(
 @router.get("/estudiante/{ci_est}", response_model=List[Horario])
 async def get_horario_estudiante(
     ci_est: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener horarios de un estudiante por su CI con información de materias"""
     try:
         # Obtener grupo del estudiante
-        est_response = db.table("estudiante").select("id_grupo").eq("ci_est", ci_est).execute()
+        est_response = await db.table("estudiante").select("id_grupo").eq("ci_est", ci_est).execute()
         if not est_response.data or not est_response.data[0].get("id_grupo"):
             return []
         
         id_grupo = est_response.data[0]["id_grupo"]
         
-        # Obtener horarios del grupo
-        response = db.table("horario").select("*").eq("id_grupo", id_grupo).order("dia_semana, hora_inicio").execute()
-        
-        # Obtener todas las materias del grupo con sus datos completos
-        materias_response = db.table("grupomateria").select("*, materia(*)").eq("id_grupo", id_grupo).execute()
-        materias_list = [gm["materia"] for gm in materias_response.data if gm.get("materia")]
-        
-        # Agregar información de materias a cada horario
-        horarios = []
-        for h in response.data:
-            horario = dict(h)
-            if materias_list:
-                horario["materias"] = materias_list
-                horario["materia"] = materias_list[0] if materias_list else None
-            else:
-                horario["materias"] = []
-                horario["materia"] = None
-            horarios.append(horario)
-        
-        return horarios
+        return await horarios_cache.obtener(db, id_grupo)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -145,13 +102,13 @@ async def get_horario_estudiante(
 async def update_horario(
     id_horario: str,
     horario_data: HorarioUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
     """Actualizar un horario"""
     try:
         # Primero verificamos si el horario existe
-        existing = db.table("horario").select("*").eq("id_horario", id_horario).execute()
+        existing = await db.table("horario").select("*").eq("id_horario", id_horario).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Horario no encontrado")
 
@@ -182,7 +139,9 @@ async def update_horario(
                 update_data[field] = value
 
         # Realizar la actualización
-        response = db.table("horario").update(update_data).eq("id_horario", id_horario).execute()
+        response = await db.table("horario").update(update_data).eq("id_horario", id_horario).execute()
+        # Si cambia de grupo se afectan el grupo anterior y el nuevo
+        _invalidar_horarios(existing.data[0].get("id_grupo"), update_data.get("id_grupo"))
         return response.data[0]
     except HTTPException:
         raise
@@ -193,12 +152,13 @@ async def update_horario(
 @router.delete("/{id_horario}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_horario(
     id_horario: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
     """Eliminar un horario"""
     try:
-        db.table("horario").delete().eq("id_horario", id_horario).execute()
+        response = await db.table("horario").delete().eq("id_horario", id_horario).execute()
+        _invalidar_horarios(*(h.get("id_grupo") for h in response.data or []))
         return None
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -1,9 +1,12 @@
 """
 Rutas para gestión de mensajes y conversaciones
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
-from supabase import Client
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from supabase import AsyncClient
+import asyncio
+import json
 
 from app.database import get_db
 from app.models.mensajeria import (
@@ -11,7 +14,16 @@ from app.models.mensajeria import (
     Mensaje, MensajeCreate,
     MensajesNoLeidos
 )
-from app.utils.dependencies import get_current_active_user
+from app.config import settings
+from app.utils.dependencies import get_current_active_user, autenticar_token
+from app.utils.loaders import UserLoader, get_user_loader
+from app.utils.paginacion import paginar, exponer_cursor
+from app.utils.lotes import EscrituraCompensada
+from app.utils.bandeja import obtener_bandeja, registrar_ultimo_mensaje, recalcular_ultimo_mensaje
+from app.utils.realtime import (
+    hub, publicar_en_conversacion,
+    MENSAJE_NUEVO, MENSAJE_EDITADO, MENSAJE_ELIMINADO, CONVERSACION_LEIDA
+)
 
 router = APIRouter(prefix="/mensajes")
 
@@ -19,7 +31,7 @@ router = APIRouter(prefix="/mensajes")
 @router.post("/conversaciones", response_model=Conversacion, status_code=status.HTTP_201_CREATED)
 async def create_conversacion(
     conv_data: ConversacionCreate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Crear una nueva conversación"""
@@ -38,89 +50,38 @@ async def create_conversacion(
                 detail="Debe proporcionar al menos un participante además del usuario actual"
             )
 
-        # Crear conversación
         conv_dict = {"tipo": conv_data.tipo.value, "nombre": conv_data.nombre}
-        response = db.table("conversacion").insert(conv_dict).execute()
-        conversacion = response.data[0]
-        
-        # Agregar participantes
-        for id_usuario in participantes:
-            user_conv = {
-                "id_usuario": id_usuario,
-                "id_conversacion": conversacion["id_conversacion"],
-                "rol": "admin" if id_usuario == current_user["id_user"] else "miembro"
-            }
-            db.table("usuarioconversacion").insert(user_conv).execute()
+        async with EscrituraCompensada(db) as escritura:
+            # Crear conversación
+            conversacion = (await escritura.insertar("conversacion", [conv_dict], "id_conversacion"))[0]
+            
+            # Agregar participantes (una sola inserción)
+            await escritura.insertar("usuarioconversacion", [
+                {
+                    "id_usuario": id_usuario,
+                    "id_conversacion": conversacion["id_conversacion"],
+                    "rol": "admin" if id_usuario == current_user["id_user"] else "miembro"
+                }
+                for id_usuario in dict.fromkeys(participantes)
+            ], "id_usuario_conversacion")
         
         return conversacion
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
 @router.get("/conversaciones", response_model=List[Conversacion])
 async def get_my_conversaciones(
-    db: Client = Depends(get_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Obtener conversaciones del usuario actual"""
+    """Obtener conversaciones del usuario actual, de la más reciente a la más antigua"""
     try:
-        # Obtener directamente las conversaciones donde el usuario actual es participante
-        query = db.table("usuarioconversacion")\
-            .select(
-                "conversacion:conversacion(*), usuario:usuario(id_user, nombre, apellido, foto_perfil)"
-            )\
-            .eq("id_usuario", current_user["id_user"])\
-            .execute()
-
-        if not query.data:
-            return []
-
-        # Procesar las conversaciones
-        resultado = []
-        conv_processed = set()  # Para evitar duplicados
-
-        for item in query.data:
-            if not item.get("conversacion") or item["conversacion"]["id_conversacion"] in conv_processed:
-                continue
-
-            conv = item["conversacion"]
-            conv_id = conv["id_conversacion"]
-            conv_processed.add(conv_id)
-
-            # Obtener otros participantes
-            otros_participantes = db.table("usuarioconversacion")\
-                .select("usuario:usuario(id_user, nombre, apellido, foto_perfil)")\
-                .eq("id_conversacion", conv_id)\
-                .execute()
-
-            conv["participantes"] = [
-                p["usuario"] for p in otros_participantes.data 
-                if p.get("usuario") and p["usuario"]["id_user"] != current_user["id_user"]
-            ]
-
-            # Obtener último mensaje
-            ultimo_mensaje = db.table("mensaje")\
-                .select("*, usuario:usuario(nombre, apellido)")\
-                .eq("id_conversacion", conv_id)\
-                .order("fecha_envio", desc=True)\
-                .limit(1)\
-                .execute()
-
-            conv["ultimo_mensaje"] = ultimo_mensaje.data[0] if ultimo_mensaje.data else None
-
-            # Contar mensajes no leídos
-            mensajes_no_leidos = db.table("mensaje")\
-                .select("id_mensaje")\
-                .eq("id_conversacion", conv_id)\
-                .eq("leido", False)\
-                .neq("id_user", current_user["id_user"])\
-                .execute()
-
-            conv["mensajes_no_leidos"] = len(mensajes_no_leidos.data)
-
-            resultado.append(conv)
-
-        return resultado
+        return await obtener_bandeja(db, current_user["id_user"], skip, limit)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -128,15 +89,18 @@ async def get_my_conversaciones(
 @router.post("", response_model=Mensaje, status_code=status.HTTP_201_CREATED)
 async def send_mensaje(
     mensaje_data: MensajeCreate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Enviar un mensaje"""
     try:
         msg_dict = mensaje_data.dict()
         msg_dict["id_user"] = current_user["id_user"]
-        response = db.table("mensaje").insert(msg_dict).execute()
-        return response.data[0]
+        response = await db.table("mensaje").insert(msg_dict).execute()
+        mensaje = response.data[0]
+        await registrar_ultimo_mensaje(db, mensaje)
+        await publicar_en_conversacion(db, mensaje["id_conversacion"], MENSAJE_NUEVO, mensaje)
+        return mensaje
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -144,36 +108,31 @@ async def send_mensaje(
 @router.get("/conversacion/{id_conversacion}/info")
 async def get_conversacion_info(
     id_conversacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
+    loader: UserLoader = Depends(get_user_loader),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener información detallada de una conversación incluyendo todos los participantes"""
     try:
         # Verificar que el usuario está en la conversación
-        user_conv = db.table("usuarioconversacion").select("*").eq("id_conversacion", id_conversacion).eq("id_usuario", current_user["id_user"]).execute()
+        user_conv = await db.table("usuarioconversacion").select("*").eq("id_conversacion", id_conversacion).eq("id_usuario", current_user["id_user"]).execute()
         if not user_conv.data:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes acceso a esta conversación")
         
         # Obtener datos de la conversación
-        conv_response = db.table("conversacion").select("*").eq("id_conversacion", id_conversacion).single().execute()
+        conv_response = await db.table("conversacion").select("*").eq("id_conversacion", id_conversacion).single().execute()
         conversacion = conv_response.data
         
         # Obtener IDs de participantes
-        participantes_ids = db.table("usuarioconversacion")\
+        participantes_ids = await db.table("usuarioconversacion")\
             .select("id_usuario")\
             .eq("id_conversacion", id_conversacion)\
             .execute()
         
-        # Obtener información de cada participante
-        participantes = []
-        for p in participantes_ids.data:
-            user_data = db.table("usuario")\
-                .select("*")\
-                .eq("id_user", p["id_usuario"])\
-                .single()\
-                .execute()
-            if user_data.data:
-                participantes.append(user_data.data)
+        # Obtener información de todos los participantes en una sola consulta
+        ids = [p["id_usuario"] for p in participantes_ids.data]
+        usuarios = await loader.load_many(ids)
+        participantes = [usuarios[i] for i in dict.fromkeys(ids) if i in usuarios]
         
         conversacion["participantes"] = participantes
         conversacion["total_participantes"] = len(participantes)
@@ -188,26 +147,27 @@ async def get_conversacion_info(
 @router.get("/conversacion/{id_conversacion}", response_model=List[Mensaje])
 async def get_mensajes_conversacion(
     id_conversacion: str,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    db: Client = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (header X-Next-Cursor)"),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener mensajes de una conversación"""
     try:
         # Verificar que el usuario está en la conversación
-        user_conv = db.table("usuarioconversacion").select("*").eq("id_conversacion", id_conversacion).eq("id_usuario", current_user["id_user"]).execute()
+        user_conv = await db.table("usuarioconversacion").select("*").eq("id_conversacion", id_conversacion).eq("id_usuario", current_user["id_user"]).execute()
         if not user_conv.data:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes acceso a esta conversación")
         
-        # Obtener mensajes
-        response = db.table("mensaje")\
+        # Obtener mensajes (orden cronológico)
+        query = db.table("mensaje")\
             .select("*, usuario:usuario(nombre, apellido, foto_perfil)")\
-            .eq("id_conversacion", id_conversacion)\
-            .order("fecha_envio")\
-            .range(skip, skip + limit - 1)\
-            .execute()
-        return response.data
+            .eq("id_conversacion", id_conversacion)
+        mensajes, siguiente = await paginar(query, "fecha_envio", "id_mensaje", skip, limit, cursor, desc=False)
+        exponer_cursor(response, siguiente)
+        return mensajes
     except HTTPException:
         raise
     except Exception as e:
@@ -217,12 +177,12 @@ async def get_mensajes_conversacion(
 @router.put("/{id_mensaje}/leer", response_model=Mensaje)
 async def marcar_mensaje_leido(
     id_mensaje: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Marcar un mensaje como leído"""
     try:
-        response = db.table("mensaje").update({"leido": True}).eq("id_mensaje", id_mensaje).execute()
+        response = await db.table("mensaje").update({"leido": True}).eq("id_mensaje", id_mensaje).execute()
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mensaje no encontrado")
         return response.data[0]
@@ -236,13 +196,13 @@ async def marcar_mensaje_leido(
 async def editar_mensaje(
     id_mensaje: str,
     mensaje_data: dict,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Editar un mensaje existente (solo el autor puede editarlo)"""
     try:
         # Verificar que el mensaje existe y pertenece al usuario actual
-        mensaje_actual = db.table("mensaje").select("*").eq("id_mensaje", id_mensaje).execute()
+        mensaje_actual = await db.table("mensaje").select("*").eq("id_mensaje", id_mensaje).execute()
         if not mensaje_actual.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mensaje no encontrado")
         
@@ -250,7 +210,7 @@ async def editar_mensaje(
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes permiso para editar este mensaje")
         
         # Actualizar el mensaje
-        response = db.table("mensaje")\
+        response = await db.table("mensaje")\
             .update({
                 "contenido": mensaje_data.get("contenido"),
                 "editado": True
@@ -261,6 +221,7 @@ async def editar_mensaje(
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Error al actualizar mensaje")
         
+        await publicar_en_conversacion(db, response.data[0]["id_conversacion"], MENSAJE_EDITADO, response.data[0])
         return response.data[0]
     except HTTPException:
         raise
@@ -271,13 +232,13 @@ async def editar_mensaje(
 @router.delete("/{id_mensaje}")
 async def eliminar_mensaje(
     id_mensaje: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar un mensaje (solo el autor puede eliminarlo)"""
     try:
         # Verificar que el mensaje existe y pertenece al usuario actual
-        mensaje_actual = db.table("mensaje").select("*").eq("id_mensaje", id_mensaje).execute()
+        mensaje_actual = await db.table("mensaje").select("*").eq("id_mensaje", id_mensaje).execute()
         if not mensaje_actual.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mensaje no encontrado")
         
@@ -285,7 +246,10 @@ async def eliminar_mensaje(
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes permiso para eliminar este mensaje")
         
         # Eliminar el mensaje
-        response = db.table("mensaje").delete().eq("id_mensaje", id_mensaje).execute()
+        response = await db.table("mensaje").delete().eq("id_mensaje", id_mensaje).execute()
+        id_conversacion = mensaje_actual.data[0]["id_conversacion"]
+        await recalcular_ultimo_mensaje(db, id_conversacion, id_mensaje)
+        await publicar_en_conversacion(db, id_conversacion, MENSAJE_ELIMINADO, {"id_mensaje": id_mensaje})
         
         return {
             "success": True,
@@ -300,19 +264,25 @@ async def eliminar_mensaje(
 @router.put("/conversacion/{id_conversacion}/leer")
 async def marcar_conversacion_leida(
     id_conversacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Marcar todos los mensajes de una conversación como leídos para el usuario actual"""
     try:
         # Marcar como leídos todos los mensajes de la conversación que no son del usuario actual
-        response = db.table("mensaje")\
+        response = await db.table("mensaje")\
             .update({"leido": True})\
             .eq("id_conversacion", id_conversacion)\
             .neq("id_user", current_user["id_user"])\
             .eq("leido", False)\
             .execute()
         
+        if response.data:
+            await publicar_en_conversacion(db, id_conversacion, CONVERSACION_LEIDA, {
+                "id_user": current_user["id_user"],
+                "mensajes": [m["id_mensaje"] for m in response.data]
+            })
+        
         return {
             "success": True,
             "mensajes_actualizados": len(response.data) if response.data else 0,
@@ -326,20 +296,20 @@ async def marcar_conversacion_leida(
 
 @router.get("/no-leidos", response_model=MensajesNoLeidos)
 async def get_mensajes_no_leidos(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener contador de mensajes no leídos"""
     try:
         # Obtener conversaciones del usuario
-        user_convs = db.table("usuarioconversacion").select("id_conversacion").eq("id_usuario", current_user["id_user"]).execute()
+        user_convs = await db.table("usuarioconversacion").select("id_conversacion").eq("id_usuario", current_user["id_user"]).execute()
         conv_ids = [uc["id_conversacion"] for uc in user_convs.data]
         
         if not conv_ids:
             return {"total_no_leidos": 0, "conversaciones": []}
         
         # Contar mensajes no leídos
-        response = db.table("mensaje").select("*").in_("id_conversacion", conv_ids).eq("leido", False).neq("id_user", current_user["id_user"]).execute()
+        response = await db.table("mensaje").select("*").in_("id_conversacion", conv_ids).eq("leido", False).neq("id_user", current_user["id_user"]).execute()
         
         return {
             "total_no_leidos": len(response.data),
@@ -347,3 +317,88 @@ async def get_mensajes_no_leidos(
         }
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+async def _verificar_acceso_tiempo_real(token: Optional[str], db: AsyncClient) -> Optional[dict]:
+    """Autentica una conexión en tiempo real; devuelve None si el token no es válido"""
+    if not token:
+        return None
+    try:
+        return await autenticar_token(token, db)
+    except HTTPException:
+        return None
+
+
+@router.websocket("/ws")
+async def mensajes_websocket(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    db: AsyncClient = Depends(get_db)
+):
+    """
+    Canal WebSocket con los eventos de mensajería del usuario
+
+    El token de acceso se envía como `?token=` o en el header Authorization.
+    Cada evento es un JSON con `tipo` (mensaje.nuevo, mensaje.editado,
+    mensaje.eliminado, conversacion.leida), `id_conversacion` y `data`.
+    """
+    if token is None:
+        token = websocket.headers.get("authorization", "").removeprefix("Bearer ").strip() or None
+    current_user = await _verificar_acceso_tiempo_real(token, db)
+    if current_user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    cola = hub.suscribir(current_user["id_user"])
+
+    async def enviar():
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=settings.REALTIME_HEARTBEAT)
+            except asyncio.TimeoutError:
+                evento = {"tipo": "ping"}
+            await websocket.send_text(json.dumps(evento, default=str))
+
+    async def recibir():
+        # Solo se lee para detectar el cierre del cliente
+        while True:
+            await websocket.receive_text()
+
+    tareas = [asyncio.create_task(enviar()), asyncio.create_task(recibir())]
+    try:
+        await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        hub.desuscribir(current_user["id_user"], cola)
+
+
+@router.get("/stream")
+async def mensajes_stream(
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Alternativa SSE (text/event-stream) al WebSocket, con los mismos eventos
+    """
+    cola = hub.suscribir(current_user["id_user"])
+
+    async def eventos():
+        try:
+            while True:
+                try:
+                    evento = await asyncio.wait_for(cola.get(), timeout=settings.REALTIME_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {evento['tipo']}\ndata: {json.dumps(evento, default=str)}\n\n"
+        finally:
+            hub.desuscribir(current_user["id_user"], cola)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
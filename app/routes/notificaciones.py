@@ -1,13 +1,14 @@
 """
 Rutas para gestión de notificaciones
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
-from supabase import Client
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from typing import List, Optional
+from supabase import AsyncClient
 
 from app.database import get_db
 from app.models.notificacion import Notificacion, NotificacionCreate, NotificacionesNoLeidas
 from app.utils.dependencies import get_current_active_user
+from app.utils.paginacion import paginar, exponer_cursor
 
 router = APIRouter(prefix="/notificaciones")
 
@@ -15,12 +16,12 @@ router = APIRouter(prefix="/notificaciones")
 @router.post("", response_model=Notificacion, status_code=status.HTTP_201_CREATED)
 async def create_notificacion(
     notif_data: NotificacionCreate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Crear una nueva notificación"""
     try:
-        response = db.table("notificacion").insert(notif_data.dict()).execute()
+        response = await db.table("notificacion").insert(notif_data.dict()).execute()
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -28,22 +29,26 @@ async def create_notificacion(
 
 @router.get("", response_model=List[Notificacion])
 async def get_my_notificaciones(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (header X-Next-Cursor)"),
     leida: bool = None,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener notificaciones del usuario actual"""
     try:
-        query = db.table("notificacion").select("*").eq("id_user", current_user["id_user"]).order("fecha_envio", desc=True)
+        query = db.table("notificacion").select("*").eq("id_user", current_user["id_user"])
         
         if leida is not None:
             query = query.eq("leida", leida)
         
-        query = query.range(skip, skip + limit - 1)
-        response = query.execute()
-        return response.data
+        notificaciones, siguiente = await paginar(query, "fecha_envio", "id_notificacion", skip, limit, cursor)
+        exponer_cursor(response, siguiente)
+        return notificaciones
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -51,12 +56,12 @@ async def get_my_notificaciones(
 @router.put("/{id_notificacion}/leer", response_model=Notificacion)
 async def marcar_notificacion_leida(
     id_notificacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Marcar una notificación como leída"""
     try:
-        response = db.table("notificacion").update({"leida": True}).eq("id_notificacion", id_notificacion).eq("id_user", current_user["id_user"]).execute()
+        response = await db.table("notificacion").update({"leida": True}).eq("id_notificacion", id_notificacion).eq("id_user", current_user["id_user"]).execute()
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notificación no encontrada")
         return response.data[0]
@@ -68,12 +73,12 @@ async def marcar_notificacion_leida(
 
 @router.put("/marcar-todas-leidas", status_code=status.HTTP_200_OK)
 async def marcar_todas_leidas(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Marcar todas las notificaciones como leídas"""
     try:
-        db.table("notificacion").update({"leida": True}).eq("id_user", current_user["id_user"]).eq("leida", False).execute()
+        await db.table("notificacion").update({"leida": True}).eq("id_user", current_user["id_user"]).eq("leida", False).execute()
         return {"message": "Todas las notificaciones han sido marcadas como leídas"}
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -81,12 +86,12 @@ async def marcar_todas_leidas(
 
 @router.get("/no-leidas", response_model=NotificacionesNoLeidas)
 async def get_notificaciones_no_leidas(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener contador de notificaciones no leídas"""
     try:
-        response = db.table("notificacion").select("*").eq("id_user", current_user["id_user"]).eq("leida", False).execute()
+        response = await db.table("notificacion").select("*").eq("id_user", current_user["id_user"]).eq("leida", False).execute()
         return {
             "total_no_leidas": len(response.data),
             "notificaciones": response.data
@@ -98,18 +103,18 @@ async def get_notificaciones_no_leidas(
 @router.delete("/{id_notificacion}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_notificacion(
     id_notificacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar una notificación"""
     try:
-        existing = db.table("notificacion").select("*").eq("id_notificacion", id_notificacion).execute()
+        existing = await db.table("notificacion").select("*").eq("id_notificacion", id_notificacion).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notificación no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
-        db.table("notificacion").delete().eq("id_notificacion", id_notificacion).execute()
+        await db.table("notificacion").delete().eq("id_notificacion", id_notificacion).execute()
         return None
     except HTTPException:
         raise
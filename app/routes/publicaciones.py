@@ -1,13 +1,19 @@
 """
 Rutas para gestión de publicaciones
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
-from supabase import Client
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from typing import List, Optional
+from supabase import AsyncClient
+import asyncio
 
 from app.database import get_db
 from app.models.social import Publicacion, PublicacionCreate, PublicacionUpdate
 from app.utils.dependencies import get_current_active_user
+from app.utils.contadores import completar_contadores
+from app.utils.paginacion import paginar, exponer_cursor
+from app.utils.lotes import EscrituraCompensada
+from app.utils.archivos import CAMPOS_DERIVADOS, obtener_metadatos
+from app.utils.timelines import timelines
 
 router = APIRouter(prefix="/publicaciones")
 
@@ -15,19 +21,25 @@ router = APIRouter(prefix="/publicaciones")
 @router.post("", response_model=Publicacion, status_code=status.HTTP_201_CREATED)
 async def create_publicacion(
     publicacion_data: PublicacionCreate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Crear una nueva publicación"""
     try:
         pub_dict = publicacion_data.dict(exclude={"media_urls"})
         pub_dict["id_user"] = current_user["id_user"]
-        response = db.table("publicacion").insert(pub_dict).execute()
-        publicacion_id = response.data[0]["id_publicacion"]
         
-        # Crear registros de media si hay URLs
-        if publicacion_data.media_urls:
-            for url in publicacion_data.media_urls:
+        async with EscrituraCompensada(db) as escritura:
+            # Los metadatos de las imágenes (miniaturas, placeholder) se leen en paralelo
+            publicacion, metadatos = await asyncio.gather(
+                escritura.insertar("publicacion", [pub_dict], "id_publicacion"),
+                obtener_metadatos(db, publicacion_data.media_urls or [])
+            )
+            publicacion_id = publicacion[0]["id_publicacion"]
+            
+            # Crear registros de media si hay URLs (una sola inserción)
+            media = []
+            for url in publicacion_data.media_urls or []:
                 # Detectar tipo de media basado en la extensión
                 tipo_media = "imagen"
                 if any(ext in url.lower() for ext in ['.mp4', '.webm', '.mov', '.avi']):
@@ -35,15 +47,21 @@ async def create_publicacion(
                 elif any(ext in url.lower() for ext in ['.pdf', '.doc', '.docx']):
                     tipo_media = "documento"
                 
-                media_dict = {
+                fila = {
                     "tipo": tipo_media,
                     "url": url,
                     "id_publicacion": publicacion_id
                 }
-                db.table("media").insert(media_dict).execute()
+                if metadatos:
+                    # Todas las filas del lote deben tener las mismas columnas
+                    fila.update({campo: metadatos.get(url, {}).get(campo) for campo in CAMPOS_DERIVADOS})
+                media.append(fila)
+            await escritura.insertar("media", media, "id_media")
         
         # Obtener la publicación completa con información del usuario y media
-        publicacion_completa = db.table("publicacion").select("*, usuario(nombre, apellido, foto_perfil), media(*)").eq("id_publicacion", publicacion_id).single().execute()
+        publicacion_completa = await db.table("publicacion").select("*, usuario(nombre, apellido, foto_perfil), media(*)").eq("id_publicacion", publicacion_id).single().execute()
+        # Copiar a los timelines del autor, sus amigos y su grupo en segundo plano
+        timelines.distribuir(publicacion_completa.data)
         return publicacion_completa.data
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -51,28 +69,55 @@ async def create_publicacion(
 
 @router.get("", response_model=List[Publicacion])
 async def get_publicaciones(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    db: Client = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (header X-Next-Cursor)"),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener feed de publicaciones"""
     try:
         # Obtener publicaciones con información del usuario y media
-        response = db.table("publicacion").select("*, usuario(nombre, apellido, foto_perfil), media(*)").order("fecha_creacion", desc=True).range(skip, skip + limit - 1).execute()
+        query = db.table("publicacion").select("*, usuario(nombre, apellido, foto_perfil), media(*)")
+        filas, siguiente = await paginar(query, "fecha_creacion", "id_publicacion", skip, limit, cursor)
+        exponer_cursor(response, siguiente)
         
-        # Agregar contadores de comentarios y reacciones
-        publicaciones = response.data
-        for pub in publicaciones:
-            # Contar comentarios
-            comentarios_response = db.table("comentario").select("id_comentario", count="exact").eq("id_publicacion", pub["id_publicacion"]).execute()
-            pub["comentarios_count"] = comentarios_response.count or 0
-            
-            # Contar reacciones
-            reacciones_response = db.table("reaccion").select("id_reaccion", count="exact").eq("id_publicacion", pub["id_publicacion"]).execute()
-            pub["reacciones_count"] = reacciones_response.count or 0
+        # Agregar contadores y reacciones del usuario para toda la página
+        publicaciones = await completar_contadores(db, filas, current_user["id_user"])
         
         return publicaciones
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/timeline", response_model=List[Publicacion])
+async def get_timeline(
+    response: Response,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (header X-Next-Cursor)"),
+    db: AsyncClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Feed personalizado: publicaciones propias, de amigos y del grupo"""
+    try:
+        ids, siguiente = await timelines.leer(db, current_user["id_user"], limit, cursor)
+        exponer_cursor(response, siguiente)
+        if not ids:
+            return []
+        
+        filas = await db.table("publicacion")\
+            .select("*, usuario(nombre, apellido, foto_perfil), media(*)")\
+            .in_("id_publicacion", ids)\
+            .execute()
+        por_id = {p["id_publicacion"]: p for p in filas.data or []}
+        
+        # Agregar contadores y reacciones del usuario para toda la página
+        return await completar_contadores(db, [por_id[i] for i in ids if i in por_id], current_user["id_user"])
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -80,15 +125,16 @@ async def get_publicaciones(
 @router.get("/{id_publicacion}", response_model=Publicacion)
 async def get_publicacion(
     id_publicacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener una publicación por ID"""
     try:
-        response = db.table("publicacion").select("*, usuario(*), media(*)").eq("id_publicacion", id_publicacion).execute()
+        response = await db.table("publicacion").select("*, usuario(*), media(*)").eq("id_publicacion", id_publicacion).execute()
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publicación no encontrada")
-        return response.data[0]
+        publicaciones = await completar_contadores(db, response.data, current_user["id_user"])
+        return publicaciones[0]
     except HTTPException:
         raise
     except Exception as e:
@@ -99,20 +145,20 @@ async def get_publicacion(
 async def update_publicacion(
     id_publicacion: str,
     publicacion_data: PublicacionUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Actualizar una publicación"""
     try:
         # Verificar que es del usuario
-        existing = db.table("publicacion").select("*").eq("id_publicacion", id_publicacion).execute()
+        existing = await db.table("publicacion").select("*").eq("id_publicacion", id_publicacion).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publicación no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
         update_data = publicacion_data.dict(exclude_unset=True)
-        response = db.table("publicacion").update(update_data).eq("id_publicacion", id_publicacion).execute()
+        response = await db.table("publicacion").update(update_data).eq("id_publicacion", id_publicacion).execute()
         return response.data[0]
     except HTTPException:
         raise
@@ -123,19 +169,19 @@ async def update_publicacion(
 @router.delete("/{id_publicacion}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_publicacion(
     id_publicacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar una publicación"""
     try:
         # Verificar que es del usuario
-        existing = db.table("publicacion").select("*").eq("id_publicacion", id_publicacion).execute()
+        existing = await db.table("publicacion").select("*").eq("id_publicacion", id_publicacion).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publicación no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
-        db.table("publicacion").delete().eq("id_publicacion", id_publicacion).execute()
+        await db.table("publicacion").delete().eq("id_publicacion", id_publicacion).execute()
         return None
     except HTTPException:
         raise
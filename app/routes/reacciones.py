@@ -3,11 +3,13 @@ Rutas para gestión de reacciones
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
-from supabase import Client
+from supabase import AsyncClient
 
 from app.database import get_db
 from app.models.social import Reaccion, ReaccionCreate
 from app.utils.dependencies import get_current_active_user
+from app.utils.contadores import ajustar_contadores
+from app.utils.outbox import outbox
 
 router = APIRouter(prefix="/reacciones")
 
@@ -15,7 +17,7 @@ router = APIRouter(prefix="/reacciones")
 @router.post("", response_model=Reaccion, status_code=status.HTTP_201_CREATED)
 async def create_reaccion(
     reaccion_data: ReaccionCreate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Crear o actualizar una reacción"""
@@ -42,34 +44,33 @@ async def create_reaccion(
         else:
             query = query.eq("id_comentario", reaccion_data.id_comentario)
         
-        existing = query.execute()
+        existing = await query.execute()
         
         if existing.data:
             # Si ya existe, eliminarla (toggle)
-            db.table("reaccion").delete().eq("id_reaccion", existing.data[0]["id_reaccion"]).execute()
+            await db.table("reaccion").delete().eq("id_reaccion", existing.data[0]["id_reaccion"]).execute()
+            if reaccion_data.id_publicacion:
+                await ajustar_contadores(db, reaccion_data.id_publicacion, tipo_reac=reaccion_data.tipo_reac.value, reacciones=-1)
             return existing.data[0]
         else:
             # Crear nueva reacción
             reac_dict = reaccion_data.dict(exclude_unset=True)
             reac_dict["id_user"] = current_user["id_user"]  # Agregar id_user del usuario autenticado
-            response = db.table("reaccion").insert(reac_dict).execute()
+            response = await db.table("reaccion").insert(reac_dict).execute()
+            if reaccion_data.id_publicacion:
+                await ajustar_contadores(db, reaccion_data.id_publicacion, tipo_reac=reaccion_data.tipo_reac.value, reacciones=1)
             
-            # Crear notificación para el autor de la publicación/comentario
-            try:
-                if reaccion_data.id_publicacion:
-                    publicacion = db.table("publicacion").select("id_user").eq("id_publicacion", reaccion_data.id_publicacion).single().execute()
-                    if publicacion.data and publicacion.data["id_user"] != current_user["id_user"]:
-                        nombre_completo = f"{current_user.get('nombre', '')} {current_user.get('apellido', '')}".strip()
-                        emoji_reaccion = {"like": "👍", "love": "❤️", "wow": "😮", "sad": "😢", "angry": "😠"}.get(reaccion_data.tipo_reac.value, "👍")
-                        notificacion_data = {
-                            "contenido": f"{nombre_completo} reaccionó {emoji_reaccion} a tu publicación",
-                            "tipo": "reaccion",
-                            "id_user": publicacion.data["id_user"],
-                            "leida": False
-                        }
-                        db.table("notificacion").insert(notificacion_data).execute()
-            except Exception as notif_error:
-                print(f"Error creando notificación: {notif_error}")
+            # Crear notificación para el autor de la publicación
+            if reaccion_data.id_publicacion:
+                nombre_completo = f"{current_user.get('nombre', '')} {current_user.get('apellido', '')}".strip()
+                emoji_reaccion = {"like": "👍", "love": "❤️", "wow": "😮", "sad": "😢", "angry": "😠"}.get(reaccion_data.tipo_reac.value, "👍")
+                outbox.encolar(
+                    None,
+                    f"{nombre_completo} reaccionó {emoji_reaccion} a tu publicación",
+                    "reaccion",
+                    id_publicacion=reaccion_data.id_publicacion,
+                    id_actor=current_user["id_user"]
+                )
             
             return response.data[0]
             
@@ -80,12 +81,12 @@ async def create_reaccion(
 @router.get("/publicacion/{id_publicacion}", response_model=List[Reaccion])
 async def get_reacciones_publicacion(
     id_publicacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener reacciones de una publicación"""
     try:
-        response = db.table("reaccion").select("*").eq("id_publicacion", id_publicacion).execute()
+        response = await db.table("reaccion").select("*").eq("id_publicacion", id_publicacion).execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -94,12 +95,12 @@ async def get_reacciones_publicacion(
 @router.get("/comentario/{id_comentario}", response_model=List[Reaccion])
 async def get_reacciones_comentario(
     id_comentario: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener reacciones de un comentario"""
     try:
-        response = db.table("reaccion").select("*").eq("id_comentario", id_comentario).execute()
+        response = await db.table("reaccion").select("*").eq("id_comentario", id_comentario).execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -108,18 +109,20 @@ async def get_reacciones_comentario(
 @router.delete("/{id_reaccion}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_reaccion(
     id_reaccion: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar una reacción"""
     try:
-        existing = db.table("reaccion").select("*").eq("id_reaccion", id_reaccion).execute()
+        existing = await db.table("reaccion").select("*").eq("id_reaccion", id_reaccion).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reacción no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
-        db.table("reaccion").delete().eq("id_reaccion", id_reaccion).execute()
+        await db.table("reaccion").delete().eq("id_reaccion", id_reaccion).execute()
+        if existing.data[0].get("id_publicacion"):
+            await ajustar_contadores(db, existing.data[0]["id_publicacion"], tipo_reac=existing.data[0]["tipo_reac"], reacciones=-1)
         return None
     except HTTPException:
         raise
@@ -1,13 +1,20 @@
 """
 Rutas para gestión de rutas de carpooling
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from typing import List, Optional
-from supabase import Client
+from supabase import AsyncClient
 
 from app.database import get_db
-from app.models.carpooling import Ruta, RutaCreate, RutaUpdate, MisRutas
+from app.models.carpooling import Ruta, RutaCreate, RutaUpdate, MisRutas, RutaCercana, DIAS_SEMANA
 from app.utils.dependencies import get_current_active_user
+from app.utils.paginacion import paginar, paginar_en_memoria, exponer_cursor
+from app.utils.lotes import EscrituraCompensada
+from app.utils.indice_rutas import CAMPOS_PARADA, indice_rutas, mascara_dias, minuto_del_dia
+from app.utils.lugares import actualizar_ruta, completar_lugares
+from app.utils.asignacion import propuestas_asignacion
+from app.utils.geocodificacion import nomenclator
+from app.utils.loaders import UserLoader, get_user_loader, CAMPOS_USUARIO_PUBLICO
 
 router = APIRouter(prefix="/rutas-carpooling")
 
@@ -15,26 +22,36 @@ router = APIRouter(prefix="/rutas-carpooling")
 @router.post("", response_model=Ruta, status_code=status.HTTP_201_CREATED)
 async def create_ruta(
     ruta_data: RutaCreate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Crear una nueva ruta de carpooling"""
     try:
         ruta_dict = ruta_data.dict(exclude={"paradas"})
         ruta_dict["id_user"] = current_user["id_user"]
-        response = db.table("ruta").insert(ruta_dict).execute()
-        ruta = response.data[0]
+        # Coordenadas desde el nomenclátor local si el cliente no las envía
+        nomenclator.completar_coordenadas(ruta_dict, "punto_inicio", "lat_inicio", "lon_inicio")
+        nomenclator.completar_coordenadas(ruta_dict, "punto_destino", "lat_destino", "lon_destino")
         
-        # Crear paradas si las hay
-        if ruta_data.paradas:
-            for parada in ruta_data.paradas:
-                parada_dict = {
+        async with EscrituraCompensada(db) as escritura:
+            ruta = (await escritura.insertar("ruta", [ruta_dict], "id_ruta"))[0]
+            
+            # Crear paradas si las hay (una sola inserción)
+            paradas = [
+                {
                     "orden_parada": parada.get("orden_parada"),
                     "ubicacion_parada": parada.get("ubicacion_parada"),
+                    "latitud": parada.get("latitud"),
+                    "longitud": parada.get("longitud"),
                     "id_ruta": ruta["id_ruta"]
                 }
-                db.table("parada").insert(parada_dict).execute()
+                for parada in ruta_data.paradas or []
+            ]
+            for parada in paradas:
+                nomenclator.completar_coordenadas(parada, "ubicacion_parada", "latitud", "longitud")
+            await escritura.insertar("parada", paradas, "id_parada")
         
+        indice_rutas.actualizar_ruta(ruta, paradas)
         return ruta
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -42,63 +59,79 @@ async def create_ruta(
 
 @router.get("", response_model=List[Ruta])
 async def get_rutas(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (header X-Next-Cursor)"),
     activa: bool = True,
-    db: Client = Depends(get_db),
+    dias: Optional[str] = Query(None, description="Días en que sale la ruta (alguno), ej: Lunes,Martes"),
+    hora_desde: Optional[str] = Query(None, pattern=r'^\d{2}:\d{2}(:\d{2})?$', description="Salida desde (HH:MM)"),
+    hora_hasta: Optional[str] = Query(None, pattern=r'^\d{2}:\d{2}(:\d{2})?$', description="Salida hasta (HH:MM)"),
+    lugares_min: Optional[int] = Query(None, ge=1, le=8, description="Lugares libres mínimos"),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener lista de rutas disponibles"""
     try:
-        response = db.table("ruta")\
-            .select("*, usuario:usuario(nombre, apellido, foto_perfil)")\
-            .eq("activa", activa)\
-            .order("fecha_creacion", desc=True)\
-            .range(skip, skip + limit - 1)\
-            .execute()
-        
-        # Calcular pasajeros aceptados para cada ruta
-        rutas = response.data
-        for ruta in rutas:
-            pasajeros_response = db.table("pasajeroruta")\
-                .select("*")\
-                .eq("id_ruta", ruta["id_ruta"])\
-                .eq("estado", "aceptado")\
-                .execute()
-            ruta["pasajeros_aceptados"] = len(pasajeros_response.data) if pasajeros_response.data else 0
-            ruta["lugares_disponibles"] = ruta["capacidad_ruta"] - ruta["pasajeros_aceptados"]
+        select = "*, usuario:usuario(nombre, apellido, foto_perfil)"
+        if dias or hora_desde or hora_hasta or lugares_min:
+            if not activa:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Los filtros de días, horario y lugares solo aplican a rutas activas"
+                )
+            invalidos = [d for d in (dias or "").split(",") if d.strip() and d.strip() not in DIAS_SEMANA]
+            if invalidos:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Día inválido: {invalidos[0]}. Días válidos: {', '.join(DIAS_SEMANA)}"
+                )
+            
+            # Filtrar en el índice en memoria y traer solo la página
+            await indice_rutas.asegurar_cargado(db)
+            claves = indice_rutas.filtrar(
+                dias=mascara_dias((dias or "").split(",")),
+                desde=minuto_del_dia(hora_desde) if hora_desde else None,
+                hasta=minuto_del_dia(hora_hasta) if hora_hasta else None,
+                lugares_min=lugares_min
+            )
+            ids, siguiente = paginar_en_memoria(claves, skip, limit, cursor)
+            rutas = []
+            if ids:
+                filas = await db.table("ruta").select(select).in_("id_ruta", ids).execute()
+                por_id = {r["id_ruta"]: r for r in filas.data or []}
+                rutas = [por_id[i] for i in ids if i in por_id]
+        else:
+            query = db.table("ruta").select(select).eq("activa", activa)
+            rutas, siguiente = await paginar(query, "fecha_creacion", "id_ruta", skip, limit, cursor)
+        exponer_cursor(response, siguiente)
         
-        return rutas
+        # Pasajeros aceptados y lugares libres de toda la página
+        return await completar_lugares(db, rutas)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
 @router.get("/mis-rutas", response_model=MisRutas)
 async def get_mis_rutas(
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener rutas del usuario (como conductor y pasajero)"""
     try:
         # Rutas como conductor
-        conductor_response = db.table("ruta")\
+        conductor_response = await db.table("ruta")\
             .select("*, usuario:usuario(nombre, apellido, foto_perfil)")\
             .eq("id_user", current_user["id_user"])\
             .execute()
         
-        # Calcular pasajeros aceptados para cada ruta como conductor
-        rutas_conductor = conductor_response.data
-        for ruta in rutas_conductor:
-            pasajeros_response = db.table("pasajeroruta")\
-                .select("*")\
-                .eq("id_ruta", ruta["id_ruta"])\
-                .eq("estado", "aceptado")\
-                .execute()
-            ruta["pasajeros_aceptados"] = len(pasajeros_response.data) if pasajeros_response.data else 0
-            ruta["lugares_disponibles"] = ruta["capacidad_ruta"] - ruta["pasajeros_aceptados"]
+        # Pasajeros aceptados y lugares libres de las rutas como conductor
+        rutas_conductor = await completar_lugares(db, conductor_response.data)
         
         # Rutas como pasajero
-        pasajero_response = db.table("pasajeroruta")\
+        pasajero_response = await db.table("pasajeroruta")\
             .select("*, ruta:ruta(*), usuario:usuario(nombre, apellido, foto_perfil)")\
             .eq("id_user", current_user["id_user"])\
             .execute()
@@ -111,32 +144,116 @@ async def get_mis_rutas(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.get("/buscar", response_model=List[RutaCercana])
+async def buscar_rutas(
+    lat_origen: float = Query(..., ge=-90, le=90),
+    lon_origen: float = Query(..., ge=-180, le=180),
+    lat_destino: float = Query(..., ge=-90, le=90),
+    lon_destino: float = Query(..., ge=-180, le=180),
+    radio_m: int = Query(1000, ge=50, le=5000, description="Distancia máxima de la ruta al origen y al destino"),
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Buscar rutas activas que pasan cerca de mi origen y luego de mi destino,
+    ordenadas por desvío
+    """
+    try:
+        await indice_rutas.asegurar_cargado(db)
+        encontradas = indice_rutas.buscar(
+            (lat_origen, lon_origen), (lat_destino, lon_destino), radio_m, limit=limit
+        )
+        if not encontradas:
+            return []
+        
+        ids = [e["id_ruta"] for e in encontradas]
+        rutas_response = await db.table("ruta")\
+            .select("*, usuario:usuario(nombre, apellido, foto_perfil)")\
+            .in_("id_ruta", ids)\
+            .eq("activa", True)\
+            .execute()
+        rutas = {r["id_ruta"]: r for r in await completar_lugares(db, rutas_response.data or [])}
+        
+        return [
+            {**rutas[e["id_ruta"]], **e}
+            for e in encontradas
+            if e["id_ruta"] in rutas
+        ]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/propuesta-asignacion")
+async def get_propuesta_asignacion(
+    dia: str = Query(..., description="Día de la semana, ej: Lunes"),
+    hora_desde: str = Query("00:00", pattern=r'^\d{2}:\d{2}(:\d{2})?$'),
+    hora_hasta: str = Query("23:59", pattern=r'^\d{2}:\d{2}(:\d{2})?$'),
+    db: AsyncClient = Depends(get_db),
+    loader: UserLoader = Depends(get_user_loader),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Propuesta de qué solicitudes pendientes aceptar en mis rutas
+
+    Se calcula en lote para todas las rutas del día y la franja horaria, de
+    modo que se llenen los autos y se sirva a la mayor cantidad de pasajeros
+    con el menor desvío total. Las solicitudes se aceptan con PUT /pasajeros/{id}.
+    """
+    try:
+        if dia not in DIAS_SEMANA:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Día inválido: {dia}. Días válidos: {', '.join(DIAS_SEMANA)}"
+            )
+        propuesta = await propuestas_asignacion.obtener(
+            db, mascara_dias([dia]), minuto_del_dia(hora_desde), minuto_del_dia(hora_hasta)
+        )
+        
+        mis_rutas = {
+            id_ruta: pasajeros
+            for id_ruta, pasajeros in propuesta["asignaciones"].items()
+            if (indice_rutas.ruta(id_ruta) or {}).get("id_user") == current_user["id_user"]
+        }
+        usuarios = await loader.load_many(
+            [p["id_user"] for pasajeros in mis_rutas.values() for p in pasajeros],
+            campos=CAMPOS_USUARIO_PUBLICO
+        )
+        return {
+            "rutas": [
+                {
+                    "id_ruta": id_ruta,
+                    "pasajeros": [{**p, "pasajero": usuarios.get(p["id_user"])} for p in pasajeros],
+                    "desvio_total_m": sum(p["desvio_m"] for p in pasajeros),
+                }
+                for id_ruta, pasajeros in mis_rutas.items()
+            ],
+            "resumen": propuesta["resumen"],
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
 @router.get("/{id_ruta}", response_model=Ruta)
 async def get_ruta(
     id_ruta: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener una ruta por ID"""
     try:
-        response = db.table("ruta")\
+        response = await db.table("ruta")\
             .select("*, usuario:usuario(*), parada:parada(*)")\
             .eq("id_ruta", id_ruta)\
             .execute()
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ruta no encontrada")
         
-        ruta = response.data[0]
-        # Calcular pasajeros aceptados
-        pasajeros_response = db.table("pasajeroruta")\
-            .select("*")\
-            .eq("id_ruta", ruta["id_ruta"])\
-            .eq("estado", "aceptado")\
-            .execute()
-        ruta["pasajeros_aceptados"] = len(pasajeros_response.data) if pasajeros_response.data else 0
-        ruta["lugares_disponibles"] = ruta["capacidad_ruta"] - ruta["pasajeros_aceptados"]
-        
-        return ruta
+        return (await completar_lugares(db, response.data))[0]
     except HTTPException:
         raise
     except Exception as e:
@@ -147,21 +264,46 @@ async def get_ruta(
 async def update_ruta(
     id_ruta: str,
     ruta_data: RutaUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Actualizar una ruta"""
     try:
         # Verificar que es del conductor
-        existing = db.table("ruta").select("*").eq("id_ruta", id_ruta).execute()
+        existing = await db.table("ruta").select("*").eq("id_ruta", id_ruta).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ruta no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
         update_data = ruta_data.dict(exclude_unset=True)
-        response = db.table("ruta").update(update_data).eq("id_ruta", id_ruta).execute()
-        return response.data[0]
+        for campo_texto, campo_lat, campo_lon in (
+            ("punto_inicio", "lat_inicio", "lon_inicio"),
+            ("punto_destino", "lat_destino", "lon_destino"),
+        ):
+            if campo_texto not in update_data or update_data[campo_texto] == existing.data[0].get(campo_texto):
+                continue
+            # Si el nuevo texto no se reconoce, las coordenadas anteriores ya no corresponden
+            if not nomenclator.completar_coordenadas(update_data, campo_texto, campo_lat, campo_lon) \
+                    and update_data.get(campo_lat) is None and update_data.get(campo_lon) is None:
+                update_data[campo_lat] = update_data[campo_lon] = None
+        aceptados = existing.data[0].get("pasajeros_aceptados") or 0
+        if update_data.get("capacidad_ruta") is not None and update_data["capacidad_ruta"] < aceptados:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"La ruta ya tiene {aceptados} pasajeros aceptados"
+            )
+        # La actualización vuelve a validar la capacidad por si se aceptó a alguien entre medio
+        ruta = await actualizar_ruta(db, id_ruta, update_data)
+        if ruta is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ruta no encontrada")
+        paradas = None
+        if ruta.get("activa") and existing.data[0].get("activa") is False:
+            # Al desactivarla el índice descartó sus paradas: se vuelven a leer
+            response = await db.table("parada").select(CAMPOS_PARADA).eq("id_ruta", id_ruta).execute()
+            paradas = response.data or []
+        indice_rutas.actualizar_ruta(ruta, paradas)
+        return ruta
     except HTTPException:
         raise
     except Exception as e:
@@ -171,19 +313,20 @@ async def update_ruta(
 @router.delete("/{id_ruta}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_ruta(
     id_ruta: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar una ruta (desactivarla)"""
     try:
-        existing = db.table("ruta").select("*").eq("id_ruta", id_ruta).execute()
+        existing = await db.table("ruta").select("*").eq("id_ruta", id_ruta).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ruta no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
         # Desactivar en lugar de eliminar
-        db.table("ruta").update({"activa": False}).eq("id_ruta", id_ruta).execute()
+        await db.table("ruta").update({"activa": False}).eq("id_ruta", id_ruta).execute()
+        indice_rutas.eliminar_ruta(id_ruta)
         return None
     except HTTPException:
         raise
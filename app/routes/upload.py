@@ -1,103 +1,304 @@
 """
 Rutas para manejo de uploads de archivos
 """
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from typing import List
-from supabase import Client
-import uuid
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request, Query
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from typing import Callable, List, Optional, Tuple
+from supabase import AsyncClient
+from postgrest.exceptions import APIError
+import asyncio
+import httpx
+import io
+import logging
 import os
-from datetime import datetime
+import uuid
 
+from app.config import settings
 from app.database import get_db
+from app.models.upload import (
+    SubidaFirmadaCreate, SubidaFirmada, SubidaCompletar,
+    SesionReanudableCreate, SesionReanudable
+)
 from app.utils.dependencies import get_current_active_user
+from app.utils.security import create_upload_token, verify_token
+from app.utils.archivos import (
+    ArchivoTemporal, CAMPOS_DERIVADOS, DOCX, EXTENSIONES, TAM_CABECERA, ZIP,
+    buscar_por_hash, calcular_sha256, detectar_tipo, es_docx, eliminar_sin_uso, guardar_temporal, marcar_reutilizados,
+    quitar_subida_firmada, registrar_subida_firmada
+)
+from app.utils.imagenes import Derivados, generar_derivados
+from app.utils.reanudables import sesiones
 
-router = APIRouter(prefix="/upload")
+logger = logging.getLogger(__name__)
 
 # Configuración
 ALLOWED_IMAGE_TYPES = ["image/jpeg", "image/jpg", "image/png", "image/gif", "image/webp"]
 ALLOWED_VIDEO_TYPES = ["video/mp4", "video/mpeg", "video/quicktime", "video/webm"]
 ALLOWED_DOCUMENT_TYPES = ["application/pdf", "application/msword", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_FILES = 5
+# Margen para los encabezados multipart por encima del tamaño de los archivos
+MAX_REQUEST_SIZE = MAX_FILES * MAX_FILE_SIZE + 1024 * 1024
+
+# Subidas simultáneas a Storage en todo el proceso
+_semaforo_subidas = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
+
+
+class _RutaConLimiteDeTamano(APIRoute):
+    """
+    Rechaza con 413 los cuerpos declarados demasiado grandes antes de leerlos
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def handler_con_limite(request: Request):
+            longitud = request.headers.get("content-length")
+            if longitud and longitud.isdigit() and int(longitud) > MAX_REQUEST_SIZE:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"La solicitud excede el tamaño máximo de {MAX_REQUEST_SIZE // (1024 * 1024)}MB"
+                )
+            return await handler(request)
+
+        return handler_con_limite
+
+
+router = APIRouter(prefix="/upload", route_class=_RutaConLimiteDeTamano)
+
+
+def _carpeta(content_type: str) -> str:
+    """Carpeta de Storage según el tipo de archivo"""
+    if content_type in ALLOWED_IMAGE_TYPES:
+        return "images"
+    if content_type in ALLOWED_VIDEO_TYPES:
+        return "videos"
+    return "documents"
+
+
+def _ya_existe(error: Exception) -> bool:
+    """True si Storage rechazó la subida porque el objeto ya existe"""
+    detalle = error.args[0] if error.args and isinstance(error.args[0], dict) else {}
+    return detalle.get("error") == "Duplicate" or str(detalle.get("statusCode")) == "409"
+
+
+async def _subir_objeto(db: AsyncClient, ruta_local: str, storage_path: str, content_type: str) -> Tuple[str, bool]:
+    """
+    Sube un archivo local a Storage respetando el límite de concurrencia
+
+    Returns:
+        Tupla (URL pública, True si esta llamada creó el objeto). La ruta
+        depende del contenido: si otra petición ya subió el mismo objeto se
+        reutiliza, y la limpieza ante errores no debe borrarlo.
+    """
+    creado = True
+    async with _semaforo_subidas:
+        # Se envía el archivo abierto para que el cuerpo se transmita desde disco
+        with open(ruta_local, "rb") as contenido:
+            try:
+                await db.storage.from_("media").upload(
+                    path=storage_path,
+                    file=contenido,
+                    file_options={"content-type": content_type}
+                )
+            except Exception as e:
+                if not _ya_existe(e):
+                    raise
+                creado = False
+    return await db.storage.from_("media").get_public_url(storage_path), creado
+
+
+async def _subir_a_storage(db: AsyncClient, archivo: ArchivoTemporal) -> dict:
+    """
+    Sube un archivo temporal (y los derivados si es una imagen) a Supabase Storage
+    bajo una ruta derivada del SHA-256 de los bytes almacenados
+
+    `sha256_subida` en el resultado es el hash del contenido recibido.
+    """
+    # Limpia EXIF y genera miniaturas WebP (no hace nada si no es una imagen)
+    derivados: Optional[Derivados] = await run_in_threadpool(generar_derivados, archivo.ruta, archivo.content_type)
+    nombre_base = archivo.sha256
+
+    try:
+        if derivados:
+            # El original se reescribió: la ruta debe corresponder a lo que se guarda
+            archivo.tamano = os.path.getsize(archivo.ruta)
+            nombre_base = await run_in_threadpool(calcular_sha256, archivo.ruta)
+        file_extension = EXTENSIONES.get(archivo.content_type) or os.path.splitext(archivo.nombre)[1]
+        storage_path = f"{_carpeta(archivo.content_type)}/{nombre_base}{file_extension}"
+        rutas_variantes = {
+            nombre: f"derivados/{nombre_base}_{nombre}.webp"
+            for nombre in (derivados.archivos if derivados else {})
+        }
+        subidas = await asyncio.gather(
+            _subir_objeto(db, archivo.ruta, storage_path, archivo.content_type),
+            *(
+                _subir_objeto(db, derivados.archivos[nombre], ruta, "image/webp")
+                for nombre, ruta in rutas_variantes.items()
+            ),
+            return_exceptions=True
+        )
+    finally:
+        if derivados:
+            derivados.eliminar()
+
+    rutas = [storage_path, *rutas_variantes.values()]
+    # Solo lo que creó esta petición; los objetos que ya existían son de otra
+    creadas = [r for r, s in zip(rutas, subidas) if not isinstance(s, Exception) and s[1]]
+    fallos = [s for s in subidas if isinstance(s, Exception)]
+    if fallos:
+        if creadas:
+            await db.storage.from_("media").remove(creadas)
+        raise fallos[0]
+
+    urls = [url for url, _ in subidas]
+    resultado = {
+        "url": urls[0],
+        "filename": archivo.nombre,
+        "content_type": archivo.content_type,
+        "size": archivo.tamano,
+        "sha256": nombre_base,
+        "sha256_subida": archivo.sha256,
+        "path": storage_path,
+        "paths_creados": creadas
+    }
+    if derivados:
+        resultado.update({
+            "variantes": dict(zip(rutas_variantes, urls[1:])),
+            "placeholder": derivados.placeholder,
+            "ancho": derivados.ancho,
+            "alto": derivados.alto
+        })
+    return resultado
+
+
+def _resultado_subido(subido: dict) -> dict:
+    """Respuesta de subida para un archivo recién almacenado"""
+    return {k: v for k, v in subido.items() if k not in ("path", "paths_creados", "filename", "sha256_subida")}
+
+
+def _resultado_existente(fila: dict) -> dict:
+    """Respuesta de subida para un archivo que ya estaba almacenado"""
+    resultado = {
+        "url": fila["url"],
+        "content_type": fila["content_type"],
+        "size": fila["tamano"],
+        "sha256": fila["sha256"],
+    }
+    if fila.get("variantes"):
+        resultado.update({campo: fila.get(campo) for campo in CAMPOS_DERIVADOS})
+    return resultado
+
+
+async def _registrar_archivos(db: AsyncClient, subidos: List[dict], id_user: str) -> None:
+    """
+    Guarda los metadatos de los archivos subidos para enlazarlos al crear la
+    publicación (ver create_publicacion)
+    """
+    filas = [
+        {
+            "ruta": s["path"],
+            "url": s["url"],
+            "sha256": s["sha256"],
+            "sha256_subida": s.get("sha256_subida"),
+            "id_user": id_user,
+            "content_type": s["content_type"],
+            "tamano": s["size"],
+            "variantes": s.get("variantes"),
+            "placeholder": s.get("placeholder"),
+            "ancho": s.get("ancho"),
+            "alto": s.get("alto")
+        }
+        for s in subidos
+    ]
+    if not filas:
+        return
+    try:
+        # Otra petición pudo registrar el mismo contenido en paralelo
+        try:
+            await db.table("archivo").upsert(filas, on_conflict="ruta", ignore_duplicates=True).execute()
+        except APIError as e:
+            # Sin add_hash_subida_archivo.sql se registra sin el hash de lo subido
+            if str(e.code or "") not in ("42703", "PGRST204"):
+                raise
+            filas = [{k: v for k, v in f.items() if k != "sha256_subida"} for f in filas]
+            await db.table("archivo").upsert(filas, on_conflict="ruta", ignore_duplicates=True).execute()
+    except Exception as e:
+        logger.warning(f"No se pudieron registrar los metadatos de {len(filas)} archivos: {e}")
+
 
 @router.post("/files", status_code=status.HTTP_201_CREATED)
 async def upload_files(
     files: List[UploadFile] = File(...),
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
     Subir uno o más archivos a Supabase Storage
+
+    Cada archivo se copia a disco por bloques (413 si excede el tamaño máximo),
+    su tipo se valida por contenido y luego todos se suben en paralelo. Los
+    archivos cuyo contenido ya está almacenado no se vuelven a subir.
     """
-    if len(files) > 5:
+    if len(files) > MAX_FILES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Máximo 5 archivos por solicitud"
+            detail=f"Máximo {MAX_FILES} archivos por solicitud"
         )
     
-    uploaded_urls = []
+    temporales: List[ArchivoTemporal] = []
     
     try:
         for file in files:
-            # Validar tipo de archivo
-            content_type = file.content_type
-            if content_type not in ALLOWED_IMAGE_TYPES + ALLOWED_VIDEO_TYPES + ALLOWED_DOCUMENT_TYPES:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Tipo de archivo no permitido: {content_type}"
-                )
-            
-            # Leer contenido del archivo
-            contents = await file.read()
+            temporal = await guardar_temporal(file, MAX_FILE_SIZE)
+            temporales.append(temporal)
             
-            # Validar tamaño
-            if len(contents) > MAX_FILE_SIZE:
+            # Validar tipo de archivo (detectado por contenido)
+            if temporal.content_type not in ALLOWED_IMAGE_TYPES + ALLOWED_VIDEO_TYPES + ALLOWED_DOCUMENT_TYPES:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Archivo {file.filename} excede el tamaño máximo de 10MB"
-                )
-            
-            # Generar nombre único para el archivo
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            unique_id = str(uuid.uuid4())[:8]
-            file_extension = os.path.splitext(file.filename)[1]
-            unique_filename = f"{current_user['id_user']}_{timestamp}_{unique_id}{file_extension}"
-            
-            # Determinar carpeta según tipo de archivo
-            if content_type in ALLOWED_IMAGE_TYPES:
-                folder = "images"
-            elif content_type in ALLOWED_VIDEO_TYPES:
-                folder = "videos"
-            else:
-                folder = "documents"
-            
-            # Subir a Supabase Storage
-            storage_path = f"{folder}/{unique_filename}"
-            
-            try:
-                # Subir archivo
-                result = db.storage.from_("media").upload(
-                    path=storage_path,
-                    file=contents,
-                    file_options={"content-type": content_type}
-                )
-                
-                # Obtener URL pública
-                public_url = db.storage.from_("media").get_public_url(storage_path)
-                
-                uploaded_urls.append({
-                    "url": public_url,
-                    "filename": file.filename,
-                    "content_type": content_type,
-                    "size": len(contents)
-                })
-                
-            except Exception as storage_error:
-                print(f"Error de Supabase Storage: {str(storage_error)}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Error al subir archivo: {str(storage_error)}"
+                    detail=f"Tipo de archivo no permitido: {temporal.content_type}"
                 )
         
+        # Deduplicación: solo se suben los contenidos que aún no existen
+        existentes = await buscar_por_hash(db, [t.sha256 for t in temporales])
+        nuevos = {}
+        for t in temporales:
+            if t.sha256 not in existentes:
+                nuevos.setdefault(t.sha256, t)
+        
+        resultados = await asyncio.gather(
+            *(_subir_a_storage(db, t) for t in nuevos.values()),
+            return_exceptions=True
+        )
+        
+        errores = [r for r in resultados if isinstance(r, Exception)]
+        if errores:
+            # No dejar archivos sueltos en Storage si la subida quedó incompleta
+            subidos = [p for r in resultados if not isinstance(r, Exception) for p in r["paths_creados"]]
+            if subidos:
+                try:
+                    await db.storage.from_("media").remove(subidos)
+                except Exception as e:
+                    logger.warning(f"No se pudieron limpiar {len(subidos)} archivos subidos: {e}")
+            logger.error(f"Error de Supabase Storage: {errores[0]}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error al subir archivo: {str(errores[0])}"
+            )
+        
+        await _registrar_archivos(db, resultados, current_user["id_user"])
+        await marcar_reutilizados(db, [fila["sha256"] for fila in existentes.values()])
+        
+        # Indexado por el hash de lo subido, que es el que conoce cada temporal
+        por_hash = {sha: _resultado_existente(fila) for sha, fila in existentes.items()}
+        por_hash.update({r["sha256_subida"]: _resultado_subido(r) for r in resultados})
+        uploaded_urls = [
+            {**por_hash[t.sha256], "filename": t.nombre, "duplicado": t.sha256 in existentes}
+            for t in temporales
+        ]
+        
         return {
             "message": f"Se subieron {len(uploaded_urls)} archivos exitosamente",
             "files": uploaded_urls
@@ -111,16 +312,351 @@ async def upload_files(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error inesperado: {str(e)}"
         )
+    finally:
+        for temporal in temporales:
+            temporal.eliminar()
+
+
+def _normalizar_tipo(content_type: str) -> str:
+    """Unifica alias de tipos MIME (image/jpg -> image/jpeg)"""
+    return "image/jpeg" if content_type == "image/jpg" else content_type
+
+
+async def _info_objeto(db: AsyncClient, storage_path: str) -> Optional[dict]:
+    """Metadatos (tamaño, mimetype) de un objeto del bucket o None si no existe"""
+    carpeta, nombre = storage_path.rsplit("/", 1)
+    objetos = await db.storage.from_("media").list(carpeta, {"search": nombre, "limit": 1})
+    for objeto in objetos or []:
+        if objeto.get("name") == nombre:
+            return objeto.get("metadata") or {}
+    return None
+
+
+async def _leer_cabecera(db: AsyncClient, storage_path: str) -> bytes:
+    """
+    Primeros bytes de un objeto del bucket, sin descargarlo completo
+
+    Se pide una URL firmada de corta duración y se descarga solo el rango
+    inicial con una petición Range.
+    """
+    firmada = await db.storage.from_("media").create_signed_url(storage_path, 60)
+    async with httpx.AsyncClient(timeout=settings.STORAGE_TIMEOUT) as cliente:
+        response = await cliente.get(firmada["signedURL"], headers={"Range": f"bytes=0-{TAM_CABECERA - 1}"})
+    response.raise_for_status()
+    return response.content[:TAM_CABECERA]
+
+
+async def _detectar_tipo_objeto(db: AsyncClient, storage_path: str) -> Optional[str]:
+    """
+    Tipo por contenido de un objeto del bucket
+
+    Basta la cabecera salvo para los ZIP, que se descargan para revisar si son
+    .docx (su directorio está al final del archivo).
+    """
+    content_type = detectar_tipo(await _leer_cabecera(db, storage_path))
+    if content_type == ZIP:
+        contenido = await db.storage.from_("media").download(storage_path)
+        return DOCX if await run_in_threadpool(es_docx, io.BytesIO(contenido)) else None
+    return content_type
+
+
+@router.post("/firmar", response_model=SubidaFirmada)
+async def crear_subida_firmada(
+    datos: SubidaFirmadaCreate,
+    db: AsyncClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Obtener una URL firmada para subir un archivo directamente a Storage
+
+    El cliente sube los bytes a `signed_url` (PUT) y luego llama a
+    `/upload/completar` con el `token` para validar y registrar el archivo.
+    """
+    content_type = _normalizar_tipo(datos.content_type)
+    if content_type not in ALLOWED_IMAGE_TYPES + ALLOWED_VIDEO_TYPES + ALLOWED_DOCUMENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Tipo de archivo no permitido: {datos.content_type}"
+        )
+    if datos.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Archivo {datos.filename} excede el tamaño máximo de {MAX_FILE_SIZE // (1024 * 1024)}MB"
+        )
+    
+    extension = EXTENSIONES.get(content_type) or os.path.splitext(datos.filename)[1]
+    storage_path = f"{_carpeta(content_type)}/{current_user['id_user']}/{uuid.uuid4().hex}{extension}"
+    
+    try:
+        firmada = await db.storage.from_("media").create_signed_upload_url(storage_path)
+        await registrar_subida_firmada(db, storage_path, current_user["id_user"])
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al firmar la subida: {str(e)}"
+        )
+    
+    token = create_upload_token({
+        "sub": current_user["id_user"],
+        "path": storage_path,
+        "content_type": content_type,
+        "size": datos.size,
+        "filename": datos.filename
+    })
+    
+    return {
+        "signed_url": firmada["signed_url"],
+        "path": storage_path,
+        "token": token,
+        "expira_en": settings.SIGNED_UPLOAD_EXPIRE_MINUTES * 60
+    }
+
+
+@router.post("/completar", status_code=status.HTTP_201_CREATED)
+async def completar_subida_firmada(
+    datos: SubidaCompletar,
+    db: AsyncClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Validar y registrar un archivo subido con una URL firmada
+
+    Comprueba que el objeto exista, que su tamaño no supere lo declarado y que
+    su contenido corresponda al tipo declarado; si no, lo elimina del bucket.
+    """
+    payload = verify_token(datos.token, token_type="upload")
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token de subida inválido o expirado"
+        )
+    if payload.get("sub") != current_user["id_user"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="La subida pertenece a otro usuario"
+        )
+    
+    storage_path = payload["path"]
+    content_type = payload["content_type"]
+    
+    try:
+        info = await _info_objeto(db, storage_path)
+        if info is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="El archivo aún no fue subido"
+            )
+        
+        tamano = int(info.get("size") or 0)
+        error = None
+        if tamano > min(payload["size"], MAX_FILE_SIZE):
+            error = (status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "El archivo excede el tamaño declarado")
+        elif await _detectar_tipo_objeto(db, storage_path) != content_type:
+            error = (status.HTTP_400_BAD_REQUEST, "El contenido del archivo no corresponde al tipo declarado")
+        
+        if error:
+            await db.storage.from_("media").remove([storage_path])
+            await quitar_subida_firmada(db, storage_path)
+            raise HTTPException(status_code=error[0], detail=error[1])
+        
+        public_url = await db.storage.from_("media").get_public_url(storage_path)
+        await _registrar_archivos(db, [{
+            "path": storage_path,
+            "url": public_url,
+            "sha256": None,
+            "content_type": content_type,
+            "size": tamano
+        }], current_user["id_user"])
+        await quitar_subida_firmada(db, storage_path)
+        
+        return {
+            "url": public_url,
+            "filename": payload.get("filename"),
+            "content_type": content_type,
+            "size": tamano
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al completar la subida: {str(e)}"
+        )
+
+
+def _estado_sesion(sesion: dict) -> dict:
+    return {
+        "id_sesion": sesion["id_sesion"],
+        "offset": sesiones.offset(sesion),
+        "size": sesion["size"],
+        "tam_bloque": settings.RESUMABLE_CHUNK_SIZE,
+        "expira": sesion["expira"]
+    }
+
+
+@router.post("/reanudables", response_model=SesionReanudable, status_code=status.HTTP_201_CREATED)
+async def crear_sesion_reanudable(
+    datos: SesionReanudableCreate,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Iniciar una subida reanudable (pensada para videos en conexiones inestables)
+
+    Flujo: crear la sesión, enviar bloques con `PUT /upload/reanudables/{id}?offset=N`,
+    consultar el offset con `GET` si la conexión se corta y finalizar con
+    `POST /upload/reanudables/{id}/completar`.
+    """
+    content_type = _normalizar_tipo(datos.content_type)
+    if content_type not in ALLOWED_IMAGE_TYPES + ALLOWED_VIDEO_TYPES + ALLOWED_DOCUMENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Tipo de archivo no permitido: {datos.content_type}"
+        )
+    if datos.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Archivo {datos.filename} excede el tamaño máximo de {MAX_FILE_SIZE // (1024 * 1024)}MB"
+        )
+    
+    sesion = await run_in_threadpool(
+        sesiones.crear, current_user["id_user"], datos.filename, content_type, datos.size
+    )
+    return _estado_sesion(sesion)
+
+
+@router.get("/reanudables/{id_sesion}", response_model=SesionReanudable)
+async def obtener_sesion_reanudable(
+    id_sesion: str,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Consultar cuántos bytes de la subida ya fueron recibidos
+    """
+    sesion = sesiones.obtener(id_sesion, current_user["id_user"])
+    return _estado_sesion(sesion)
+
+
+@router.put("/reanudables/{id_sesion}", response_model=SesionReanudable)
+async def enviar_bloque(
+    id_sesion: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="Posición del primer byte del bloque"),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Enviar un bloque de la subida (cuerpo binario)
+
+    El offset debe coincidir con los bytes ya recibidos; si no, responde 409
+    indicando el offset esperado.
+    """
+    sesion = sesiones.obtener(id_sesion, current_user["id_user"])
+    await sesiones.anexar(sesion, offset, request.stream())
+    return _estado_sesion(sesion)
+
+
+@router.post("/reanudables/{id_sesion}/completar", status_code=status.HTTP_201_CREATED)
+async def completar_sesion_reanudable(
+    id_sesion: str,
+    db: AsyncClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Finalizar una subida reanudable y subir el archivo al bucket `media`
+    """
+    sesion = sesiones.obtener(id_sesion, current_user["id_user"])
+    recibidos = sesiones.offset(sesion)
+    if recibidos < sesion["size"]:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Subida incompleta: se recibieron {recibidos} de {sesion['size']} bytes"
+        )
+    
+    temporal = None
+    try:
+        temporal = await sesiones.como_temporal(sesion)
+        if temporal.content_type != sesion["content_type"]:
+            # Las partes se conservan: el cliente decide si cancela la sesión
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="El contenido del archivo no corresponde al tipo declarado"
+            )
+        
+        existentes = await buscar_por_hash(db, [temporal.sha256])
+        if temporal.sha256 in existentes:
+            resultado = _resultado_existente(existentes[temporal.sha256])
+            await marcar_reutilizados(db, [resultado["sha256"]])
+        else:
+            subido = await _subir_a_storage(db, temporal)
+            await _registrar_archivos(db, [subido], current_user["id_user"])
+            resultado = _resultado_subido(subido)
+        
+        sesiones.eliminar(id_sesion)
+        return {**resultado, "filename": temporal.nombre, "duplicado": temporal.sha256 in existentes}
+    except HTTPException as e:
+        # Un contenido no reconocido no se puede corregir reenviando bloques
+        if e.status_code == status.HTTP_400_BAD_REQUEST:
+            sesiones.eliminar(id_sesion)
+        raise
+    except Exception as e:
+        logger.error(f"Error al completar la subida reanudable {id_sesion}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al subir archivo: {str(e)}"
+        )
+    finally:
+        if temporal is not None:
+            temporal.eliminar()
+
+
+@router.delete("/reanudables/{id_sesion}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancelar_sesion_reanudable(
+    id_sesion: str,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Cancelar una subida reanudable y descartar los bloques recibidos
+    """
+    sesiones.obtener(id_sesion, current_user["id_user"])
+    sesiones.eliminar(id_sesion)
+    return None
+
+
+@router.get("/archivos/{sha256}")
+async def get_archivo_por_hash(
+    sha256: str,
+    db: AsyncClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Consultar si el usuario ya subió un contenido
+
+    El cliente puede calcular el SHA-256 del archivo antes de subirlo y, si
+    existe, usar la URL devuelta sin enviar los bytes. Solo se consideran los
+    archivos subidos por el propio usuario: la respuesta no revela qué
+    contenidos subieron otros.
+    """
+    sha256 = sha256.lower()
+    existentes = await buscar_por_hash(db, [sha256])
+    fila = existentes.get(sha256)
+    if fila is None or fila["id_user"] != current_user["id_user"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Archivo no encontrado")
+    await marcar_reutilizados(db, [fila["sha256"]])
+    return _resultado_existente(fila)
 
 
 @router.delete("/files")
 async def delete_file(
     file_url: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
     Eliminar un archivo de Supabase Storage
+
+    Solo quien lo subió o un administrador puede eliminarlo. Los archivos se
+    comparten entre usuarios con el mismo contenido: solo se borran del bucket
+    cuando nadie los usa (ninguna media los referencia, no es una foto de
+    perfil y no se entregó como duplicado hace poco).
     """
     try:
         # Extraer el path del archivo de la URL
@@ -133,9 +669,20 @@ async def delete_file(
             )
         
         file_path = parts[1]
+        registro = await db.table("archivo").select("ruta, id_user").eq("ruta", file_path).execute()
+        if not registro.data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Archivo no encontrado"
+            )
+        if registro.data[0]["id_user"] != current_user["id_user"] and current_user["rol"] != "administrador":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Solo quien subió el archivo puede eliminarlo"
+            )
         
-        # Eliminar de Supabase Storage
-        result = db.storage.from_("media").remove([file_path])
+        if not await eliminar_sin_uso(db, file_path):
+            return {"message": "El archivo sigue en uso; no se eliminó del almacenamiento"}
         
         return {"message": "Archivo eliminado exitosamente"}
         
@@ -3,7 +3,7 @@ Rutas para gestión de usuarios
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from typing import List, Optional
-from supabase import Client
+from supabase import AsyncClient
 from datetime import datetime
 
 from app.database import get_db
@@ -14,9 +14,14 @@ from app.models.usuario import (
 )
 from app.utils.dependencies import (
     get_current_active_user,
-    require_admin
+    require_admin,
+    invalidar_usuario
 )
 from app.utils.security import get_password_hash
+from app.utils.cache_http import catalogo_cache, DOCENTES, MATERIAS
+from app.utils.busqueda import indice_usuarios
+from app.utils.grafo_amigos import grafo_amigos
+from app.utils.companeros import companeros
 
 router = APIRouter(prefix="/usuarios")
 
@@ -27,7 +32,7 @@ async def get_usuarios(
     limit: int = Query(100, ge=1, le=100),
     rol: Optional[str] = None,
     activo: Optional[bool] = None,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """
@@ -45,7 +50,7 @@ async def get_usuarios(
         # Paginación
         query = query.range(skip, skip + limit - 1)
         
-        response = query.execute()
+        response = await query.execute()
         
         # Remover contraseñas
         usuarios = [
@@ -65,14 +70,14 @@ async def get_usuarios(
 @router.get("/{id_user}", response_model=Usuario)
 async def get_usuario(
     id_user: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
     Obtener un usuario por ID
     """
     try:
-        response = db.table("usuario").select("*").eq("id_user", id_user).execute()
+        response = await db.table("usuario").select("*").eq("id_user", id_user).execute()
         
         if not response.data:
             raise HTTPException(
@@ -111,7 +116,7 @@ async def get_usuario(
 async def update_usuario(
     id_user: str,
     user_data: UsuarioUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -126,7 +131,7 @@ async def update_usuario(
     
     try:
         # Verificar que el usuario existe
-        existing = db.table("usuario").select("id_user").eq("id_user", id_user).execute()
+        existing = await db.table("usuario").select("id_user").eq("id_user", id_user).execute()
         
         if not existing.data:
             raise HTTPException(
@@ -143,7 +148,7 @@ async def update_usuario(
         
         # Si se actualiza el correo, verificar que no exista
         if "correo" in update_data:
-            email_check = db.table("usuario").select("id_user").eq("correo", update_data["correo"]).neq("id_user", id_user).execute()
+            email_check = await db.table("usuario").select("id_user").eq("correo", update_data["correo"]).neq("id_user", id_user).execute()
             if email_check.data:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -151,13 +156,17 @@ async def update_usuario(
                 )
         
         # Actualizar
-        response = db.table("usuario").update(update_data).eq("id_user", id_user).execute()
+        response = await db.table("usuario").update(update_data).eq("id_user", id_user).execute()
+        invalidar_usuario(id_user)
+        # Docentes y materias incluyen los datos del usuario del docente
+        catalogo_cache.invalidar(DOCENTES, MATERIAS)
         
         if not response.data:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error al actualizar usuario"
             )
+        indice_usuarios.actualizar(response.data[0])
         
         updated_user = response.data[0]
         
@@ -178,7 +187,7 @@ async def update_usuario(
 @router.delete("/{id_user}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_usuario(
     id_user: str,
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """
@@ -187,7 +196,7 @@ async def delete_usuario(
     """
     try:
         # Verificar que existe
-        existing = db.table("usuario").select("id_user").eq("id_user", id_user).execute()
+        existing = await db.table("usuario").select("id_user").eq("id_user", id_user).execute()
         
         if not existing.data:
             raise HTTPException(
@@ -196,7 +205,13 @@ async def delete_usuario(
             )
         
         # Desactivar en lugar de eliminar
-        db.table("usuario").update({"activo": False}).eq("id_user", id_user).execute()
+        await db.table("usuario").update({"activo": False}).eq("id_user", id_user).execute()
+        invalidar_usuario(id_user)
+        indice_usuarios.eliminar(id_user)
+        # Deja de ser amigo, compañero sugerido y lector de timelines al momento
+        grafo_amigos.eliminar_usuario(id_user)
+        companeros.eliminar_usuario(id_user)
+        catalogo_cache.invalidar(DOCENTES, MATERIAS)
         
         return None
         
@@ -212,20 +227,28 @@ async def delete_usuario(
 @router.get("/search/query")
 async def search_usuarios(
     q: str = Query(..., min_length=2),
+    skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
-    db: Client = Depends(get_db),
+    db: AsyncClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
     Buscar usuarios por nombre, apellido o correo
+
+    Usa el índice en memoria (sin tildes, tolerante a errores de tipeo y
+    ordenado por relevancia); mientras no esté cargado consulta la base de datos.
     """
     try:
-        # Buscar en nombre, apellido o correo
-        response = db.table("usuario").select("*").or_(
-            f"nombre.ilike.%{q}%,apellido.ilike.%{q}%,correo.ilike.%{q}%"
-        ).eq("activo", True).limit(limit).execute()
+        if indice_usuarios.cargado:
+            encontrados = indice_usuarios.buscar(q, skip=skip, limit=limit)
+        else:
+            # Buscar en nombre, apellido o correo
+            response = await db.table("usuario").select("*").or_(
+                f"nombre.ilike.%{q}%,apellido.ilike.%{q}%,correo.ilike.%{q}%"
+            ).eq("activo", True).range(skip, skip + limit - 1).execute()
+            encontrados = response.data
         
-        if not response.data:
+        if not encontrados:
             return []
             
         # Retornar solo información pública
@@ -240,7 +263,7 @@ async def search_usuarios(
                 "activo": user.get("activo", True),
                 "fecha_registro": user.get("fecha_registro", datetime.now().isoformat())
             }
-            for user in response.data
+            for user in encontrados
         ]
         
         return usuarios
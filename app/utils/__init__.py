@@ -12,6 +12,11 @@ from app.utils.dependencies import (
     get_current_user,
     get_current_active_user,
     require_role,
+    invalidar_usuario,
+)
+from app.utils.loaders import (
+    UserLoader,
+    get_user_loader,
 )
 
 __all__ = [
@@ -25,4 +30,8 @@ __all__ = [
     "get_current_user",
     "get_current_active_user",
     "require_role",
+    "invalidar_usuario",
+    # Loaders
+    "UserLoader",
+    "get_user_loader",
 ]
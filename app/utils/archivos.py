@@ -0,0 +1,494 @@
+"""
+Lectura de archivos subidos por bloques
+
+Los archivos se copian a un temporal en disco de a bloques, descartándolos
+con 413 en cuanto superan el tamaño máximo, y su tipo se determina por el
+contenido (firma o "magic bytes", marcas de la caja ftyp, entradas del ZIP)
+en lugar de confiar en el Content-Type que envía el cliente. Starlette recibe
+el cuerpo multipart completo antes de que la ruta lo lea, así que el único
+rechazo previo a recibir los bytes es el control de Content-Length de las
+rutas de upload.
+
+Mientras se lee se calcula el SHA-256 del contenido subido, que sirve para
+reconocer un archivo ya almacenado antes de procesarlo. Los archivos se
+guardan en el bucket bajo una ruta derivada del hash de los bytes
+almacenados (las imágenes se reescriben sin EXIF antes de subirlas), de modo
+que un mismo archivo subido por muchos usuarios se almacena una sola vez.
+
+Los metadatos de cada archivo subido (hash, derivados de imágenes,
+dimensiones) se registran en la tabla `archivo` y se copian a `media` al crear
+la publicación. Los archivos que nadie usa (sin media, sin ser foto de perfil
+y sin entregarse como duplicado recientemente) se borran periódicamente: la
+base de datos decide qué filas borrar y las marca (add_borrado_archivos.sql),
+luego se eliminan los objetos del bucket y recién entonces las filas, de modo
+que un fallo del bucket deja la fila marcada para reintentar en vez de un
+objeto huérfano. Las subidas firmadas que nunca se completaron se recolectan
+igual (add_subidas_firmadas.sql).
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Union
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+from supabase import AsyncClient
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import zipfile
+
+from app.config import settings
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de cada bloque leído del archivo subido
+TAM_BLOQUE = 256 * 1024
+
+# Bytes iniciales necesarios para reconocer cualquier firma conocida (alcanza
+# para la caja ftyp con varias marcas compatibles)
+TAM_CABECERA = 64
+
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Tipo provisional de un contenedor ZIP: solo se acepta si es un .docx (ver es_docx)
+ZIP = "application/zip"
+
+# Marcas ISO BMFF (caja ftyp) de video; HEIC, AVIF y audio M4A también usan ftyp
+MARCAS_MP4 = {b"isom", b"iso2", b"iso4", b"iso5", b"iso6", b"mp41", b"mp42", b"avc1", b"dash", b"M4V ", b"mmp4", b"MSNV"}
+MARCAS_QUICKTIME = {b"qt  "}
+MARCAS_NO_VIDEO = {
+    b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1",
+    b"avif", b"avis", b"M4A ", b"M4B ", b"M4P ",
+}
+
+
+@dataclass
+class ArchivoTemporal:
+    """Archivo subido ya copiado a disco"""
+    ruta: str
+    tamano: int
+    content_type: str
+    nombre: str
+    sha256: str = ""
+
+    def eliminar(self) -> None:
+        try:
+            os.remove(self.ruta)
+        except OSError:
+            pass
+
+
+# Metadatos de `archivo` que se copian a cada fila de media
+CAMPOS_DERIVADOS = ("variantes", "placeholder", "ancho", "alto")
+
+# Extensión usada en la ruta del bucket según el tipo detectado
+EXTENSIONES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "application/pdf": ".pdf",
+    "video/mp4": ".mp4",
+    "video/quicktime": ".mov",
+    "video/webm": ".webm",
+    "video/mpeg": ".mpeg",
+    "application/msword": ".doc",
+    DOCX: ".docx",
+}
+
+
+def _tipo_ftyp(cabecera: bytes) -> Optional[str]:
+    """
+    Tipo de un archivo ISO BMFF según las marcas de su caja ftyp
+
+    Decide la marca principal; si no es conocida, las compatibles (siempre que
+    ninguna sea de imagen o audio).
+    """
+    tamano = int.from_bytes(cabecera[:4], "big")
+    principal = cabecera[8:12]
+    compatibles = {cabecera[i:i + 4] for i in range(16, min(tamano, len(cabecera)) - 3, 4)}
+    if principal in MARCAS_QUICKTIME:
+        return "video/quicktime"
+    if principal in MARCAS_MP4:
+        return "video/mp4"
+    if principal in MARCAS_NO_VIDEO or compatibles & MARCAS_NO_VIDEO:
+        return None
+    if compatibles & MARCAS_QUICKTIME:
+        return "video/quicktime"
+    if compatibles & MARCAS_MP4:
+        return "video/mp4"
+    return None
+
+
+def detectar_tipo(cabecera: bytes) -> Optional[str]:
+    """
+    Determina el tipo MIME a partir de los primeros bytes del archivo
+
+    Returns:
+        Tipo MIME, `ZIP` si es un contenedor ZIP (hay que revisar sus entradas
+        con `es_docx`) o None si la firma no es reconocida
+    """
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if cabecera[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "image/webp"
+    if cabecera.startswith(b"%PDF-"):
+        return "application/pdf"
+    if cabecera[4:8] == b"ftyp":
+        return _tipo_ftyp(cabecera)
+    if cabecera.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    if cabecera[:4] in (b"\x00\x00\x01\xba", b"\x00\x00\x01\xb3"):
+        return "video/mpeg"
+    if cabecera.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return "application/msword"
+    if cabecera.startswith(b"PK\x03\x04"):
+        return ZIP
+    return None
+
+
+def es_docx(origen: Union[str, BinaryIO]) -> bool:
+    """
+    True si el ZIP (ruta o archivo abierto) es un documento de Word: tiene
+    `[Content_Types].xml` y entradas bajo `word/`
+    """
+    try:
+        with zipfile.ZipFile(origen) as contenedor:
+            nombres = contenedor.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return False
+    return "[Content_Types].xml" in nombres and any(n.startswith("word/") for n in nombres)
+
+
+def detectar_tipo_archivo(ruta: str, cabecera: bytes) -> Optional[str]:
+    """
+    Tipo MIME de un archivo en disco; los ZIP se aceptan solo si son .docx
+
+    Lee el directorio del ZIP: llamar fuera del event loop.
+    """
+    content_type = detectar_tipo(cabecera)
+    if content_type == ZIP:
+        return DOCX if es_docx(ruta) else None
+    return content_type
+
+
+async def guardar_temporal(archivo: UploadFile, max_bytes: int) -> ArchivoTemporal:
+    """
+    Copia un archivo subido a disco por bloques validando tamaño y tipo, y
+    calcula su SHA-256 en el mismo recorrido
+
+    Args:
+        archivo: Archivo recibido en la petición
+        max_bytes: Tamaño máximo permitido
+
+    Returns:
+        Archivo temporal con su tamaño y tipo detectado (el llamador debe
+        eliminarlo con `eliminar()`)
+
+    Raises:
+        HTTPException: 413 si excede el tamaño, 400 si el tipo no es reconocido
+    """
+    descriptor, ruta = tempfile.mkstemp(prefix="upload_")
+    temporal = ArchivoTemporal(ruta=ruta, tamano=0, content_type="", nombre=archivo.filename or "")
+    hash_contenido = hashlib.sha256()
+
+    try:
+        with os.fdopen(descriptor, "wb") as destino:
+            cabecera = b""
+            while True:
+                bloque = await archivo.read(TAM_BLOQUE)
+                if not bloque:
+                    break
+
+                temporal.tamano += len(bloque)
+                if temporal.tamano > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Archivo {archivo.filename} excede el tamaño máximo de {max_bytes // (1024 * 1024)}MB"
+                    )
+
+                if len(cabecera) < TAM_CABECERA:
+                    cabecera += bloque[:TAM_CABECERA - len(cabecera)]
+                hash_contenido.update(bloque)
+                await run_in_threadpool(destino.write, bloque)
+
+        content_type = await run_in_threadpool(detectar_tipo_archivo, ruta, cabecera)
+        if content_type is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Tipo de archivo no reconocido: {archivo.filename}"
+            )
+        temporal.content_type = content_type
+        temporal.sha256 = hash_contenido.hexdigest()
+        return temporal
+    except Exception:
+        temporal.eliminar()
+        raise
+
+
+async def obtener_metadatos(db: AsyncClient, urls: List[str]) -> Dict[str, dict]:
+    """
+    Metadatos registrados al subir cada URL (derivados, dimensiones)
+
+    Returns:
+        Diccionario url -> fila de `archivo`; vacío si no hay registros
+    """
+    if not urls:
+        return {}
+    try:
+        response = await db.table("archivo")\
+            .select("url, " + ", ".join(CAMPOS_DERIVADOS))\
+            .in_("url", urls)\
+            .execute()
+        return {a["url"]: a for a in response.data or []}
+    except Exception as e:
+        logger.warning(f"No se pudieron obtener los metadatos de los archivos: {e}")
+        return {}
+
+
+def calcular_sha256(ruta: str) -> str:
+    """SHA-256 de un archivo en disco, leído por bloques (llamar desde un hilo)"""
+    hash_contenido = hashlib.sha256()
+    with open(ruta, "rb") as origen:
+        for bloque in iter(lambda: origen.read(TAM_BLOQUE), b""):
+            hash_contenido.update(bloque)
+    return hash_contenido.hexdigest()
+
+
+async def buscar_por_hash(db: AsyncClient, hashes: List[str]) -> Dict[str, dict]:
+    """
+    Archivos ya almacenados cuyo contenido subido o almacenado tiene alguno de
+    los hashes indicados (los marcados para borrar no cuentan)
+
+    Returns:
+        Diccionario hash buscado -> fila de `archivo`; vacío si no hay
+        coincidencias o la deduplicación no está habilitada en la base de datos
+    """
+    if not hashes:
+        return {}
+    buscados = set(hashes)
+    lista = ",".join(buscados)
+    try:
+        response = await db.table("archivo")\
+            .select("*")\
+            .or_(f"sha256.in.({lista}),sha256_subida.in.({lista})")\
+            .is_("eliminando_en", "null")\
+            .execute()
+    except Exception as e:
+        logger.warning(f"No se pudo consultar la deduplicación de archivos: {e}")
+        return {}
+    encontrados = {}
+    for fila in response.data or []:
+        for clave in (fila.get("sha256_subida"), fila["sha256"]):
+            if clave in buscados:
+                encontrados.setdefault(clave, fila)
+    return encontrados
+
+
+async def marcar_reutilizados(db: AsyncClient, hashes: List[str]) -> None:
+    """
+    Registra que estos contenidos se entregaron como duplicados, para que no
+    se borren antes de que la publicación que los usa cree su fila de media
+    """
+    if not hashes:
+        return
+    try:
+        await db.table("archivo")\
+            .update({"reutilizado_en": datetime.utcnow().isoformat()})\
+            .in_("sha256", list(set(hashes)))\
+            .execute()
+    except Exception as e:
+        logger.warning(f"No se pudo marcar la reutilización de {len(hashes)} archivos: {e}")
+
+
+def rutas_en_bucket(fila: dict) -> List[str]:
+    """Rutas del bucket de un archivo registrado: el original y sus variantes"""
+    rutas = [fila["ruta"]]
+    variantes = fila.get("variantes") or {}
+    rutas.extend(url.split("/media/", 1)[1] for url in variantes.values() if "/media/" in url)
+    return rutas
+
+
+def _intervalo(segundos: float) -> str:
+    return f"{int(segundos)} seconds"
+
+
+async def _confirmar_borrado(db: AsyncClient, rutas: List[str]) -> None:
+    """Borra las filas marcadas cuyos objetos ya se eliminaron del bucket"""
+    await db.table("archivo")\
+        .delete()\
+        .in_("ruta", rutas)\
+        .not_.is_("eliminando_en", "null")\
+        .execute()
+
+
+async def eliminar_sin_uso(db: AsyncClient, ruta: str) -> bool:
+    """
+    Elimina un archivo del bucket y de la base si nadie lo usa
+
+    La fila se marca primero y se borra solo después de eliminar los objetos;
+    si el bucket falla queda marcada y la recolección reintenta.
+
+    Returns:
+        True si se eliminó; False si sigue en uso
+    """
+    response = await db.rpc("marcar_archivo_sin_uso", {
+        "p_ruta": ruta,
+        "p_gracia": _intervalo(settings.ARCHIVOS_GRACIA_SECONDS)
+    }).execute()
+    if not response.data:
+        return False
+    await db.storage.from_("media").remove(rutas_en_bucket(response.data[0]))
+    await _confirmar_borrado(db, [ruta])
+    return True
+
+
+async def registrar_subida_firmada(db: AsyncClient, ruta: str, id_user: str) -> None:
+    """Registra una subida firmada pendiente para recolectarla si no se completa"""
+    await db.table("subida_firmada").insert({"ruta": ruta, "id_user": id_user}).execute()
+
+
+async def quitar_subida_firmada(db: AsyncClient, ruta: str) -> None:
+    """Quita una subida firmada ya completada (o descartada) de las pendientes"""
+    try:
+        await db.table("subida_firmada").delete().eq("ruta", ruta).execute()
+    except Exception as e:
+        # Si queda la fila, la recolección intentará borrar un objeto registrado
+        logger.error(f"No se pudo quitar la subida firmada pendiente {ruta}: {e}")
+
+
+class RecoleccionArchivos:
+    """
+    Borra periódicamente los archivos subidos que nunca se usaron y las
+    subidas firmadas que nunca se completaron
+    """
+
+    def __init__(
+        self,
+        intervalo: float = 3600,
+        gracia: float = 86400,
+        vigencia_firma: float = 900,
+        tam_lote: int = 200
+    ):
+        self.intervalo = intervalo
+        self.gracia = gracia
+        self.vigencia_firma = vigencia_firma
+        self.tam_lote = tam_lote
+        self._tarea: Optional[asyncio.Task] = None
+        self.ejecuciones = 0
+        self.eliminados = 0
+        self.subidas_vencidas = 0
+
+    async def iniciar(self) -> None:
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def cerrar(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    async def recolectar(self, db: AsyncClient) -> int:
+        """
+        Elimina los archivos sin uso más antiguos que el período de gracia
+
+        Returns:
+            Cantidad de archivos eliminados
+        """
+        eliminados = 0
+        while True:
+            response = await db.rpc("marcar_archivos_sin_uso", {
+                "p_gracia": _intervalo(self.gracia),
+                "p_reintento": _intervalo(self.intervalo),
+                "p_limite": self.tam_lote
+            }).execute()
+            filas = response.data or []
+            rutas = [r for fila in filas for r in rutas_en_bucket(fila)]
+            if rutas:
+                try:
+                    await db.storage.from_("media").remove(rutas)
+                except Exception as e:
+                    # Las filas quedan marcadas y se reintentan en otra pasada
+                    logger.error(f"No se pudieron eliminar {len(rutas)} objetos del bucket: {e}")
+                    break
+                await _confirmar_borrado(db, [fila["ruta"] for fila in filas])
+            eliminados += len(filas)
+            if len(filas) < self.tam_lote:
+                break
+        self.ejecuciones += 1
+        self.eliminados += eliminados
+        if eliminados:
+            logger.info(f"Se eliminaron {eliminados} archivos sin uso")
+        return eliminados
+
+    async def recolectar_subidas(self, db: AsyncClient) -> int:
+        """
+        Elimina del bucket las subidas firmadas cuyo token venció hace más
+        que el período de gracia sin que se completaran
+
+        Returns:
+            Cantidad de subidas eliminadas
+        """
+        vencidas = 0
+        while True:
+            response = await db.rpc("recolectar_subidas_firmadas", {
+                "p_antiguedad": _intervalo(self.vigencia_firma + self.gracia),
+                "p_limite": self.tam_lote
+            }).execute()
+            rutas = [fila["ruta"] for fila in response.data or []]
+            if rutas:
+                try:
+                    await db.storage.from_("media").remove(rutas)
+                except Exception as e:
+                    logger.error(f"No se pudieron eliminar {len(rutas)} subidas firmadas del bucket: {e}")
+            vencidas += len(rutas)
+            if len(rutas) < self.tam_lote:
+                break
+        self.subidas_vencidas += vencidas
+        if vencidas:
+            logger.info(f"Se eliminaron {vencidas} subidas firmadas sin completar")
+        return vencidas
+
+    async def _bucle(self) -> None:
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await self.recolectar(await get_db())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"No se pudieron recolectar los archivos sin uso: {e}")
+            try:
+                await self.recolectar_subidas(await get_db())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"No se pudieron recolectar las subidas firmadas: {e}")
+
+    def stats(self) -> dict:
+        """
+        Métricas de la recolección para /health
+        """
+        return {
+            "ejecuciones": self.ejecuciones,
+            "eliminados": self.eliminados,
+            "subidas_vencidas": self.subidas_vencidas,
+        }
+
+
+# Recolección global de la aplicación
+recoleccion_archivos = RecoleccionArchivos(
+    intervalo=settings.ARCHIVOS_RECOLECCION_SECONDS,
+    gracia=settings.ARCHIVOS_GRACIA_SECONDS,
+    vigencia_firma=settings.SIGNED_UPLOAD_EXPIRE_MINUTES * 60
+)
@@ -0,0 +1,287 @@
+"""
+Asignación en lote de pasajeros a rutas de carpooling
+
+Aceptar pasajeros uno por uno deja autos medio vacíos mientras otros
+estudiantes se quedan sin viaje. Para un día y una franja horaria se toman
+todas las solicitudes pendientes de las rutas activas con lugares y se propone
+una asignación que respeta la capacidad de cada ruta, sirve a la mayor
+cantidad de pasajeros y, entre esas, minimiza el desvío total:
+
+1. Costo: el desvío de llevar a un pasajero en una ruta es ir y volver desde el
+   recorrido hasta su punto de recogida (2 * distancia a la polilínea). Las
+   distancias de todas las solicitudes de una ruta se calculan en lote
+   (vectorizadas con numpy si está instalado).
+2. Voraz: se recorren las solicitudes de menor a mayor desvío y se asignan
+   mientras la ruta tenga lugar.
+3. Mejora local hasta que no haya cambios:
+   - un pasajero sin asignar entra a una ruta llena si alguien de ella puede
+     pasar a otra de sus rutas con lugar (suma un pasajero servido);
+   - un pasajero se cambia a otra de sus rutas con lugar si su desvío baja;
+   - dos pasajeros intercambian rutas si el desvío total baja.
+
+Cada pasajero solo se propone en rutas a las que postuló. Es una propuesta: el
+conductor acepta con PUT /pasajeros/{id}, que sigue validando la capacidad.
+Las solicitudes sin coordenadas de recogida no se consideran, ni las de
+quien ya tiene lugar aceptado en otra ruta de la misma franja.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from supabase import AsyncClient
+import time
+
+from app.config import settings
+from app.utils.cache import TTLCache
+from app.utils.geo import Punto, coordenadas, distancias_a_linea
+from app.utils.indice_rutas import indice_rutas
+from app.utils.indices import leer_en_lotes
+
+# Rutas por consulta in_() al cargar solicitudes (cada lote se lee por páginas)
+TAM_LOTE_RUTAS = 200
+
+# Mejora mínima (metros) para aceptar un cambio; evita ciclos por redondeo
+EPSILON = 1e-6
+
+# Rondas máximas de mejora local
+MAX_RONDAS = 20
+
+
+class Asignador:
+    """
+    Estado de una asignación: qué ruta tiene cada pasajero y cuántos lugares
+    quedan en cada ruta
+    """
+
+    def __init__(self, costos: Dict[str, Dict[str, Tuple[float, str]]], lugares: Dict[str, int]):
+        # id_user -> id_ruta -> (desvío, id_pasajero_ruta)
+        self.costos = costos
+        self.libres = dict(lugares)
+        self.asignado: Dict[str, str] = {}
+        self.ocupantes: Dict[str, Set[str]] = defaultdict(set)
+        self.mejoras = 0
+
+    def costo(self, id_user: str, id_ruta: str) -> float:
+        return self.costos[id_user][id_ruta][0]
+
+    def _asignar(self, id_user: str, id_ruta: str) -> None:
+        anterior = self.asignado.get(id_user)
+        if anterior is not None:
+            self.ocupantes[anterior].discard(id_user)
+            self.libres[anterior] += 1
+        self.asignado[id_user] = id_ruta
+        self.ocupantes[id_ruta].add(id_user)
+        self.libres[id_ruta] -= 1
+
+    def voraz(self) -> None:
+        """Asigna las solicitudes de menor a mayor desvío mientras haya lugar"""
+        aristas = sorted(
+            (c, id_user, id_ruta)
+            for id_user, rutas in self.costos.items()
+            for id_ruta, (c, _) in rutas.items()
+        )
+        for _, id_user, id_ruta in aristas:
+            if id_user not in self.asignado and self.libres.get(id_ruta, 0) > 0:
+                self._asignar(id_user, id_ruta)
+
+    def _insertar(self, id_user: str) -> bool:
+        """Intenta servir a un pasajero sin asignar, liberando lugar si hace falta"""
+        mejor: Optional[Tuple[float, str, Optional[str], Optional[str]]] = None
+        for id_ruta in self.costos[id_user]:
+            entrada = self.costo(id_user, id_ruta)
+            if self.libres.get(id_ruta, 0) > 0:
+                opcion = (entrada, id_ruta, None, None)
+                if mejor is None or opcion[0] < mejor[0]:
+                    mejor = opcion
+                continue
+            # Ruta llena: mover a un ocupante a otra de sus rutas con lugar
+            for otro in self.ocupantes[id_ruta]:
+                for destino in self.costos[otro]:
+                    if destino != id_ruta and self.libres.get(destino, 0) > 0:
+                        delta = entrada + self.costo(otro, destino) - self.costo(otro, id_ruta)
+                        if mejor is None or delta < mejor[0]:
+                            mejor = (delta, id_ruta, otro, destino)
+        if mejor is None:
+            return False
+        _, id_ruta, otro, destino = mejor
+        if otro is not None:
+            self._asignar(otro, destino)
+        self._asignar(id_user, id_ruta)
+        return True
+
+    def _mover(self, id_user: str) -> bool:
+        """Cambia a un pasajero a otra de sus rutas con lugar si baja el desvío"""
+        actual = self.asignado[id_user]
+        actual_costo = self.costo(id_user, actual)
+        mejor = min(
+            (
+                (self.costo(id_user, r), r)
+                for r in self.costos[id_user]
+                if r != actual and self.libres.get(r, 0) > 0
+            ),
+            default=None
+        )
+        if mejor is not None and mejor[0] < actual_costo - EPSILON:
+            self._asignar(id_user, mejor[1])
+            return True
+        return False
+
+    def _intercambiar(self, id_user: str) -> bool:
+        """Intercambia rutas con otro pasajero si baja el desvío total"""
+        actual = self.asignado[id_user]
+        for otra in self.costos[id_user]:
+            if otra == actual:
+                continue
+            for otro in list(self.ocupantes[otra]):
+                if actual not in self.costos[otro]:
+                    continue
+                delta = (
+                    self.costo(id_user, otra) + self.costo(otro, actual)
+                    - self.costo(id_user, actual) - self.costo(otro, otra)
+                )
+                if delta < -EPSILON:
+                    # Liberar un lugar primero para no pasar la capacidad en el medio
+                    self.ocupantes[otra].discard(otro)
+                    self.libres[otra] += 1
+                    del self.asignado[otro]
+                    self._asignar(id_user, otra)
+                    self._asignar(otro, actual)
+                    return True
+        return False
+
+    def mejorar(self, max_rondas: int = MAX_RONDAS) -> None:
+        """Aplica las mejoras locales hasta que ninguna cambie la asignación"""
+        for _ in range(max_rondas):
+            cambios = 0
+            for id_user in self.costos:
+                if id_user not in self.asignado:
+                    cambios += self._insertar(id_user)
+            for id_user in list(self.asignado):
+                cambios += self._mover(id_user) or self._intercambiar(id_user)
+            self.mejoras += cambios
+            if not cambios:
+                return
+
+    def desvio_total(self) -> float:
+        return sum(self.costo(u, r) for u, r in self.asignado.items())
+
+
+def optimizar(
+    solicitudes: List[dict],
+    lineas: Dict[str, List[Punto]],
+    lugares: Dict[str, int]
+) -> dict:
+    """
+    Propone una asignación de solicitudes pendientes a rutas
+
+    Args:
+        solicitudes: Filas de pasajeroruta (id_pasajero_ruta, id_user, id_ruta,
+            lat_recogida, lon_recogida)
+        lineas: Polilínea de cada ruta
+        lugares: Lugares libres de cada ruta
+
+    Returns:
+        {"asignaciones": {id_ruta: [{id_pasajero_ruta, id_user, desvio_m}]},
+         "resumen": {...}}
+    """
+    inicio = time.perf_counter()
+
+    # Matriz de desvíos: una llamada en lote por ruta
+    por_ruta: Dict[str, List[Tuple[dict, Punto]]] = defaultdict(list)
+    sin_ubicacion = 0
+    for solicitud in solicitudes:
+        punto = coordenadas(solicitud.get("lat_recogida"), solicitud.get("lon_recogida"))
+        if punto is None:
+            sin_ubicacion += 1
+        elif lineas.get(solicitud["id_ruta"]) and lugares.get(solicitud["id_ruta"], 0) > 0:
+            por_ruta[solicitud["id_ruta"]].append((solicitud, punto))
+
+    costos: Dict[str, Dict[str, Tuple[float, str]]] = defaultdict(dict)
+    for id_ruta, filas in por_ruta.items():
+        distancias = distancias_a_linea([p for _, p in filas], lineas[id_ruta])
+        for (solicitud, _), distancia in zip(filas, distancias):
+            costos[solicitud["id_user"]][id_ruta] = (2 * distancia, solicitud["id_pasajero_ruta"])
+
+    asignador = Asignador(costos, lugares)
+    asignador.voraz()
+    asignados_voraz, desvio_voraz = len(asignador.asignado), asignador.desvio_total()
+    asignador.mejorar()
+
+    asignaciones: Dict[str, List[dict]] = defaultdict(list)
+    for id_user, id_ruta in asignador.asignado.items():
+        desvio, id_pasajero_ruta = costos[id_user][id_ruta]
+        asignaciones[id_ruta].append({
+            "id_pasajero_ruta": id_pasajero_ruta,
+            "id_user": id_user,
+            "desvio_m": round(desvio),
+        })
+    for pasajeros in asignaciones.values():
+        pasajeros.sort(key=lambda p: p["desvio_m"])
+
+    return {
+        "asignaciones": dict(asignaciones),
+        "resumen": {
+            "solicitudes": len(solicitudes),
+            "sin_ubicacion": sin_ubicacion,
+            "pasajeros": len(costos),
+            "rutas": len(por_ruta),
+            "asignados": len(asignador.asignado),
+            "sin_asignar": len(costos) - len(asignador.asignado),
+            "desvio_total_m": round(asignador.desvio_total()),
+            "asignados_voraz": asignados_voraz,
+            "desvio_voraz_m": round(desvio_voraz),
+            "mejoras": asignador.mejoras,
+            "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        },
+    }
+
+
+class PropuestasAsignacion:
+    """
+    Propuestas por (días, franja horaria), recalculadas cada `ttl` segundos
+    """
+
+    def __init__(self, maxsize: int = 64, ttl: float = 60):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def obtener(self, db: AsyncClient, dias: int, desde: int, hasta: int) -> dict:
+        """
+        Propuesta para las rutas que salen alguno de `dias` (máscara) entre los
+        minutos `desde` y `hasta`
+        """
+        clave = (dias, desde, hasta)
+        propuesta = self._cache.get(clave)
+        if propuesta is not None:
+            return propuesta
+
+        await indice_rutas.asegurar_cargado(db)
+        ids = [id_ruta for _, id_ruta in indice_rutas.filtrar(dias, desde, hasta, lugares_min=1)]
+        solicitudes = await leer_en_lotes(
+            db, "pasajeroruta", "id_pasajero_ruta, id_user, id_ruta, lat_recogida, lon_recogida",
+            "id_pasajero_ruta", "id_ruta", ids, tam_lote=TAM_LOTE_RUTAS, estado="pendiente"
+        )
+
+        # Quien ya tiene lugar en una ruta de la misma franja (llena o no) no se propone de nuevo
+        en_franja = [id_ruta for _, id_ruta in indice_rutas.filtrar(dias, desde, hasta)]
+        aceptados = await leer_en_lotes(
+            db, "pasajeroruta", "id_pasajero_ruta, id_user", "id_pasajero_ruta",
+            "id_ruta", en_franja, tam_lote=TAM_LOTE_RUTAS, estado="aceptado"
+        )
+        con_lugar = {a["id_user"] for a in aceptados}
+        solicitudes = [s for s in solicitudes if s["id_user"] not in con_lugar]
+
+        lineas = {i: indice_rutas.linea(i) for i in ids if indice_rutas.linea(i)}
+        lugares = {i: indice_rutas.lugares_disponibles(i) for i in ids}
+        # La optimización es CPU pura: fuera del event loop
+        propuesta = await run_in_threadpool(optimizar, solicitudes, lineas, lugares)
+        self._cache.set(clave, propuesta)
+        return propuesta
+
+    def stats(self) -> dict:
+        """
+        Métricas de la caché para /health
+        """
+        return self._cache.stats()
+
+
+# Propuestas globales de la aplicación
+propuestas_asignacion = PropuestasAsignacion(ttl=settings.ASIGNACION_CACHE_TTL)
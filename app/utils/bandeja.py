@@ -0,0 +1,208 @@
+"""
+Bandeja de entrada de conversaciones
+
+Arma la bandeja de un usuario con un número constante de consultas: las
+membresías del usuario y, para la página pedida, participantes, último
+mensaje y mensajes no leídos en paralelo. El último mensaje se toma del
+resumen guardado en conversacion (ver add_resumen_conversacion.sql), que se
+mantiene al enviar y eliminar mensajes. Los no leídos se cuentan agrupados en
+la base (add_no_leidos_conversacion.sql); sin esa migración, con un conteo
+por conversación.
+"""
+from typing import Dict, List, Optional
+from supabase import AsyncClient
+import asyncio
+import logging
+
+from app.utils.lotes import es_funcion_inexistente
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_PARTICIPANTE = "usuario:usuario(id_user, nombre, apellido, foto_perfil)"
+CAMPOS_ULTIMO_MENSAJE = "*, usuario:usuario(nombre, apellido)"
+
+
+def _fecha_actividad(conv: dict) -> str:
+    """Fecha de última actividad de una conversación (ISO, comparable como texto)"""
+    return conv.get("fecha_ultimo_mensaje") or conv.get("fecha_creacion") or ""
+
+
+async def obtener_bandeja(
+    db: AsyncClient,
+    id_user: str,
+    skip: int = 0,
+    limit: int = 50
+) -> List[dict]:
+    """
+    Obtiene las conversaciones de un usuario ordenadas por última actividad
+
+    Args:
+        db: Cliente de base de datos
+        id_user: Usuario dueño de la bandeja
+        skip: Conversaciones a saltar
+        limit: Máximo de conversaciones a devolver
+
+    Returns:
+        Conversaciones con participantes, ultimo_mensaje y mensajes_no_leidos
+    """
+    membresias = await db.table("usuarioconversacion")\
+        .select("id_conversacion, conversacion:conversacion(*)")\
+        .eq("id_usuario", id_user)\
+        .execute()
+
+    conversaciones: Dict[str, dict] = {}
+    for item in membresias.data or []:
+        conv = item.get("conversacion")
+        if conv and conv["id_conversacion"] not in conversaciones:
+            conversaciones[conv["id_conversacion"]] = conv
+
+    pagina = sorted(conversaciones.values(), key=_fecha_actividad, reverse=True)[skip:skip + limit]
+    if not pagina:
+        return []
+
+    ids = [c["id_conversacion"] for c in pagina]
+    ultimos_ids = [c["ultimo_mensaje_id"] for c in pagina if c.get("ultimo_mensaje_id")]
+    sin_resumen = [c["id_conversacion"] for c in pagina if "ultimo_mensaje_id" not in c]
+
+    participantes_q = db.table("usuarioconversacion")\
+        .select(f"id_conversacion, {CAMPOS_PARTICIPANTE}")\
+        .in_("id_conversacion", ids)\
+        .execute()
+    no_leidos_q = _contar_no_leidos(db, ids, id_user)
+    ultimos_q = _obtener_ultimos_mensajes(db, ultimos_ids, sin_resumen)
+
+    participantes, no_leidos, ultimos = await asyncio.gather(participantes_q, no_leidos_q, ultimos_q)
+
+    por_conversacion: Dict[str, List[dict]] = {}
+    for p in participantes.data or []:
+        usuario = p.get("usuario")
+        if usuario and usuario["id_user"] != id_user:
+            por_conversacion.setdefault(p["id_conversacion"], []).append(usuario)
+
+    for conv in pagina:
+        conv_id = conv["id_conversacion"]
+        conv["participantes"] = por_conversacion.get(conv_id, [])
+        conv["ultimo_mensaje"] = ultimos.get(conv_id)
+        conv["mensajes_no_leidos"] = no_leidos.get(conv_id, 0)
+        if conv["ultimo_mensaje"] and not conv.get("fecha_ultimo_mensaje"):
+            conv["fecha_ultimo_mensaje"] = conv["ultimo_mensaje"].get("fecha_envio")
+
+    if sin_resumen:
+        # Sin resumen el orden solo se conoce después de leer los últimos mensajes
+        pagina.sort(key=_fecha_actividad, reverse=True)
+
+    return pagina
+
+
+async def _contar_no_leidos(db: AsyncClient, ids: List[str], id_user: str) -> Dict[str, int]:
+    """
+    Mensajes de otros participantes sin leer, por conversación
+    """
+    try:
+        response = await db.rpc("contar_no_leidos", {"p_ids": ids, "p_id_user": id_user}).execute()
+        return {f["id_conversacion"]: f["no_leidos"] for f in response.data or []}
+    except Exception as e:
+        if not es_funcion_inexistente(e):
+            raise
+
+    # Sin la migración: un conteo exacto por conversación, sin descargar filas
+    respuestas = await asyncio.gather(*(
+        db.table("mensaje")
+        .select("id_mensaje", count="exact")
+        .eq("id_conversacion", conv_id)
+        .eq("leido", False)
+        .neq("id_user", id_user)
+        .limit(1)
+        .execute()
+        for conv_id in ids
+    ))
+    return {conv_id: response.count or 0 for conv_id, response in zip(ids, respuestas)}
+
+
+async def _obtener_ultimos_mensajes(
+    db: AsyncClient,
+    ultimos_ids: List[str],
+    sin_resumen: List[str]
+) -> Dict[str, dict]:
+    """
+    Último mensaje por conversación: una consulta para las que tienen resumen
+    y, mientras la migración no esté aplicada, una por conversación en paralelo
+    """
+    resultado: Dict[str, dict] = {}
+
+    if ultimos_ids:
+        response = await db.table("mensaje")\
+            .select(CAMPOS_ULTIMO_MENSAJE)\
+            .in_("id_mensaje", ultimos_ids)\
+            .execute()
+        for m in response.data or []:
+            resultado[m["id_conversacion"]] = m
+
+    if sin_resumen:
+        respuestas = await asyncio.gather(*(
+            db.table("mensaje")
+            .select(CAMPOS_ULTIMO_MENSAJE)
+            .eq("id_conversacion", conv_id)
+            .order("fecha_envio", desc=True)
+            .limit(1)
+            .execute()
+            for conv_id in sin_resumen
+        ))
+        for conv_id, response in zip(sin_resumen, respuestas):
+            if response.data:
+                resultado[conv_id] = response.data[0]
+
+    return resultado
+
+
+async def registrar_ultimo_mensaje(db: AsyncClient, mensaje: dict) -> None:
+    """
+    Actualiza el resumen de la conversación tras enviar un mensaje
+
+    Solo avanza el resumen: si otro mensaje más reciente ya lo actualizó (dos
+    envíos simultáneos), este no lo reemplaza.
+    """
+    fecha_envio = mensaje.get("fecha_envio")
+    try:
+        consulta = db.table("conversacion")\
+            .update({
+                "ultimo_mensaje_id": mensaje["id_mensaje"],
+                "fecha_ultimo_mensaje": fecha_envio
+            })\
+            .eq("id_conversacion", mensaje["id_conversacion"])
+        if fecha_envio:
+            consulta = consulta.or_(f"fecha_ultimo_mensaje.is.null,fecha_ultimo_mensaje.lt.{fecha_envio}")
+        await consulta.execute()
+    except Exception as e:
+        logger.warning(f"No se pudo actualizar el resumen de {mensaje.get('id_conversacion')}: {e}")
+
+
+async def recalcular_ultimo_mensaje(
+    db: AsyncClient,
+    id_conversacion: str,
+    id_mensaje_eliminado: str
+) -> Optional[dict]:
+    """
+    Recalcula el resumen si el mensaje eliminado era el último de la conversación
+    """
+    try:
+        response = await db.table("mensaje")\
+            .select("id_mensaje, fecha_envio")\
+            .eq("id_conversacion", id_conversacion)\
+            .order("fecha_envio", desc=True)\
+            .limit(1)\
+            .execute()
+        ultimo = response.data[0] if response.data else None
+
+        await db.table("conversacion")\
+            .update({
+                "ultimo_mensaje_id": ultimo["id_mensaje"] if ultimo else None,
+                "fecha_ultimo_mensaje": ultimo["fecha_envio"] if ultimo else None
+            })\
+            .eq("id_conversacion", id_conversacion)\
+            .or_(f"ultimo_mensaje_id.eq.{id_mensaje_eliminado},ultimo_mensaje_id.is.null")\
+            .execute()
+        return ultimo
+    except Exception as e:
+        logger.warning(f"No se pudo recalcular el resumen de {id_conversacion}: {e}")
+        return None
@@ -0,0 +1,282 @@
+"""
+Índice en memoria para la búsqueda de usuarios
+
+En lugar de un `ilike *q*` (escaneo secuencial) por cada tecla, los usuarios
+activos se indexan por trigramas de las palabras de su nombre, apellido y
+correo, normalizadas sin tildes ni mayúsculas. Una búsqueda suma, por cada
+palabra de la consulta, la similitud de trigramas con la palabra más parecida
+del usuario (tolera errores de tipeo) más un extra si esa palabra empieza por
+la buscada (búsqueda mientras se escribe), y ordena por puntaje. En palabras
+cortas una letra cambiada o dos letras invertidas ("jsoe") rompen casi todos
+los trigramas; si ninguna palabra alcanza la similitud mínima se aceptan las
+que están a una edición de distancia (Damerau: inserción, borrado,
+sustitución o transposición de letras vecinas).
+
+El índice se carga al iniciar la aplicación, se recarga por completo cada
+BUSQUEDA_REFRESH_SECONDS y las rutas que crean o modifican usuarios lo
+actualizan al momento. Si no está cargado, las rutas usan la consulta a la
+base de datos.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from supabase import AsyncClient
+import heapq
+import re
+import unicodedata
+
+from app.config import settings
+from app.utils.indices import RecargaPeriodica, leer_tabla
+
+# Campos públicos que se guardan y devuelven por cada usuario
+CAMPOS_BUSQUEDA = ["id_user", "nombre", "apellido", "correo", "rol", "foto_perfil", "activo", "fecha_registro"]
+
+# Similitud mínima de trigramas entre una palabra de la consulta y una del usuario
+UMBRAL_SIMILITUD = 0.3
+# Puntaje extra cuando una palabra del usuario empieza por la de la consulta
+BONO_PREFIJO = 1.0
+# Largo mínimo de una palabra de la consulta para buscarla a una edición de
+# distancia (en palabras más cortas casi todo el vocabulario está a una edición)
+LARGO_MINIMO_EDICION = 3
+
+_SEPARADORES = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes ("Peñaranda" -> "penaranda")"""
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def palabras(texto: str) -> List[str]:
+    """Palabras normalizadas de un texto (el correo se separa en sus partes)"""
+    return [p for p in _SEPARADORES.split(normalizar(texto)) if p]
+
+
+def trigramas(palabra: str) -> Set[str]:
+    """Trigramas de una palabra con relleno, al estilo de pg_trgm"""
+    relleno = f"  {palabra} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def a_una_edicion(a: str, b: str) -> bool:
+    """
+    True si las palabras difieren en a lo sumo una edición de Damerau
+    (inserción, borrado, sustitución o transposición de dos letras vecinas)
+    """
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    # Saltar el prefijo común; lo que queda debe explicarse con una edición
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    return (
+        a[i + 1:] == b[i + 1:]
+        or (a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:])
+    )
+
+
+class IndiceUsuarios(RecargaPeriodica):
+    """
+    Índice de trigramas sobre las palabras de los usuarios activos
+
+    Los trigramas apuntan a palabras del vocabulario (mucho menor que la
+    cantidad de usuarios) y cada palabra a los usuarios que la contienen, que
+    se identifican internamente con enteros para que los conjuntos ocupen poco.
+    """
+
+    nombre = "índice de búsqueda de usuarios"
+
+    def __init__(self, intervalo: float = 900):
+        super().__init__(intervalo)
+        self._ids: Dict[str, int] = {}
+        self._usuarios: Dict[int, dict] = {}
+        self._palabras: Dict[int, Tuple[str, ...]] = {}
+        self._orden: Dict[int, Tuple[str, str]] = {}
+        self._por_palabra: Dict[str, Set[int]] = {}
+        self._trigramas: Dict[str, Set[str]] = defaultdict(set)
+        self._tam_trigramas: Dict[str, int] = {}
+        self._siguiente = 0
+        # Cambios recibidos mientras se recarga el índice, para no perderlos
+        self._cambios_en_carga: Optional[List[tuple]] = None
+
+    def __len__(self) -> int:
+        return len(self._usuarios)
+
+    def actualizar(self, usuario: dict) -> None:
+        """
+        Agrega o reemplaza un usuario (o lo quita si quedó inactivo)
+        """
+        if self._cambios_en_carga is not None:
+            self._cambios_en_carga.append(("actualizar", usuario))
+        if usuario.get("activo") is False:
+            self.eliminar(usuario["id_user"])
+            return
+
+        interno = self._ids.get(usuario["id_user"])
+        if interno is None:
+            interno = self._siguiente
+            self._siguiente += 1
+            self._ids[usuario["id_user"]] = interno
+        else:
+            self._desindexar(interno)
+
+        anterior = self._usuarios.get(interno, {})
+        datos = {**anterior, **{c: usuario[c] for c in CAMPOS_BUSQUEDA if c in usuario}}
+        self._usuarios[interno] = datos
+        self._orden[interno] = (normalizar(datos.get("nombre") or ""), normalizar(datos.get("apellido") or ""))
+        texto = " ".join(str(datos.get(c) or "") for c in ("nombre", "apellido", "correo"))
+        self._palabras[interno] = tuple(dict.fromkeys(palabras(texto)))
+        for palabra in self._palabras[interno]:
+            usuarios = self._por_palabra.get(palabra)
+            if usuarios is None:
+                usuarios = self._por_palabra[palabra] = set()
+                trigs = trigramas(palabra)
+                self._tam_trigramas[palabra] = len(trigs)
+                for trigrama in trigs:
+                    self._trigramas[trigrama].add(palabra)
+            usuarios.add(interno)
+
+    def eliminar(self, id_user: str) -> None:
+        """
+        Quita un usuario del índice
+        """
+        if self._cambios_en_carga is not None:
+            self._cambios_en_carga.append(("eliminar", id_user))
+        interno = self._ids.pop(id_user, None)
+        if interno is None:
+            return
+        self._desindexar(interno)
+        self._usuarios.pop(interno, None)
+        self._palabras.pop(interno, None)
+        self._orden.pop(interno, None)
+
+    def _desindexar(self, interno: int) -> None:
+        for palabra in self._palabras.get(interno, ()):
+            usuarios = self._por_palabra.get(palabra)
+            if usuarios is None:
+                continue
+            usuarios.discard(interno)
+            if usuarios:
+                continue
+            # Nadie más usa la palabra: sale del vocabulario
+            del self._por_palabra[palabra]
+            del self._tam_trigramas[palabra]
+            for trigrama in trigramas(palabra):
+                vocabulario = self._trigramas.get(trigrama)
+                if vocabulario is not None:
+                    vocabulario.discard(palabra)
+                    if not vocabulario:
+                        del self._trigramas[trigrama]
+
+    def _coincidencias(self, palabra: str) -> Dict[str, float]:
+        """
+        Palabras del vocabulario parecidas a la de la consulta y su puntaje
+
+        La similitud es la de pg_trgm (trigramas comunes / trigramas totales);
+        las que empiezan por la palabra buscada suman BONO_PREFIJO. Si ninguna
+        alcanza UMBRAL_SIMILITUD se recurre a las que comparten algún trigrama
+        y están a una edición de distancia, con puntaje UMBRAL_SIMILITUD.
+        """
+        trigs = trigramas(palabra)
+        comunes: Dict[str, int] = defaultdict(int)
+        for trigrama in trigs:
+            for candidata in self._trigramas.get(trigrama, ()):
+                comunes[candidata] += 1
+
+        resultado = {}
+        for candidata, n in comunes.items():
+            similitud = n / (len(trigs) + self._tam_trigramas[candidata] - n)
+            prefijo = candidata.startswith(palabra)
+            if similitud >= UMBRAL_SIMILITUD or prefijo:
+                resultado[candidata] = similitud + (BONO_PREFIJO if prefijo else 0.0)
+
+        if not resultado and len(palabra) >= LARGO_MINIMO_EDICION:
+            # Una edición conserva el trigrama inicial o el final de la palabra
+            resultado = {c: UMBRAL_SIMILITUD for c in comunes if a_una_edicion(palabra, c)}
+        return resultado
+
+    def buscar(
+        self,
+        q: str,
+        skip: int = 0,
+        limit: int = 20,
+        excluir: Iterable[str] = ()
+    ) -> List[dict]:
+        """
+        Usuarios que coinciden con la consulta, de mayor a menor puntaje
+
+        Todas las palabras de la consulta deben coincidir (por prefijo o por
+        similitud de trigramas) con alguna palabra del usuario; cada una aporta
+        el puntaje de su mejor coincidencia.
+        """
+        consulta = list(dict.fromkeys(palabras(q)))
+        if not consulta:
+            return []
+
+        puntajes: Optional[Dict[int, float]] = None
+        for palabra in consulta:
+            mejores: Dict[int, float] = {}
+            for candidata, puntaje in self._coincidencias(palabra).items():
+                for interno in self._por_palabra[candidata]:
+                    if puntaje > mejores.get(interno, 0.0):
+                        mejores[interno] = puntaje
+            if puntajes is not None:
+                mejores = {i: p + puntajes[i] for i, p in mejores.items() if i in puntajes}
+            puntajes = mejores
+            if not puntajes:
+                return []
+
+        for id_user in excluir:
+            puntajes.pop(self._ids.get(id_user), None)
+
+        orden = self._orden
+        primeros = heapq.nsmallest(skip + limit, puntajes, key=lambda i: (-puntajes[i], orden[i]))
+        return [dict(self._usuarios[i]) for i in primeros[skip:]]
+
+    async def cargar(self, db: AsyncClient) -> None:
+        """
+        Recarga todos los usuarios activos y reemplaza el índice
+        """
+        self._cambios_en_carga = []
+        try:
+            filas = await leer_tabla(db, "usuario", ", ".join(CAMPOS_BUSQUEDA), "id_user", activo=True)
+
+            # Armar el índice nuevo fuera del event loop (es CPU pura)
+            nuevo = await run_in_threadpool(_construir, filas)
+            # Aplicar lo que cambió mientras se cargaba
+            for operacion, dato in self._cambios_en_carga:
+                getattr(nuevo, operacion)(dato)
+
+            for atributo in ("_ids", "_usuarios", "_palabras", "_orden", "_por_palabra",
+                             "_trigramas", "_tam_trigramas", "_siguiente"):
+                setattr(self, atributo, getattr(nuevo, atributo))
+            self._marcar_cargado()
+        finally:
+            self._cambios_en_carga = None
+
+    def stats(self) -> dict:
+        """
+        Métricas del índice para /health
+        """
+        return {
+            "cargado": self.cargado,
+            "usuarios": len(self._usuarios),
+            "palabras": len(self._por_palabra),
+            "ultima_carga": self.ultima_carga,
+        }
+
+
+def _construir(filas: List[dict]) -> IndiceUsuarios:
+    indice = IndiceUsuarios()
+    for fila in filas:
+        indice.actualizar(fila)
+    return indice
+
+
+# Índice global de la aplicación
+indice_usuarios = IndiceUsuarios(intervalo=settings.BUSQUEDA_REFRESH_SECONDS)
@@ -0,0 +1,83 @@
+"""
+Caché en memoria con expiración (TTL) y desalojo LRU
+"""
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import time
+
+
+class TTLCache:
+    """
+    Caché acotada por cantidad de entradas y por tiempo de vida
+
+    Las entradas más antiguas en uso se desalojan al superar `maxsize` y cada
+    entrada expira `ttl` segundos después de guardarse. Lleva métricas de
+    aciertos y fallos para exponerlas en /health.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, clave: Hashable) -> Optional[Any]:
+        """
+        Obtiene un valor o None si no existe o expiró
+        """
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            self.misses += 1
+            return None
+
+        expira, valor = entrada
+        if expira < time.monotonic():
+            del self._datos[clave]
+            self.misses += 1
+            return None
+
+        self._datos.move_to_end(clave)
+        self.hits += 1
+        return valor
+
+    def set(self, clave: Hashable, valor: Any, ttl: Optional[float] = None) -> None:
+        """
+        Guarda un valor, desalojando el menos usado si la caché está llena
+        """
+        self._datos[clave] = (time.monotonic() + (self.ttl if ttl is None else ttl), valor)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.maxsize:
+            self._datos.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, clave: Hashable) -> None:
+        """
+        Elimina una entrada si existe
+        """
+        self._datos.pop(clave, None)
+
+    def clear(self) -> None:
+        """
+        Vacía la caché
+        """
+        self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def stats(self) -> dict:
+        """
+        Métricas de uso de la caché
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._datos),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
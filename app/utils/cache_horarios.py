@@ -0,0 +1,105 @@
+"""
+Caché de horarios por grupo
+
+Todos los estudiantes de un grupo ven el mismo horario, así que se arma una
+sola vez por `id_grupo` (horarios + materias del grupo) y se comparte. Las
+cargas concurrentes de un mismo grupo se unifican (single-flight): si 400
+estudiantes abren la app a la vez, solo la primera petición consulta la base de
+datos y el resto espera ese mismo resultado.
+
+La caché se invalida al crear, editar o eliminar horarios y al cambiar las
+materias de un grupo.
+"""
+from typing import Dict, List, Optional
+from supabase import AsyncClient
+import asyncio
+
+from app.config import settings
+from app.utils.cache import TTLCache
+
+
+async def construir_horario(db: AsyncClient, id_grupo: str) -> List[dict]:
+    """
+    Horarios del grupo ordenados, cada uno con las materias del grupo
+    """
+    # Ambas consultas son independientes
+    response, materias_response = await asyncio.gather(
+        db.table("horario").select("*").eq("id_grupo", id_grupo).order("dia_semana, hora_inicio").execute(),
+        db.table("grupomateria").select("*, materia(*)").eq("id_grupo", id_grupo).execute()
+    )
+    materias_list = [gm["materia"] for gm in materias_response.data if gm.get("materia")]
+
+    # Agregar información de materias a cada horario; la lista completa es para
+    # que el frontend elija y "materia" (la primera) se mantiene por compatibilidad
+    return [
+        {
+            **h,
+            "materias": materias_list,
+            "materia": materias_list[0] if materias_list else None,
+        }
+        for h in response.data
+    ]
+
+
+class CacheHorarios:
+    """
+    Horarios armados por grupo con carga unificada
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._en_vuelo: Dict[str, asyncio.Future] = {}
+        self._generacion = 0
+        self.cargas = 0
+
+    async def obtener(self, db: AsyncClient, id_grupo: str) -> List[dict]:
+        """
+        Horario del grupo desde la caché o cargándolo una sola vez
+        """
+        horarios = self._cache.get(id_grupo)
+        if horarios is not None:
+            return horarios
+
+        tarea = self._en_vuelo.get(id_grupo)
+        if tarea is None:
+            tarea = asyncio.ensure_future(self._cargar(db, id_grupo, self._generacion))
+            self._en_vuelo[id_grupo] = tarea
+        # shield: si una petición se cancela la carga sigue para las demás
+        return await asyncio.shield(tarea)
+
+    async def _cargar(self, db: AsyncClient, id_grupo: str, generacion: int) -> List[dict]:
+        try:
+            self.cargas += 1
+            horarios = await construir_horario(db, id_grupo)
+            # Si se invalidó durante la carga, el resultado puede estar desactualizado
+            if generacion == self._generacion:
+                self._cache.set(id_grupo, horarios)
+            return horarios
+        finally:
+            if self._en_vuelo.get(id_grupo) is asyncio.current_task():
+                del self._en_vuelo[id_grupo]
+
+    def invalidar(self, id_grupo: Optional[str] = None) -> None:
+        """
+        Descarta el horario de un grupo (o de todos si no se indica)
+        """
+        self._generacion += 1
+        if id_grupo is None:
+            self._cache.clear()
+            self._en_vuelo.clear()
+        else:
+            self._cache.invalidate(id_grupo)
+            self._en_vuelo.pop(id_grupo, None)
+
+    def stats(self) -> dict:
+        """
+        Métricas de la caché para /health
+        """
+        return {**self._cache.stats(), "cargas": self.cargas, "en_vuelo": len(self._en_vuelo)}
+
+
+# Caché global de horarios
+horarios_cache = CacheHorarios(
+    maxsize=settings.HORARIO_CACHE_MAXSIZE,
+    ttl=settings.HORARIO_CACHE_TTL
+)
@@ -0,0 +1,112 @@
+"""
+Caché de respuestas HTTP con ETag para los catálogos académicos
+
+Materias, grupos, horarios y docentes cambian pocas veces por semestre. Sus
+respuestas se serializan una vez, se guardan en memoria con un ETag calculado
+a partir del contenido y se reutilizan:
+- si el cliente envía `If-None-Match` con el ETag vigente se responde 304 sin
+  cuerpo (sin tocar la base de datos);
+- si no, se devuelve el cuerpo ya serializado.
+
+Cada catálogo tiene una generación que las rutas de creación, edición y
+borrado incrementan con `invalidar`, lo que descarta todas sus respuestas. Con
+varios workers la invalidación es local: los demás procesos sirven la versión
+anterior como mucho CATALOGO_CACHE_TTL segundos.
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+import hashlib
+import json
+
+from app.config import settings
+from app.utils.cache import TTLCache
+
+# Catálogos cacheados
+MATERIAS = "materias"
+GRUPOS = "grupos"
+HORARIOS = "horarios"
+DOCENTES = "docentes"
+
+
+class CacheRespuestas:
+    """
+    Respuestas serializadas por (catálogo, generación, parámetros)
+    """
+
+    def __init__(self, maxsize: int, ttl: float, max_age: int):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generaciones: Dict[str, int] = {}
+        # Las respuestas dependen del usuario autenticado: solo cachea el cliente
+        self.cache_control = f"private, max-age={max_age}, must-revalidate"
+
+    def invalidar(self, *catalogos: str) -> None:
+        """
+        Descarta todas las respuestas de los catálogos indicados
+        """
+        for catalogo in catalogos:
+            self._generaciones[catalogo] = self._generaciones.get(catalogo, 0) + 1
+
+    async def responder(
+        self,
+        request: Request,
+        catalogo: str,
+        clave: Hashable,
+        cargar: Callable[[], Awaitable[Any]],
+        modelo: Optional[Any] = None
+    ) -> Response:
+        """
+        Respuesta cacheada del catálogo, o 304 si el cliente ya la tiene
+
+        Args:
+            request: Petición (para leer If-None-Match)
+            catalogo: Nombre del catálogo (MATERIAS, GRUPOS, ...)
+            clave: Parámetros que identifican la respuesta dentro del catálogo
+            cargar: Consulta a la base de datos cuando no hay respuesta cacheada
+            modelo: Tipo con el que se valida y serializa (el response_model de
+                la ruta), para devolver los mismos campos que sin caché
+        """
+        clave_completa = (catalogo, self._generaciones.get(catalogo, 0), clave)
+        entrada = self._cache.get(clave_completa)
+        if entrada is None:
+            datos = await cargar()
+            if modelo is not None:
+                adaptador = TypeAdapter(modelo)
+                datos = adaptador.dump_python(adaptador.validate_python(datos), mode="json")
+            cuerpo = json.dumps(
+                jsonable_encoder(datos), sort_keys=True, separators=(",", ":"), ensure_ascii=False
+            ).encode("utf-8")
+            entrada = ('"' + hashlib.sha256(cuerpo).hexdigest()[:32] + '"', cuerpo)
+            self._cache.set(clave_completa, entrada)
+
+        etag, cuerpo = entrada
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if _coincide(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=cuerpo, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        """
+        Métricas de la caché para /health
+        """
+        return self._cache.stats()
+
+
+def _coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara If-None-Match (lista de ETags, débiles o '*') con el ETag actual"""
+    if not if_none_match:
+        return False
+    for valor in if_none_match.split(","):
+        valor = valor.strip()
+        if valor == "*" or valor.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+# Caché global de catálogos
+catalogo_cache = CacheRespuestas(
+    maxsize=settings.CATALOGO_CACHE_MAXSIZE,
+    ttl=settings.CATALOGO_CACHE_TTL,
+    max_age=settings.CATALOGO_CACHE_MAX_AGE
+)
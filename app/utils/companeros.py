@@ -0,0 +1,226 @@
+"""
+Sugerencias de amistad entre compañeros de estudio
+
+`estudiante.id_grupo` y `grupomateria` ya dicen quién estudia junto. Con eso se
+puntúa a cada posible amigo por:
+- pertenecer al mismo grupo (PESO_MISMO_GRUPO);
+- cada materia que comparten sus grupos (PESO_MATERIA);
+- cada amigo en común según el grafo de amistades (PESO_AMIGO_EN_COMUN).
+
+La parte académica es igual para todos los estudiantes de un grupo, así que se
+precalcula en lote por grupo (los MAX_CANDIDATOS_GRUPO mejores candidatos) al
+cargar y se guarda; por petición solo se suman los amigos en común y se quitan
+quienes ya tienen relación con el usuario.
+
+Se carga al iniciar, se recarga cada COMPANEROS_REFRESH_SECONDS y las rutas de
+estudiantes lo actualizan al crear o cambiar de grupo a un estudiante y al
+asignar materias a un grupo.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from supabase import AsyncClient
+import heapq
+
+from app.config import settings
+from app.utils.grafo_amigos import GrafoAmistades
+from app.utils.indices import RecargaPeriodica, leer_tabla
+
+PESO_MISMO_GRUPO = 5.0
+PESO_MATERIA = 1.0
+PESO_AMIGO_EN_COMUN = 2.0
+
+# Candidatos guardados por grupo
+MAX_CANDIDATOS_GRUPO = 500
+
+# (id_user, puntaje académico, materias en común, mismo grupo)
+Candidato = Tuple[str, float, int, bool]
+
+
+class IndiceCompaneros(RecargaPeriodica):
+    """
+    Estudiantes por grupo, materias por grupo y candidatos precalculados
+    """
+
+    nombre = "índice de compañeros"
+
+    def __init__(self, intervalo: float = 1800):
+        super().__init__(intervalo)
+        self._grupo_de: Dict[str, str] = {}
+        self._miembros: Dict[str, Set[str]] = defaultdict(set)
+        self._materias: Dict[str, Set[str]] = defaultdict(set)
+        self._grupos_por_materia: Dict[str, Set[str]] = defaultdict(set)
+        self._candidatos: Dict[str, List[Candidato]] = {}
+        # Cambios recibidos mientras se recarga el índice, para no perderlos
+        self._cambios_en_carga: Optional[List[tuple]] = None
+
+    def __len__(self) -> int:
+        return len(self._grupo_de)
+
+    def grupo_de(self, id_user: str) -> Optional[str]:
+        return self._grupo_de.get(id_user)
+
+    def miembros(self, id_grupo: str) -> Set[str]:
+        return set(self._miembros.get(id_grupo, ()))
+
+    def _relacionados(self, id_grupo: str) -> Set[str]:
+        """El grupo y los que comparten alguna materia con él"""
+        grupos = {id_grupo}
+        for id_materia in self._materias.get(id_grupo, ()):
+            grupos |= self._grupos_por_materia[id_materia]
+        return grupos
+
+    def _descartar(self, grupos: Set[str]) -> None:
+        for id_grupo in grupos:
+            self._candidatos.pop(id_grupo, None)
+
+    def actualizar_estudiante(self, estudiante: dict) -> None:
+        """
+        Registra un estudiante nuevo o su cambio de grupo
+        """
+        if self._cambios_en_carga is not None:
+            self._cambios_en_carga.append(("actualizar_estudiante", estudiante))
+        if "id_grupo" not in estudiante:
+            return
+        id_user, nuevo = estudiante["id_user"], estudiante["id_grupo"]
+        anterior = self._grupo_de.get(id_user)
+        if anterior == nuevo:
+            return
+
+        afectados: Set[str] = set()
+        if anterior is not None:
+            self._miembros[anterior].discard(id_user)
+            afectados |= self._relacionados(anterior)
+            del self._grupo_de[id_user]
+        if nuevo is not None:
+            self._miembros[nuevo].add(id_user)
+            afectados |= self._relacionados(nuevo)
+            self._grupo_de[id_user] = nuevo
+        self._descartar(afectados)
+
+    def eliminar_usuario(self, id_user: str) -> None:
+        """
+        Quita a un usuario desactivado de su grupo
+        """
+        self.actualizar_estudiante({"id_user": id_user, "id_grupo": None})
+
+    def agregar_materia(self, asignacion: dict) -> None:
+        """
+        Registra una materia asignada a un grupo (fila de grupomateria)
+        """
+        if self._cambios_en_carga is not None:
+            self._cambios_en_carga.append(("agregar_materia", asignacion))
+        id_grupo, id_materia = asignacion["id_grupo"], asignacion["id_materia"]
+        if id_materia in self._materias[id_grupo]:
+            return
+        self._materias[id_grupo].add(id_materia)
+        self._grupos_por_materia[id_materia].add(id_grupo)
+        self._descartar(self._relacionados(id_grupo))
+
+    def candidatos(self, id_grupo: str) -> List[Candidato]:
+        """
+        Mejores candidatos académicos para los estudiantes de un grupo
+        (se calculan si no están precalculados)
+        """
+        candidatos = self._candidatos.get(id_grupo)
+        if candidatos is None:
+            candidatos = self._candidatos[id_grupo] = self._calcular(id_grupo)
+        return candidatos
+
+    def _calcular(self, id_grupo: str) -> List[Candidato]:
+        # Materias en común con cada grupo que comparte alguna
+        compartidas: Dict[str, int] = defaultdict(int)
+        for id_materia in self._materias.get(id_grupo, ()):
+            for otro in self._grupos_por_materia[id_materia]:
+                compartidas[otro] += 1
+        compartidas[id_grupo] = len(self._materias.get(id_grupo, ()))
+
+        candidatos: List[Candidato] = []
+        for otro, n in compartidas.items():
+            mismo = otro == id_grupo
+            puntaje = n * PESO_MATERIA + (PESO_MISMO_GRUPO if mismo else 0.0)
+            candidatos.extend((id_user, puntaje, n, mismo) for id_user in self._miembros.get(otro, ()))
+        return heapq.nlargest(MAX_CANDIDATOS_GRUPO, candidatos, key=lambda c: (c[1], c[0]))
+
+    def sugerencias(self, id_user: str, grafo: GrafoAmistades, limit: int = 20) -> List[dict]:
+        """
+        Compañeros sugeridos para un estudiante, de mayor a menor puntaje
+
+        Returns:
+            Lista de {id_user, puntaje, mismo_grupo, materias_en_comun,
+            amigos_en_comun}
+        """
+        id_grupo = self._grupo_de.get(id_user)
+        if id_grupo is None:
+            return []
+
+        en_comun = grafo.conteo_en_comun(id_user)
+        puntuados = []
+        for candidato, puntaje, materias, mismo in self.candidatos(id_grupo):
+            if candidato == id_user or grafo.estado(id_user, candidato) is not None:
+                continue
+            amigos = en_comun.get(candidato, 0)
+            puntuados.append((puntaje + amigos * PESO_AMIGO_EN_COMUN, candidato, materias, mismo, amigos))
+
+        return [
+            {
+                "id_user": candidato,
+                "puntaje": puntaje,
+                "mismo_grupo": mismo,
+                "materias_en_comun": materias,
+                "amigos_en_comun": amigos,
+            }
+            for puntaje, candidato, materias, mismo, amigos in heapq.nlargest(limit, puntuados)
+        ]
+
+    async def cargar(self, db: AsyncClient) -> None:
+        """
+        Recarga estudiantes y materias por grupo y precalcula los candidatos
+        de todos los grupos
+        """
+        self._cambios_en_carga = []
+        try:
+            estudiantes = await leer_tabla(db, "estudiante", "ci_est, id_user, id_grupo", "ci_est")
+            asignaciones = await leer_tabla(db, "grupomateria", "id_grupo_materia, id_grupo, id_materia", "id_grupo_materia")
+            inactivos = {u["id_user"] for u in await leer_tabla(db, "usuario", "id_user", "id_user", activo=False)}
+            estudiantes = [e for e in estudiantes if e["id_user"] not in inactivos]
+
+            # Armar el índice nuevo fuera del event loop (es CPU pura)
+            nuevo = await run_in_threadpool(_construir, estudiantes, asignaciones)
+            # Aplicar lo que cambió mientras se cargaba
+            for operacion, dato in self._cambios_en_carga:
+                getattr(nuevo, operacion)(dato)
+
+            for atributo in ("_grupo_de", "_miembros", "_materias", "_grupos_por_materia", "_candidatos"):
+                setattr(self, atributo, getattr(nuevo, atributo))
+            self._marcar_cargado()
+        finally:
+            self._cambios_en_carga = None
+
+    def stats(self) -> dict:
+        """
+        Métricas del índice para /health
+        """
+        return {
+            "cargado": self.cargado,
+            "estudiantes": len(self._grupo_de),
+            "grupos": len(self._miembros),
+            "grupos_precalculados": len(self._candidatos),
+            "ultima_carga": self.ultima_carga,
+        }
+
+
+def _construir(estudiantes: List[dict], asignaciones: List[dict]) -> IndiceCompaneros:
+    indice = IndiceCompaneros()
+    for asignacion in asignaciones:
+        indice.agregar_materia(asignacion)
+    for estudiante in estudiantes:
+        indice.actualizar_estudiante(estudiante)
+    # Precálculo en lote de todos los grupos
+    for id_grupo in list(indice._miembros):
+        indice.candidatos(id_grupo)
+    return indice
+
+
+# Índice global de la aplicación
+companeros = IndiceCompaneros(intervalo=settings.COMPANEROS_REFRESH_SECONDS)
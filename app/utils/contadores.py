@@ -0,0 +1,156 @@
+"""
+Contadores de comentarios y reacciones de publicaciones
+
+Los contadores se guardan desnormalizados en la tabla publicacion
+(ver add_contadores_publicacion.sql) y se ajustan en cada escritura. Si la
+migración aún no está aplicada, el feed los calcula para toda la página con
+una sola consulta agrupada (ver add_conteo_interacciones.sql) o, si tampoco
+existe esa función, con una consulta por tabla.
+"""
+from typing import Dict, List, Optional
+from supabase import AsyncClient
+import asyncio
+import logging
+
+from app.utils.lotes import es_funcion_inexistente
+
+logger = logging.getLogger(__name__)
+
+
+async def ajustar_contadores(
+    db: AsyncClient,
+    id_publicacion: str,
+    comentarios: int = 0,
+    tipo_reac: Optional[str] = None,
+    reacciones: int = 0
+) -> None:
+    """
+    Ajusta de forma atómica los contadores de una publicación
+
+    Args:
+        db: Cliente de base de datos
+        id_publicacion: Publicación afectada
+        comentarios: Delta de comentarios (+1 / -1)
+        tipo_reac: Tipo de reacción afectado, si aplica
+        reacciones: Delta de reacciones (+1 / -1)
+    """
+    try:
+        await db.rpc("ajustar_contadores_publicacion", {
+            "p_id_publicacion": id_publicacion,
+            "p_delta_comentarios": comentarios,
+            "p_tipo_reac": tipo_reac,
+            "p_delta_reacciones": reacciones
+        }).execute()
+    except Exception as e:
+        # El feed recalcula en lote si los contadores no están disponibles
+        logger.warning(f"No se pudieron ajustar contadores de {id_publicacion}: {e}")
+
+
+async def completar_contadores(
+    db: AsyncClient,
+    publicaciones: List[dict],
+    id_user: str
+) -> List[dict]:
+    """
+    Completa contadores y `mis_reacciones` para una página de publicaciones
+
+    Usa los contadores desnormalizados cuando existen; para las publicaciones
+    sin ellos pide los totales agrupados por publicación en una sola llamada.
+    Nunca hace consultas por publicación.
+
+    Args:
+        db: Cliente de base de datos
+        publicaciones: Filas de publicacion (se modifican en el lugar)
+        id_user: Usuario actual, para `mis_reacciones`
+
+    Returns:
+        La misma lista de publicaciones
+    """
+    if not publicaciones:
+        return publicaciones
+
+    con_contador = [p["id_publicacion"] for p in publicaciones if p.get("comentarios_count") is not None]
+    sin_contador = [p["id_publicacion"] for p in publicaciones if p.get("comentarios_count") is None]
+
+    tareas = []
+    if con_contador:
+        tareas.append(
+            db.table("reaccion")
+            .select("id_publicacion, tipo_reac")
+            .eq("id_user", id_user)
+            .in_("id_publicacion", con_contador)
+            .execute()
+        )
+    if sin_contador:
+        tareas.append(_contar_interacciones(db, sin_contador, id_user))
+    respuestas = list(await asyncio.gather(*tareas))
+
+    mis_reacciones: Dict[str, List[str]] = {}
+    conteos: Dict[str, dict] = {}
+
+    if con_contador:
+        for r in respuestas.pop(0).data or []:
+            mis_reacciones.setdefault(r["id_publicacion"], []).append(r["tipo_reac"])
+
+    if sin_contador:
+        for fila in respuestas.pop(0):
+            conteos[fila["id_publicacion"]] = fila
+            if fila.get("mis_reacciones"):
+                mis_reacciones[fila["id_publicacion"]] = fila["mis_reacciones"]
+
+    for pub in publicaciones:
+        id_pub = pub["id_publicacion"]
+        if pub.get("comentarios_count") is None:
+            conteo = conteos.get(id_pub, {})
+            pub["comentarios_count"] = conteo.get("comentarios_count") or 0
+            pub["reacciones_por_tipo"] = conteo.get("reacciones_por_tipo") or {}
+            pub["reacciones_count"] = sum(pub["reacciones_por_tipo"].values())
+        else:
+            pub["reacciones_por_tipo"] = pub.get("reacciones_por_tipo") or {}
+            pub["reacciones_count"] = pub.get("reacciones_count") or 0
+        pub["mis_reacciones"] = mis_reacciones.get(id_pub, [])
+
+    return publicaciones
+
+
+async def _contar_interacciones(db: AsyncClient, ids: List[str], id_user: str) -> List[dict]:
+    """
+    Comentarios, reacciones por tipo y reacciones propias de cada publicación
+
+    Returns:
+        Filas {id_publicacion, comentarios_count, reacciones_por_tipo, mis_reacciones}
+    """
+    try:
+        # Una fila por publicación: el límite de filas de PostgREST no corta los totales
+        response = await db.rpc("contar_interacciones_publicaciones", {
+            "p_ids": ids,
+            "p_id_user": id_user
+        }).execute()
+        return response.data or []
+    except Exception as e:
+        if not es_funcion_inexistente(e):
+            raise
+
+    # Sin add_conteo_interacciones.sql: una consulta por tabla contando en Python
+    comentarios_response, reacciones_response = await asyncio.gather(
+        db.table("comentario")
+        .select("id_publicacion")
+        .in_("id_publicacion", ids)
+        .execute(),
+        db.table("reaccion")
+        .select("id_publicacion, tipo_reac, id_user")
+        .in_("id_publicacion", ids)
+        .execute()
+    )
+    filas = {
+        id_pub: {"id_publicacion": id_pub, "comentarios_count": 0, "reacciones_por_tipo": {}, "mis_reacciones": []}
+        for id_pub in ids
+    }
+    for c in comentarios_response.data or []:
+        filas[c["id_publicacion"]]["comentarios_count"] += 1
+    for r in reacciones_response.data or []:
+        fila = filas[r["id_publicacion"]]
+        fila["reacciones_por_tipo"][r["tipo_reac"]] = fila["reacciones_por_tipo"].get(r["tipo_reac"], 0) + 1
+        if r["id_user"] == id_user:
+            fila["mis_reacciones"].append(r["tipo_reac"])
+    return list(filas.values())
@@ -4,17 +4,36 @@ Dependencias reutilizables para FastAPI
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional, List
+from app.config import settings
 from app.database import get_db
+from app.utils.cache import TTLCache
 from app.utils.security import verify_token
-from supabase import Client
+from supabase import AsyncClient
 
 # Esquema de seguridad Bearer
 security = HTTPBearer()
 
+# Caché de usuarios activos autenticados (id_user -> fila de usuario)
+usuarios_cache = TTLCache(
+    maxsize=settings.USER_CACHE_MAXSIZE,
+    ttl=settings.USER_CACHE_TTL
+)
+
+
+def invalidar_usuario(id_user: str) -> None:
+    """
+    Descarta el usuario de la caché de autenticación
+
+    Debe llamarse siempre que cambien los datos, el rol o el estado de un usuario.
+    Los cambios hechos fuera de la API (scripts, otros workers) se ven al vencer
+    la entrada, a lo sumo USER_CACHE_TTL segundos después.
+    """
+    usuarios_cache.invalidate(id_user)
+
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ) -> dict:
     """
     Obtiene el usuario actual desde el token JWT
@@ -26,14 +45,32 @@ async def get_current_user(
     Returns:
         Diccionario con datos del usuario
         
+    Raises:
+        HTTPException: Si el token es inválido o el usuario no existe
+    """
+    return await autenticar_token(credentials.credentials, db)
+
+
+async def autenticar_token(token: str, db: AsyncClient) -> dict:
+    """
+    Valida un token de acceso y devuelve el usuario activo al que pertenece
+
+    Se usa también fuera de las dependencias HTTP (p. ej. en WebSockets, donde
+    el token llega como parámetro de la URL).
+    
+    Args:
+        token: Token JWT de acceso
+        db: Cliente de base de datos
+        
+    Returns:
+        Diccionario con datos del usuario
+        
     Raises:
         HTTPException: Si el token es inválido o el usuario no existe
     """
     import logging
     logger = logging.getLogger(__name__)
     
-    # Obtener token
-    token = credentials.credentials
     logger.debug(f"Token recibido (primeros 30 chars): {token[:30]}...")
     
     # Limpiar token - remover 'Bearer' si está duplicado
@@ -64,9 +101,14 @@ async def get_current_user(
     
     logger.debug(f"Usuario ID del token: {user_id}")
     
+    # Caso común: usuario activo ya en caché, sin consulta a la base de datos
+    cached_user = usuarios_cache.get(user_id)
+    if cached_user is not None:
+        return dict(cached_user)
+    
     # Obtener usuario de la base de datos
     try:
-        response = db.table("usuario").select("*").eq("id_user", user_id).execute()
+        response = await db.table("usuario").select("*").eq("id_user", user_id).execute()
         
         if not response.data or len(response.data) == 0:
             logger.warning(f"Usuario {user_id} no encontrado en BD")
@@ -85,8 +127,9 @@ async def get_current_user(
                 detail="Usuario inactivo. Contacta al administrador."
             )
         
+        usuarios_cache.set(user_id, user)
         logger.debug(f"Usuario autenticado exitosamente: {user.get('correo')}")
-        return user
+        return dict(user)
         
     except HTTPException:
         raise
@@ -0,0 +1,126 @@
+"""
+Utilidades geográficas para carpooling
+
+Las distancias de búsqueda son de pocos kilómetros dentro de una ciudad, así
+que se usa una proyección equirectangular local (error despreciable a esa
+escala) en lugar de geodésicas; `haversine` queda para distancias sueltas.
+"""
+from typing import List, Optional, Sequence, Tuple
+import math
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él las distancias en lote se calculan en Python
+    np = None
+
+RADIO_TIERRA_M = 6371008.8
+METROS_POR_GRADO = math.pi * RADIO_TIERRA_M / 180
+
+# (latitud, longitud) en grados
+Punto = Tuple[float, float]
+
+
+def haversine(a: Punto, b: Punto) -> float:
+    """Distancia en metros sobre la esfera entre dos puntos"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_M * math.asin(math.sqrt(h))
+
+
+def proyectar(punto: Punto, coseno: float) -> Tuple[float, float]:
+    """Punto en metros (x, y) con la escala de longitud `coseno` = cos(latitud)"""
+    return punto[1] * METROS_POR_GRADO * coseno, punto[0] * METROS_POR_GRADO
+
+
+def distancia_a_linea(punto: Punto, linea: Sequence[Punto]) -> Tuple[float, float]:
+    """
+    Distancia de un punto al recorrido más cercano de una polilínea
+
+    Returns:
+        Tupla (distancia en metros, posición en metros a lo largo de la
+        polilínea del punto más cercano)
+    """
+    coseno = math.cos(math.radians(punto[0]))
+    px, py = proyectar(punto, coseno)
+    mejor, posicion, recorrido = math.inf, 0.0, 0.0
+    ax, ay = proyectar(linea[0], coseno)
+    if len(linea) == 1:
+        return math.hypot(px - ax, py - ay), 0.0
+    for siguiente in linea[1:]:
+        bx, by = proyectar(siguiente, coseno)
+        dx, dy = bx - ax, by - ay
+        largo2 = dx * dx + dy * dy
+        t = 0.0 if largo2 == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / largo2))
+        distancia = math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+        if distancia < mejor:
+            mejor, posicion = distancia, recorrido + t * math.sqrt(largo2)
+        recorrido += math.sqrt(largo2)
+        ax, ay = bx, by
+    return mejor, posicion
+
+
+def distancias_a_linea(puntos: Sequence[Punto], linea: Sequence[Punto]) -> List[float]:
+    """
+    Distancia en metros de cada punto a una polilínea (en lote)
+
+    Con numpy se calcula la matriz puntos x segmentos de una vez; sin numpy se
+    usa `distancia_a_linea` punto por punto.
+    """
+    if not puntos:
+        return []
+    if np is None or len(linea) < 2:
+        return [distancia_a_linea(p, linea)[0] for p in puntos]
+
+    p = np.asarray(puntos, dtype=float)
+    l = np.asarray(linea, dtype=float)
+    # Escala de longitud de cada punto, igual que en distancia_a_linea
+    coseno = np.cos(np.radians(p[:, 0]))[:, None]
+    px, py = p[:, 1:2] * METROS_POR_GRADO * coseno, p[:, 0:1] * METROS_POR_GRADO
+    ax, ay = l[None, :-1, 1] * METROS_POR_GRADO * coseno, l[None, :-1, 0] * METROS_POR_GRADO
+    bx, by = l[None, 1:, 1] * METROS_POR_GRADO * coseno, l[None, 1:, 0] * METROS_POR_GRADO
+    dx, dy = bx - ax, by - ay
+    largo2 = dx * dx + dy * dy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(largo2 > 0, ((px - ax) * dx + (py - ay) * dy) / largo2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    distancias = np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+    return distancias.min(axis=1).tolist()
+
+
+def coordenadas(latitud: Optional[float], longitud: Optional[float]) -> Optional[Punto]:
+    """Punto si ambas coordenadas están presentes"""
+    if latitud is None or longitud is None:
+        return None
+    return float(latitud), float(longitud)
+
+
+def celda(punto: Punto, tamano: float) -> Tuple[int, int]:
+    """Celda de la grilla (en grados) que contiene al punto"""
+    return math.floor(punto[0] / tamano), math.floor(punto[1] / tamano)
+
+
+def celdas_de_linea(linea: Sequence[Punto], tamano: float) -> set:
+    """
+    Celdas por las que pasa una polilínea, muestreando cada medio tamaño de
+    celda (las búsquedas agregan una celda de margen)
+    """
+    celdas = {celda(linea[0], tamano)}
+    for a, b in zip(linea, linea[1:]):
+        pasos = max(1, math.ceil(max(abs(b[0] - a[0]), abs(b[1] - a[1])) / (tamano / 2)))
+        for i in range(1, pasos + 1):
+            t = i / pasos
+            celdas.add(celda((a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1])), tamano))
+    return celdas
+
+
+def celdas_cercanas(punto: Punto, radio_m: float, tamano: float) -> List[Tuple[int, int]]:
+    """Celdas que cubren un círculo de `radio_m` más una celda de margen"""
+    coseno = max(math.cos(math.radians(punto[0])), 1e-6)
+    filas = math.ceil(radio_m / (tamano * METROS_POR_GRADO)) + 1
+    columnas = math.ceil(radio_m / (tamano * METROS_POR_GRADO * coseno)) + 1
+    fila, columna = celda(punto, tamano)
+    return [
+        (fila + i, columna + j)
+        for i in range(-filas, filas + 1)
+        for j in range(-columnas, columnas + 1)
+    ]
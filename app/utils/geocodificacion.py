@@ -0,0 +1,216 @@
+"""
+Geocodificación sin conexión de ubicaciones de carpooling
+
+Las ubicaciones se escriben como texto ("Plaza Colón", "frente a la UMSS").
+En lugar de un servicio externo se usa un nomenclátor local de lugares
+conocidos de la ciudad y el campus (app/data/lugares.json, configurable con
+LUGARES_ARCHIVO). Cada nombre y alias se indexa por trigramas de sus palabras
+normalizadas (ver `busqueda.normalizar`), así se toleran tildes, mayúsculas,
+errores de tipeo y texto adicional alrededor del lugar.
+
+Un texto resuelve al lugar cuyos trigramas aparecen en mayor proporción en él
+(cobertura), siempre que la variante explique todas las palabras distintivas
+del texto: las que nombran algún lugar conocido y los números ("Blanco
+Galindo km 5" no es el km 0). Si más de un lugar cumple, el texto es ambiguo
+y no se resuelve. Los resultados, incluidos los textos sin coincidencia, se
+guardan en una caché LRU.
+"""
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set
+import json
+import logging
+
+from app.config import settings
+from app.utils.busqueda import palabras, trigramas
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Proporción mínima de los trigramas de un lugar que debe contener el texto
+UMBRAL_COBERTURA = 0.7
+
+# Similitud mínima (trigramas comunes sobre los de la palabra más larga) para
+# considerar que dos palabras son la misma con errores de tipeo
+UMBRAL_PALABRA = 0.5
+
+# Palabras que no distinguen lugares
+PALABRAS_VACIAS = {"a", "al", "de", "del", "el", "en", "la", "las", "los", "y", "frente", "cerca", "esquina"}
+
+# Palabras que aparecen en los nombres pero solo indican el tipo de lugar
+PALABRAS_GENERICAS = {
+    "plaza", "plazuela", "avenida", "calle", "paseo", "mercado", "campus", "universidad",
+    "hospital", "estadio", "laguna", "terminal", "km", "kilometro",
+}
+
+# Abreviaturas habituales
+ABREVIATURAS = {"av": "avenida", "avda": "avenida", "pza": "plaza", "univ": "universidad", "c": "calle"}
+
+
+def terminos(texto: str) -> List[str]:
+    """Palabras normalizadas de una ubicación, sin palabras vacías y con abreviaturas expandidas"""
+    return [ABREVIATURAS.get(p, p) for p in palabras(texto) if p not in PALABRAS_VACIAS]
+
+
+def trigramas_de(texto: str) -> Set[str]:
+    """Trigramas de todas las palabras de una ubicación"""
+    resultado: Set[str] = set()
+    for palabra in terminos(texto):
+        resultado |= trigramas(palabra)
+    return resultado
+
+
+def similares(a: str, b: str) -> bool:
+    """True si dos palabras normalizadas son la misma, tolerando errores de tipeo"""
+    if a == b:
+        return True
+    if a.isdigit() or b.isdigit():
+        return False
+    tri_a, tri_b = trigramas(a), trigramas(b)
+    return len(tri_a & tri_b) / max(len(tri_a), len(tri_b)) >= UMBRAL_PALABRA
+
+
+class Nomenclator:
+    """
+    Lugares conocidos con búsqueda aproximada por nombre o alias
+
+    Cada variante (nombre o alias) tiene su conjunto de trigramas y sus
+    palabras; un índice invertido trigrama -> variantes limita la comparación a
+    las candidatas.
+    """
+
+    def __init__(self, archivo: str, maxsize: int = 4096):
+        self.archivo = archivo
+        self._lugares: List[dict] = []
+        self._variantes: List[tuple] = []  # (índice del lugar, trigramas, palabras)
+        self._por_trigrama: Dict[str, List[int]] = {}
+        self._vocabulario: Set[str] = set()
+        self._cargado = False
+        # El nomenclátor solo cambia al recargar el archivo (que vacía la caché)
+        self._cache = TTLCache(maxsize=maxsize, ttl=24 * 3600)
+
+    def __len__(self) -> int:
+        return len(self._lugares)
+
+    def cargar(self, archivo: Optional[str] = None) -> None:
+        """
+        Lee el archivo de lugares y reconstruye el índice
+
+        Si el archivo no existe o es inválido el nomenclátor queda vacío y
+        ninguna ubicación se resuelve.
+        """
+        if archivo is not None:
+            self.archivo = archivo
+        try:
+            with open(self.archivo, encoding="utf-8") as f:
+                lugares = json.load(f)["lugares"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"No se pudo cargar el nomenclátor {self.archivo}: {e}")
+            lugares = []
+
+        variantes = []
+        por_trigrama: Dict[str, List[int]] = defaultdict(list)
+        vocabulario: Set[str] = set()
+        for i, lugar in enumerate(lugares):
+            for nombre in [lugar["nombre"], *lugar.get("alias", [])]:
+                tri = trigramas_de(nombre)
+                if not tri:
+                    continue
+                for t in tri:
+                    por_trigrama[t].append(len(variantes))
+                variantes.append((i, tri, set(terminos(nombre))))
+                vocabulario.update(terminos(nombre))
+
+        self._lugares = lugares
+        self._variantes = variantes
+        self._por_trigrama = dict(por_trigrama)
+        self._vocabulario = vocabulario - PALABRAS_GENERICAS
+        self._cache.clear()
+        self._cargado = True
+
+    def resolver(self, texto: Optional[str]) -> Optional[dict]:
+        """
+        Lugar conocido de una ubicación escrita como texto
+
+        Returns:
+            {"nombre", "lat", "lon", "confianza"} o None si no hay coincidencia
+        """
+        if not self._cargado:
+            self.cargar()
+        clave = " ".join(terminos(texto or ""))
+        if not clave:
+            return None
+        en_cache = self._cache.get(clave)
+        if en_cache is not None:
+            return en_cache[0]
+
+        resultado = self._buscar(clave)
+        self._cache.set(clave, (resultado,))
+        return resultado
+
+    def _distintivas(self, clave: str) -> Set[str]:
+        """
+        Palabras del texto que una variante debe contener para resolverlo: los
+        números y las que se parecen a alguna palabra no genérica del nomenclátor
+        """
+        return {
+            p for p in clave.split()
+            if p.isdigit() or (
+                p not in PALABRAS_GENERICAS and any(similares(p, v) for v in self._vocabulario)
+            )
+        }
+
+    def _buscar(self, clave: str) -> Optional[dict]:
+        consulta = trigramas_de(clave)
+        comunes: Counter = Counter()
+        for t in consulta:
+            for variante in self._por_trigrama.get(t, ()):
+                comunes[variante] += 1
+
+        distintivas = self._distintivas(clave)
+        mejores: Dict[int, float] = {}  # índice del lugar -> mejor cobertura
+        for variante, n in comunes.items():
+            indice, tri, palabras_variante = self._variantes[variante]
+            cobertura = n / len(tri)
+            if cobertura < UMBRAL_COBERTURA:
+                continue
+            # "Plaza Principal" no explica "Plaza Principal de Sacaba"
+            if not all(any(similares(p, v) for v in palabras_variante) for p in distintivas):
+                continue
+            mejores[indice] = max(cobertura, mejores.get(indice, 0.0))
+
+        # Varios lugares distintos que explican el texto: mejor no adivinar
+        if len({(self._lugares[i]["lat"], self._lugares[i]["lon"]) for i in mejores}) != 1:
+            return None
+        indice, cobertura = max(mejores.items(), key=lambda item: item[1])
+        lugar = self._lugares[indice]
+        return {
+            "nombre": lugar["nombre"],
+            "lat": lugar["lat"],
+            "lon": lugar["lon"],
+            "confianza": round(cobertura, 2),
+        }
+
+    def completar_coordenadas(self, datos: dict, campo_texto: str, campo_lat: str, campo_lon: str) -> bool:
+        """
+        Completa latitud y longitud desde el texto si no vienen informadas
+
+        Returns:
+            True si se completaron las coordenadas
+        """
+        if datos.get(campo_lat) is not None or datos.get(campo_lon) is not None:
+            return False
+        lugar = self.resolver(datos.get(campo_texto))
+        if lugar is None:
+            return False
+        datos[campo_lat], datos[campo_lon] = lugar["lat"], lugar["lon"]
+        return True
+
+    def stats(self) -> dict:
+        """
+        Métricas del nomenclátor para /health
+        """
+        return {"lugares": len(self._lugares), "cache": self._cache.stats()}
+
+
+# Nomenclátor global de la aplicación
+nomenclator = Nomenclator(settings.LUGARES_ARCHIVO, maxsize=settings.GEOCODIFICACION_CACHE_SIZE)
@@ -0,0 +1,230 @@
+"""
+Grafo de amistades en memoria
+
+Las amistades aceptadas de `relacionusuario` se guardan como listas de
+adyacencia compactas: cada usuario recibe un entero y sus amigos se guardan en
+un `array` ordenado de enteros. Sobre eso se responden en memoria los amigos
+en común, las sugerencias "personas que quizás conozcas" (amigos de amigos
+ordenados por cantidad de amigos en común) y el estado de la relación entre
+dos usuarios, sin consultar la base de datos en cada petición.
+
+El grafo se carga al iniciar, se recarga cada GRAFO_REFRESH_SECONDS y las rutas
+de amigos lo actualizan al enviar, responder o eliminar solicitudes.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+from typing import Dict, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from supabase import AsyncClient
+import heapq
+
+from app.config import settings
+from app.utils.indices import RecargaPeriodica, leer_tabla
+
+# Columnas de relacionusuario que se mantienen en memoria
+CAMPOS_RELACION = "id_relacion_usuario, id_usuario1, id_usuario2, tipo, estado"
+
+
+def _agregar(lista: array, valor: int) -> None:
+    posicion = bisect_left(lista, valor)
+    if posicion == len(lista) or lista[posicion] != valor:
+        lista.insert(posicion, valor)
+
+
+def _quitar(lista: array, valor: int) -> None:
+    posicion = bisect_left(lista, valor)
+    if posicion < len(lista) and lista[posicion] == valor:
+        del lista[posicion]
+
+
+class GrafoAmistades(RecargaPeriodica):
+    """
+    Adyacencia de amistades aceptadas y estado de todas las relaciones
+    """
+
+    nombre = "grafo de amistades"
+
+    def __init__(self, intervalo: float = 900):
+        super().__init__(intervalo)
+        self._ids: Dict[str, int] = {}
+        self._claves: List[str] = []
+        self._adyacencia: List[array] = []
+        # (menor, mayor) -> relación (cualquier estado)
+        self._relaciones: Dict[Tuple[int, int], dict] = {}
+        # Cambios recibidos mientras se recarga el grafo, para no perderlos
+        self._cambios_en_carga: Optional[List[tuple]] = None
+
+    def __len__(self) -> int:
+        return len(self._relaciones)
+
+    def _interno(self, id_user: str) -> int:
+        interno = self._ids.get(id_user)
+        if interno is None:
+            interno = len(self._claves)
+            self._ids[id_user] = interno
+            self._claves.append(id_user)
+            self._adyacencia.append(array("l"))
+        return interno
+
+    @staticmethod
+    def _es_amistad(relacion: Optional[dict]) -> bool:
+        return bool(relacion) and relacion.get("estado") == "aceptado" and relacion.get("tipo", "amistad") == "amistad"
+
+    def registrar(self, relacion: dict) -> None:
+        """
+        Agrega o actualiza una relación (solicitud enviada, aceptada o rechazada)
+        """
+        if self._cambios_en_carga is not None:
+            self._cambios_en_carga.append(("registrar", relacion))
+        a = self._interno(relacion["id_usuario1"])
+        b = self._interno(relacion["id_usuario2"])
+        clave = (min(a, b), max(a, b))
+        anterior = self._relaciones.get(clave)
+        self._relaciones[clave] = {k: relacion.get(k) for k in CAMPOS_RELACION.split(", ")}
+
+        if self._es_amistad(relacion) and not self._es_amistad(anterior):
+            _agregar(self._adyacencia[a], b)
+            _agregar(self._adyacencia[b], a)
+        elif self._es_amistad(anterior) and not self._es_amistad(relacion):
+            _quitar(self._adyacencia[a], b)
+            _quitar(self._adyacencia[b], a)
+
+    def eliminar(self, relacion: dict) -> None:
+        """
+        Quita una relación (amistad eliminada)
+        """
+        if self._cambios_en_carga is not None:
+            self._cambios_en_carga.append(("eliminar", relacion))
+        a = self._ids.get(relacion["id_usuario1"])
+        b = self._ids.get(relacion["id_usuario2"])
+        if a is None or b is None:
+            return
+        anterior = self._relaciones.pop((min(a, b), max(a, b)), None)
+        if self._es_amistad(anterior):
+            _quitar(self._adyacencia[a], b)
+            _quitar(self._adyacencia[b], a)
+
+    def eliminar_usuario(self, id_user: str) -> None:
+        """
+        Quita todas las relaciones de un usuario desactivado
+        """
+        if self._cambios_en_carga is not None:
+            self._cambios_en_carga.append(("eliminar_usuario", id_user))
+        interno = self._ids.get(id_user)
+        if interno is None:
+            return
+        for amigo in self._adyacencia[interno]:
+            _quitar(self._adyacencia[amigo], interno)
+        self._adyacencia[interno] = array("l")
+        for clave in [c for c in self._relaciones if interno in c]:
+            del self._relaciones[clave]
+
+    def amigos(self, id_user: str) -> List[str]:
+        """IDs de los amigos de un usuario"""
+        interno = self._ids.get(id_user)
+        if interno is None:
+            return []
+        return [self._claves[i] for i in self._adyacencia[interno]]
+
+    def cantidad_amigos(self, id_user: str) -> int:
+        interno = self._ids.get(id_user)
+        return 0 if interno is None else len(self._adyacencia[interno])
+
+    def en_comun(self, id_user: str, otro: str) -> List[str]:
+        """IDs de los amigos que comparten dos usuarios"""
+        a, b = self._ids.get(id_user), self._ids.get(otro)
+        if a is None or b is None:
+            return []
+        menor, mayor = sorted((self._adyacencia[a], self._adyacencia[b]), key=len)
+        conjunto = set(mayor)
+        return [self._claves[i] for i in menor if i in conjunto]
+
+    def estado(self, id_user: str, otro: str) -> Optional[dict]:
+        """
+        Relación entre dos usuarios (en cualquier estado) o None si no hay
+        """
+        a, b = self._ids.get(id_user), self._ids.get(otro)
+        if a is None or b is None:
+            return None
+        return self._relaciones.get((min(a, b), max(a, b)))
+
+    def sugerencias(self, id_user: str, limit: int = 20) -> List[Tuple[str, int]]:
+        """
+        Amigos de amigos con quienes el usuario no tiene relación, ordenados
+        por cantidad de amigos en común
+
+        Returns:
+            Lista de (id_user, amigos en común)
+        """
+        interno = self._ids.get(id_user)
+        if interno is None:
+            return []
+        conteo = self._amigos_de_amigos(interno)
+        for candidato in list(conteo):
+            if (min(interno, candidato), max(interno, candidato)) in self._relaciones:
+                del conteo[candidato]
+        mejores = heapq.nlargest(limit, conteo.items(), key=lambda par: (par[1], -par[0]))
+        return [(self._claves[i], n) for i, n in mejores]
+
+    def conteo_en_comun(self, id_user: str) -> Dict[str, int]:
+        """
+        Cantidad de amigos en común con cada amigo de amigo del usuario
+        (incluye a quienes ya tienen relación con él)
+        """
+        interno = self._ids.get(id_user)
+        if interno is None:
+            return {}
+        return {self._claves[i]: n for i, n in self._amigos_de_amigos(interno).items()}
+
+    def _amigos_de_amigos(self, interno: int) -> Counter:
+        conteo = Counter(chain.from_iterable(self._adyacencia[i] for i in self._adyacencia[interno]))
+        conteo.pop(interno, None)
+        return conteo
+
+    async def cargar(self, db: AsyncClient) -> None:
+        """
+        Recarga todas las relaciones y reemplaza el grafo
+        """
+        self._cambios_en_carga = []
+        try:
+            filas = await leer_tabla(db, "relacionusuario", CAMPOS_RELACION, "id_relacion_usuario")
+            inactivos = await leer_tabla(db, "usuario", "id_user", "id_user", activo=False)
+
+            # Armar el grafo nuevo fuera del event loop (es CPU pura)
+            nuevo = await run_in_threadpool(_construir, filas, {u["id_user"] for u in inactivos})
+            # Aplicar lo que cambió mientras se cargaba
+            for operacion, dato in self._cambios_en_carga:
+                getattr(nuevo, operacion)(dato)
+
+            self._ids, self._claves = nuevo._ids, nuevo._claves
+            self._adyacencia, self._relaciones = nuevo._adyacencia, nuevo._relaciones
+            self._marcar_cargado()
+        finally:
+            self._cambios_en_carga = None
+
+    def stats(self) -> dict:
+        """
+        Métricas del grafo para /health
+        """
+        return {
+            "cargado": self.cargado,
+            "usuarios": len(self._claves),
+            "relaciones": len(self._relaciones),
+            "amistades": sum(len(a) for a in self._adyacencia) // 2,
+            "ultima_carga": self.ultima_carga,
+        }
+
+
+def _construir(filas: List[dict], inactivos: Set[str]) -> GrafoAmistades:
+    grafo = GrafoAmistades()
+    for fila in filas:
+        # Los usuarios desactivados no aparecen como amigos ni lectores
+        if fila["id_usuario1"] not in inactivos and fila["id_usuario2"] not in inactivos:
+            grafo.registrar(fila)
+    return grafo
+
+
+# Grafo global de la aplicación
+grafo_amigos = GrafoAmistades(intervalo=settings.GRAFO_REFRESH_SECONDS)
@@ -0,0 +1,132 @@
+"""
+Derivados de imágenes subidas (miniaturas WebP y placeholder borroso)
+
+Al subir una imagen se eliminan sus metadatos EXIF (ubicación, cámara, ...)
+respetando la orientación, y se generan versiones WebP de tamaño fijo para
+cada superficie de la app (avatar/miniatura, tarjeta del feed y pantalla
+completa) junto con un placeholder diminuto en base64 para mostrar mientras
+carga la imagen real.
+
+Requiere Pillow; si no está instalado las imágenes se suben tal cual y no se
+generan derivados.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+import base64
+import io
+import logging
+import os
+import tempfile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+DISPONIBLE = Image is not None
+
+# Lado mayor (px) de cada variante WebP
+VARIANTES = {
+    "thumb": 160,
+    "card": 720,
+    "full": 1600,
+}
+CALIDAD_WEBP = 80
+LADO_PLACEHOLDER = 16
+
+# Formatos que se procesan (los GIF se dejan intactos para no perder animación)
+TIPOS_PROCESABLES = {
+    "image/jpeg": "JPEG",
+    "image/png": "PNG",
+    "image/webp": "WEBP",
+}
+
+if DISPONIBLE:
+    # Evitar imágenes "bomba" que se expanden a cientos de megapíxeles
+    Image.MAX_IMAGE_PIXELS = 40_000_000
+
+
+@dataclass
+class Derivados:
+    """Resultado del procesamiento de una imagen"""
+    ancho: int
+    alto: int
+    placeholder: str
+    archivos: Dict[str, str] = field(default_factory=dict)  # variante -> ruta temporal
+
+    def eliminar(self) -> None:
+        for ruta in self.archivos.values():
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+def _modo_webp(imagen):
+    """Convierte a un modo que WebP admite, conservando la transparencia"""
+    if imagen.mode in ("RGB", "RGBA"):
+        return imagen
+    if imagen.mode in ("LA", "PA") or (imagen.mode == "P" and "transparency" in imagen.info):
+        return imagen.convert("RGBA")
+    return imagen.convert("RGB")
+
+
+def _guardar_temporal(imagen, formato: str, **opciones) -> str:
+    descriptor, ruta = tempfile.mkstemp(prefix="derivado_")
+    with os.fdopen(descriptor, "wb") as destino:
+        imagen.save(destino, formato, **opciones)
+    return ruta
+
+
+def generar_derivados(ruta: str, content_type: str) -> Optional[Derivados]:
+    """
+    Limpia EXIF de la imagen (reescribiéndola en su lugar) y genera sus variantes
+
+    Es una operación de CPU: debe llamarse desde un hilo (run_in_threadpool).
+
+    Args:
+        ruta: Archivo temporal con la imagen original
+        content_type: Tipo detectado de la imagen
+
+    Returns:
+        Derivados generados o None si Pillow no está disponible, el formato no
+        se procesa o la imagen no pudo abrirse
+    """
+    formato = TIPOS_PROCESABLES.get(content_type)
+    if not DISPONIBLE or formato is None:
+        return None
+
+    derivados = None
+    try:
+        with Image.open(ruta) as original:
+            imagen = ImageOps.exif_transpose(original)
+            imagen.load()
+
+        # Reescribir el original sin EXIF (la orientación ya quedó aplicada)
+        opciones = {"quality": 90} if formato in ("JPEG", "WEBP") else {"optimize": True}
+        if formato == "JPEG" and imagen.mode not in ("RGB", "L"):
+            imagen = imagen.convert("RGB")
+        imagen.save(ruta, formato, **opciones)
+
+        webp = _modo_webp(imagen)
+        miniatura = webp.copy()
+        miniatura.thumbnail((LADO_PLACEHOLDER, LADO_PLACEHOLDER))
+        buffer = io.BytesIO()
+        miniatura.save(buffer, "WEBP", quality=30)
+        placeholder = "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+        derivados = Derivados(ancho=imagen.width, alto=imagen.height, placeholder=placeholder)
+        for nombre, lado in VARIANTES.items():
+            variante = webp.copy()
+            variante.thumbnail((lado, lado))
+            derivados.archivos[nombre] = _guardar_temporal(variante, "WEBP", quality=CALIDAD_WEBP, method=4)
+
+        return derivados
+    except Exception as e:
+        logger.warning(f"No se pudieron generar derivados de la imagen: {e}")
+        if derivados is not None:
+            derivados.eliminar()
+        return None
@@ -0,0 +1,309 @@
+"""
+Índice en memoria de rutas de carpooling activas
+
+Geografía: cada ruta activa con coordenadas se guarda como polilínea (inicio, paradas en
+orden y destino) y se registra en las celdas de una grilla de
+RUTAS_CELDA_GRADOS grados por las que pasa. Buscar un viaje consulta solo las
+celdas alrededor del origen y del destino del pasajero, intersecta las rutas de
+ambas y calcula la distancia exacta a cada polilínea candidata, en lugar de
+recorrer todas las rutas.
+
+Horarios: los días de cada ruta se guardan como máscara de bits (lunes = bit 0)
+y, por cada día de la semana, una lista ordenada de (minuto de salida, id_ruta),
+así "martes entre 07:00 y 07:30" son dos búsquedas binarias. También se llevan
+los pasajeros aceptados por ruta (ruta.pasajeros_aceptados) para filtrar por
+lugares libres.
+
+Se carga al iniciar, se recarga cada RUTAS_INDICE_REFRESH_SECONDS y las rutas
+de carpooling lo actualizan al crear, editar o desactivar una ruta y las de
+pasajeros al aceptar o cancelar una solicitud.
+"""
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from supabase import AsyncClient
+import heapq
+
+from app.config import settings
+from app.models.carpooling import DIAS_SEMANA
+from app.utils.geo import Punto, celdas_cercanas, celdas_de_linea, coordenadas, distancia_a_linea
+from app.utils.indices import RecargaPeriodica, leer_tabla
+
+CAMPOS_RUTA = (
+    "id_ruta, id_user, lat_inicio, lon_inicio, lat_destino, lon_destino, activa, "
+    "hora_salida, dias_disponibles, capacidad_ruta, pasajeros_aceptados, fecha_creacion"
+)
+CAMPOS_PARADA = "id_parada, id_ruta, orden_parada, latitud, longitud"
+
+
+def mascara_dias(dias: Iterable[str]) -> int:
+    """Máscara de bits de una lista de días ("Lunes" = 1, "Martes" = 2, ...)"""
+    mascara = 0
+    for dia in dias:
+        dia = dia.strip()
+        if dia in DIAS_SEMANA:
+            mascara |= 1 << DIAS_SEMANA.index(dia)
+    return mascara
+
+
+def minuto_del_dia(hora: str) -> int:
+    """Minutos desde medianoche de una hora HH:MM o HH:MM:SS"""
+    partes = hora.split(":")
+    return int(partes[0]) * 60 + int(partes[1])
+
+
+def linea_de_ruta(ruta: dict, paradas: List[dict]) -> Optional[List[Punto]]:
+    """
+    Polilínea inicio -> paradas (por orden) -> destino, o None si la ruta no
+    tiene coordenadas de inicio y destino (las paradas sin coordenadas se omiten)
+    """
+    inicio = coordenadas(ruta.get("lat_inicio"), ruta.get("lon_inicio"))
+    destino = coordenadas(ruta.get("lat_destino"), ruta.get("lon_destino"))
+    if inicio is None or destino is None:
+        return None
+    intermedias = [
+        coordenadas(p.get("latitud"), p.get("longitud"))
+        for p in sorted(paradas, key=lambda p: p.get("orden_parada") or 0)
+    ]
+    return [inicio, *(p for p in intermedias if p is not None), destino]
+
+
+class IndiceRutas(RecargaPeriodica):
+    """
+    Grilla de celdas -> rutas activas que pasan por ellas
+    """
+
+    nombre = "índice de rutas"
+
+    def __init__(self, tamano_celda: float = 0.01, intervalo: float = 600):
+        super().__init__(intervalo)
+        self.tamano_celda = tamano_celda
+        self._rutas: Dict[str, dict] = {}
+        self._paradas: Dict[str, List[dict]] = {}
+        self._lineas: Dict[str, List[Punto]] = {}
+        self._celdas_ruta: Dict[str, Set[Tuple[int, int]]] = {}
+        self._grilla: Dict[Tuple[int, int], Set[str]] = defaultdict(set)
+        self._dias: Dict[str, int] = {}
+        self._salidas: Dict[str, int] = {}
+        # Por día de la semana: (minuto de salida, id_ruta) ordenados
+        self._por_dia: List[List[Tuple[int, str]]] = [[] for _ in DIAS_SEMANA]
+        # Cambios recibidos mientras se recarga el índice, para no perderlos
+        self._cambios_en_carga: Optional[List[tuple]] = None
+
+    def __len__(self) -> int:
+        return len(self._lineas)
+
+    def actualizar_ruta(self, ruta: dict, paradas: Optional[List[dict]] = None) -> None:
+        """
+        Agrega o reemplaza una ruta (y sus paradas si se indican); si quedó
+        inactiva la quita
+        """
+        if self._cambios_en_carga is not None:
+            self._cambios_en_carga.append(("actualizar_ruta", (ruta, paradas)))
+        id_ruta = ruta["id_ruta"]
+        if ruta.get("activa") is False:
+            self._quitar(id_ruta)
+            return
+
+        datos = {**self._rutas.get(id_ruta, {}), **ruta}
+        if paradas is None:
+            paradas = self._paradas.get(id_ruta, [])
+        self._quitar(id_ruta)
+        self._rutas[id_ruta] = datos
+        self._paradas[id_ruta] = paradas
+        self._indexar_horario(id_ruta, datos)
+
+        linea = linea_de_ruta(datos, paradas)
+        if linea is None:
+            return
+        celdas = celdas_de_linea(linea, self.tamano_celda)
+        self._lineas[id_ruta] = linea
+        self._celdas_ruta[id_ruta] = celdas
+        for c in celdas:
+            self._grilla[c].add(id_ruta)
+
+    def eliminar_ruta(self, id_ruta: str) -> None:
+        """
+        Quita una ruta del índice
+        """
+        if self._cambios_en_carga is not None:
+            self._cambios_en_carga.append(("eliminar_ruta", (id_ruta,)))
+        self._quitar(id_ruta)
+
+    def _indexar_horario(self, id_ruta: str, ruta: dict) -> None:
+        if not ruta.get("hora_salida") or not ruta.get("dias_disponibles"):
+            return
+        dias = mascara_dias(ruta["dias_disponibles"].split(","))
+        salida = minuto_del_dia(ruta["hora_salida"])
+        self._dias[id_ruta], self._salidas[id_ruta] = dias, salida
+        for dia in range(len(DIAS_SEMANA)):
+            if dias & (1 << dia):
+                insort(self._por_dia[dia], (salida, id_ruta))
+
+    def _quitar_horario(self, id_ruta: str) -> None:
+        dias, salida = self._dias.pop(id_ruta, 0), self._salidas.pop(id_ruta, None)
+        for dia in range(len(DIAS_SEMANA)):
+            if dias & (1 << dia):
+                lista = self._por_dia[dia]
+                posicion = bisect_left(lista, (salida, id_ruta))
+                if posicion < len(lista) and lista[posicion] == (salida, id_ruta):
+                    del lista[posicion]
+
+    def ruta(self, id_ruta: str) -> Optional[dict]:
+        return self._rutas.get(id_ruta)
+
+    def linea(self, id_ruta: str) -> Optional[List[Punto]]:
+        return self._lineas.get(id_ruta)
+
+    def ajustar_aceptados(self, id_ruta: str, delta: int) -> None:
+        """
+        Suma (o resta) pasajeros aceptados de una ruta
+
+        No se repite sobre una recarga en curso: la lectura puede incluir ya el
+        cambio y el contador quedaría doble; la siguiente recarga lo corrige.
+        """
+        ruta = self._rutas.get(id_ruta)
+        if ruta is not None:
+            ruta["pasajeros_aceptados"] = max((ruta.get("pasajeros_aceptados") or 0) + delta, 0)
+
+    def lugares_disponibles(self, id_ruta: str) -> int:
+        ruta = self._rutas.get(id_ruta, {})
+        return (ruta.get("capacidad_ruta") or 0) - (ruta.get("pasajeros_aceptados") or 0)
+
+    def filtrar(
+        self,
+        dias: int = 0,
+        desde: Optional[int] = None,
+        hasta: Optional[int] = None,
+        lugares_min: Optional[int] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        Rutas activas que salen alguno de los `dias` (máscara; 0 = cualquiera)
+        entre los minutos `desde` y `hasta` y con al menos `lugares_min`
+        lugares libres
+
+        Returns:
+            Lista de (fecha_creacion, id_ruta) de la más reciente a la más antigua
+        """
+        if dias or desde is not None or hasta is not None:
+            inicio = (desde if desde is not None else 0, "")
+            fin = (hasta if hasta is not None else 24 * 60, "\uffff")
+            ids: Set[str] = set()
+            for dia in range(len(DIAS_SEMANA)):
+                if dias and not dias & (1 << dia):
+                    continue
+                lista = self._por_dia[dia]
+                ids.update(i for _, i in lista[bisect_left(lista, inicio):bisect_right(lista, fin)])
+        else:
+            ids = set(self._rutas)
+
+        if lugares_min is not None:
+            ids = {i for i in ids if self.lugares_disponibles(i) >= lugares_min}
+
+        claves = [(str(self._rutas[i].get("fecha_creacion") or ""), i) for i in ids]
+        claves.sort(reverse=True)
+        return claves
+
+    def _quitar(self, id_ruta: str) -> None:
+        self._quitar_horario(id_ruta)
+        for c in self._celdas_ruta.pop(id_ruta, ()):
+            rutas = self._grilla.get(c)
+            if rutas is not None:
+                rutas.discard(id_ruta)
+                if not rutas:
+                    del self._grilla[c]
+        self._lineas.pop(id_ruta, None)
+        self._rutas.pop(id_ruta, None)
+        self._paradas.pop(id_ruta, None)
+
+    def _cercanas(self, punto: Punto, radio_m: float) -> Set[str]:
+        rutas: Set[str] = set()
+        for c in celdas_cercanas(punto, radio_m, self.tamano_celda):
+            rutas |= self._grilla.get(c, set())
+        return rutas
+
+    def buscar(self, origen: Punto, destino: Punto, radio_m: float, limit: int = 20) -> List[dict]:
+        """
+        Rutas que pasan a menos de `radio_m` del origen y luego del destino,
+        de menor a mayor desvío
+
+        El desvío estimado es ir y volver desde la ruta hasta el origen y hasta
+        el destino: 2 * (distancia al origen + distancia al destino).
+
+        Returns:
+            Lista de {id_ruta, distancia_origen_m, distancia_destino_m, desvio_m}
+        """
+        candidatas = self._cercanas(origen, radio_m) & self._cercanas(destino, radio_m)
+        resultados = []
+        for id_ruta in candidatas:
+            linea = self._lineas[id_ruta]
+            d_origen, s_origen = distancia_a_linea(origen, linea)
+            if d_origen > radio_m:
+                continue
+            d_destino, s_destino = distancia_a_linea(destino, linea)
+            # El origen debe quedar antes que el destino en el sentido de la ruta
+            if d_destino > radio_m or s_origen > s_destino:
+                continue
+            resultados.append((2 * (d_origen + d_destino), id_ruta, d_origen, d_destino))
+
+        return [
+            {
+                "id_ruta": id_ruta,
+                "distancia_origen_m": round(d_origen),
+                "distancia_destino_m": round(d_destino),
+                "desvio_m": round(desvio),
+            }
+            for desvio, id_ruta, d_origen, d_destino in heapq.nsmallest(limit, resultados)
+        ]
+
+    async def cargar(self, db: AsyncClient) -> None:
+        """
+        Recarga las rutas activas y sus paradas y reemplaza el índice
+        """
+        self._cambios_en_carga = []
+        try:
+            rutas = await leer_tabla(db, "ruta", CAMPOS_RUTA, "id_ruta", activa=True)
+            paradas = await leer_tabla(db, "parada", CAMPOS_PARADA, "id_parada")
+
+            # Armar el índice nuevo fuera del event loop (es CPU pura)
+            nuevo = await run_in_threadpool(_construir, rutas, paradas, self.tamano_celda)
+            # Aplicar lo que cambió mientras se cargaba
+            for operacion, argumentos in self._cambios_en_carga:
+                getattr(nuevo, operacion)(*argumentos)
+
+            for atributo in ("_rutas", "_paradas", "_lineas", "_celdas_ruta", "_grilla",
+                             "_dias", "_salidas", "_por_dia"):
+                setattr(self, atributo, getattr(nuevo, atributo))
+            self._marcar_cargado()
+        finally:
+            self._cambios_en_carga = None
+
+    def stats(self) -> dict:
+        """
+        Métricas del índice para /health
+        """
+        return {
+            "cargado": self.cargado,
+            "rutas": len(self._rutas),
+            "con_coordenadas": len(self._lineas),
+            "celdas": len(self._grilla),
+            "ultima_carga": self.ultima_carga,
+        }
+
+
+def _construir(rutas: List[dict], paradas: List[dict], tamano_celda: float) -> IndiceRutas:
+    indice = IndiceRutas(tamano_celda=tamano_celda)
+    por_ruta: Dict[str, List[dict]] = defaultdict(list)
+    for parada in paradas:
+        por_ruta[parada["id_ruta"]].append(parada)
+    for ruta in rutas:
+        indice.actualizar_ruta(ruta, por_ruta.get(ruta["id_ruta"], []))
+    return indice
+
+
+# Índice global de la aplicación
+indice_rutas = IndiceRutas(
+    tamano_celda=settings.RUTAS_CELDA_GRADOS,
+    intervalo=settings.RUTAS_INDICE_REFRESH_SECONDS
+)
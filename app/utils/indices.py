@@ -0,0 +1,148 @@
+"""
+Base para índices en memoria construidos desde tablas completas
+
+Los índices (búsqueda de usuarios, grafo de amistades, ...) se cargan al
+iniciar la aplicación y se recargan por completo cada cierto tiempo en segundo
+plano, para corregir cambios hechos por otros workers o fuera de la API. Entre
+recargas las rutas los actualizan al momento.
+"""
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+from supabase import AsyncClient
+import asyncio
+import logging
+import time
+
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Filas por página al leer una tabla completa
+TAM_PAGINA_CARGA = 1000
+
+# Espera antes de reintentar una carga fallida (segundos)
+REINTENTO_CARGA = 30
+
+
+async def leer_tabla(
+    db: AsyncClient,
+    tabla: str,
+    columnas: str,
+    orden: str,
+    en: Optional[Tuple[str, List]] = None,
+    **filtros
+) -> List[dict]:
+    """
+    Lee todas las filas de una tabla por páginas
+
+    Args:
+        db: Cliente de base de datos
+        tabla: Tabla a leer
+        columnas: Columnas a seleccionar
+        orden: Columna única para paginar de forma estable
+        en: (columna, valores) para filtrar con `in_`
+        **filtros: Igualdades columna=valor
+    """
+    filas: List[dict] = []
+    inicio = 0
+    while True:
+        consulta = db.table(tabla).select(columnas)
+        if en is not None:
+            consulta = consulta.in_(*en)
+        for columna, valor in filtros.items():
+            consulta = consulta.eq(columna, valor)
+        response = await consulta.order(orden).range(inicio, inicio + TAM_PAGINA_CARGA - 1).execute()
+        filas.extend(response.data or [])
+        if len(response.data or []) < TAM_PAGINA_CARGA:
+            return filas
+        inicio += TAM_PAGINA_CARGA
+
+
+async def leer_en_lotes(
+    db: AsyncClient,
+    tabla: str,
+    columnas: str,
+    orden: str,
+    columna: str,
+    valores: List,
+    tam_lote: int = 200,
+    **filtros
+) -> List[dict]:
+    """
+    Lee las filas cuyo `columna` está en `valores`, en lotes de `tam_lote`
+    valores (para no exceder el largo de la URL) y cada lote por páginas
+    """
+    filas: List[dict] = []
+    for inicio in range(0, len(valores), tam_lote):
+        filas.extend(await leer_tabla(
+            db, tabla, columnas, orden, en=(columna, valores[inicio:inicio + tam_lote]), **filtros
+        ))
+    return filas
+
+
+class RecargaPeriodica(ABC):
+    """
+    Recarga un índice en segundo plano cada `intervalo` segundos
+
+    Las subclases implementan `cargar(db)` (que reemplaza el contenido) y
+    `__len__` para el registro.
+    """
+
+    nombre = "índice"
+
+    def __init__(self, intervalo: float):
+        self.intervalo = intervalo
+        self.cargado = False
+        self.ultima_carga: Optional[float] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._lock_carga = asyncio.Lock()
+
+    @abstractmethod
+    async def cargar(self, db: AsyncClient) -> None:
+        """Lee las tablas y reemplaza el contenido del índice"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Cantidad de elementos indexados"""
+
+    async def asegurar_cargado(self, db: AsyncClient) -> None:
+        """
+        Carga el índice si todavía no se cargó (una sola vez aunque lo pidan
+        varias peticiones a la vez)
+        """
+        if self.cargado:
+            return
+        async with self._lock_carga:
+            if not self.cargado:
+                await self.cargar(db)
+
+    def _marcar_cargado(self) -> None:
+        self.cargado = True
+        self.ultima_carga = time.time()
+
+    async def iniciar(self) -> None:
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._refrescar())
+
+    async def cerrar(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    async def _refrescar(self) -> None:
+        while True:
+            try:
+                async with self._lock_carga:
+                    await self.cargar(await get_db())
+                logger.info(f"{self.nombre.capitalize()} cargado ({len(self)} elementos)")
+                espera = self.intervalo
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"No se pudo cargar el {self.nombre}: {e}")
+                espera = REINTENTO_CARGA
+            await asyncio.sleep(espera)
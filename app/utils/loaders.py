@@ -0,0 +1,125 @@
+"""
+Cargadores por request (DataLoader) para hidratar usuarios en lote
+"""
+from fastapi import Depends
+from typing import Dict, Iterable, List, Optional
+from supabase import AsyncClient
+import asyncio
+
+from app.database import get_db
+
+# Máximo de IDs por consulta `in_` (evita URLs demasiado largas en PostgREST)
+MAX_IDS_POR_CONSULTA = 150
+
+# Campos públicos de un usuario usados en listados (amigos, solicitudes, etc.)
+CAMPOS_USUARIO_PUBLICO = ["id_user", "nombre", "apellido", "correo", "rol", "foto_perfil"]
+
+
+class UserLoader:
+    """
+    Agrupa las búsquedas de usuarios de un mismo request en una sola consulta
+
+    Las llamadas a `load`/`load_many` hechas en el mismo ciclo del event loop se
+    resuelven con un único `in_("id_user", ...)`. Los IDs se de-duplican y cada
+    usuario se memoriza durante el request, así que pedirlo de nuevo no cuesta
+    otra consulta.
+    """
+
+    def __init__(self, db: AsyncClient):
+        self.db = db
+        self._memo: Dict[str, asyncio.Future] = {}
+        self._pendientes: List[str] = []
+        self._despacho: Optional[asyncio.Future] = None
+
+    def load(self, id_user: str) -> asyncio.Future:
+        """
+        Obtiene un usuario por ID (sin contraseña) o None si no existe
+        """
+        futuro = self._memo.get(id_user)
+        if futuro is not None:
+            return futuro
+
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self._memo[id_user] = futuro
+        self._pendientes.append(id_user)
+
+        if self._despacho is None:
+            self._despacho = asyncio.ensure_future(self._despachar())
+        return futuro
+
+    async def load_many(
+        self,
+        ids: Iterable[str],
+        campos: Optional[List[str]] = None
+    ) -> Dict[str, dict]:
+        """
+        Obtiene varios usuarios a la vez
+
+        Args:
+            ids: IDs de usuario (pueden repetirse)
+            campos: Si se indica, solo se devuelven estos campos de cada usuario
+
+        Returns:
+            Diccionario id_user -> usuario (los inexistentes se omiten)
+        """
+        ids_unicos = list(dict.fromkeys(i for i in ids if i))
+        usuarios = await asyncio.gather(*(self.load(i) for i in ids_unicos))
+
+        resultado = {}
+        for id_user, usuario in zip(ids_unicos, usuarios):
+            if usuario is None:
+                continue
+            if campos:
+                usuario = {k: usuario.get(k) for k in campos}
+            resultado[id_user] = usuario
+        return resultado
+
+    def prime(self, usuario: dict) -> None:
+        """
+        Registra en la memoria un usuario que ya se tiene (p. ej. el usuario actual)
+        """
+        id_user = usuario.get("id_user")
+        if not id_user or id_user in self._memo:
+            return
+        futuro = asyncio.get_running_loop().create_future()
+        futuro.set_result({k: v for k, v in usuario.items() if k != "contrasena"})
+        self._memo[id_user] = futuro
+
+    async def _despachar(self) -> None:
+        """
+        Ejecuta las búsquedas acumuladas en consultas `in_` por bloques
+        """
+        # Ceder el control una vez para que el resto del request encole sus IDs
+        await asyncio.sleep(0)
+        ids = self._pendientes
+        self._pendientes = []
+        self._despacho = None
+
+        for inicio in range(0, len(ids), MAX_IDS_POR_CONSULTA):
+            bloque = ids[inicio:inicio + MAX_IDS_POR_CONSULTA]
+            try:
+                response = await self.db.table("usuario")\
+                    .select("*")\
+                    .in_("id_user", bloque)\
+                    .execute()
+                encontrados = {
+                    u["id_user"]: {k: v for k, v in u.items() if k != "contrasena"}
+                    for u in response.data or []
+                }
+                for id_user in bloque:
+                    futuro = self._memo[id_user]
+                    if not futuro.done():
+                        futuro.set_result(encontrados.get(id_user))
+            except Exception as e:
+                for id_user in bloque:
+                    futuro = self._memo.pop(id_user, None)
+                    if futuro is not None and not futuro.done():
+                        futuro.set_exception(e)
+
+
+async def get_user_loader(db: AsyncClient = Depends(get_db)) -> UserLoader:
+    """
+    Dependencia que crea un UserLoader nuevo para cada request
+    """
+    return UserLoader(db)
@@ -0,0 +1,179 @@
+"""
+Escrituras en lote con compensación
+
+`insertar_lote` envía todas las filas de una tabla en un único INSERT de varias
+filas (PostgREST lo ejecuta como una sola sentencia: se insertan todas o
+ninguna). `EscrituraCompensada` registra lo insertado en una operación de
+varios pasos (padre + hijos) y, si un paso posterior falla, elimina lo ya
+creado en orden inverso para no dejar registros huérfanos.
+
+Los workers en segundo plano usan `escribir_separando`: si un lote falla por
+un error que no se arregla reintentando (una fila viola un CHECK o una clave
+foránea), se divide en mitades hasta aislar las filas inválidas y el resto se
+escribe igual.
+"""
+from typing import Awaitable, Callable, List, Optional, Tuple
+from postgrest.exceptions import APIError
+from supabase import AsyncClient, Client
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Filas por petición; lotes mayores se dividen para no exceder el tamaño del cuerpo
+TAM_LOTE = 500
+
+
+async def insertar_lote(
+    db: AsyncClient,
+    tabla: str,
+    filas: List[dict],
+    clave: Optional[str] = None
+) -> List[dict]:
+    """
+    Inserta varias filas con el mínimo de peticiones
+
+    Args:
+        db: Cliente de base de datos
+        tabla: Tabla destino
+        filas: Filas a insertar (todas con las mismas columnas)
+        clave: Clave primaria; si el lote se divide en varias peticiones y una
+            falla, se usa para eliminar las filas ya insertadas
+
+    Returns:
+        Filas insertadas, en el mismo orden
+    """
+    if not filas:
+        return []
+
+    insertadas: List[dict] = []
+    try:
+        for i in range(0, len(filas), TAM_LOTE):
+            response = await db.table(tabla).insert(filas[i:i + TAM_LOTE]).execute()
+            insertadas.extend(response.data or [])
+    except Exception:
+        if insertadas and clave:
+            await _eliminar(db, tabla, clave, [f[clave] for f in insertadas])
+        raise
+
+    return insertadas
+
+
+def insertar_lote_sync(
+    client: Client,
+    tabla: str,
+    filas: List[dict],
+    clave: Optional[str] = None
+) -> List[dict]:
+    """
+    Versión síncrona de `insertar_lote` para los scripts de mantenimiento
+    """
+    if not filas:
+        return []
+
+    insertadas: List[dict] = []
+    try:
+        for i in range(0, len(filas), TAM_LOTE):
+            response = client.table(tabla).insert(filas[i:i + TAM_LOTE]).execute()
+            insertadas.extend(response.data or [])
+    except Exception:
+        if insertadas and clave:
+            client.table(tabla).delete().in_(clave, [f[clave] for f in insertadas]).execute()
+        raise
+
+    return insertadas
+
+
+def es_error_permanente(error: Exception) -> bool:
+    """
+    True si el error se debe a los datos enviados y reintentar no lo arregla
+
+    Son errores de PostgREST (4xx) con SQLSTATE de datos inválidos (22),
+    restricciones violadas (23: CHECK, clave foránea, NOT NULL) o de
+    definición (42), o errores propios de PostgREST (PGRST...). Caídas de red,
+    timeouts y errores 5xx son transitorios.
+    """
+    if not isinstance(error, APIError):
+        return False
+    codigo = str(error.code or "")
+    return codigo[:2] in ("22", "23", "42") or codigo.startswith("PGRST")
+
+
+def es_funcion_inexistente(error: Exception) -> bool:
+    """
+    True si el error indica que la función RPC no existe (migración sin aplicar)
+    """
+    return isinstance(error, APIError) and str(error.code or "") in ("PGRST202", "42883")
+
+
+async def escribir_separando(
+    escribir: Callable[[List[dict]], Awaitable[List[dict]]],
+    filas: List[dict]
+) -> Tuple[List[dict], List[dict]]:
+    """
+    Escribe un lote aislando las filas que fallan por errores permanentes
+
+    Si `escribir` falla con un error permanente, el lote se divide en mitades
+    recursivamente hasta dejar solo las filas inválidas. Los errores
+    transitorios se propagan para que el llamador reintente.
+
+    Args:
+        escribir: Función que escribe un lote y devuelve las filas escritas
+        filas: Filas a escribir
+
+    Returns:
+        Tupla (filas escritas, filas rechazadas)
+    """
+    if not filas:
+        return [], []
+    try:
+        return await escribir(filas), []
+    except Exception as e:
+        if not es_error_permanente(e):
+            raise
+        if len(filas) == 1:
+            logger.warning(f"Fila rechazada ({e.code}): {e.message}")
+            return [], filas
+    mitad = len(filas) // 2
+    escritas1, rechazadas1 = await escribir_separando(escribir, filas[:mitad])
+    escritas2, rechazadas2 = await escribir_separando(escribir, filas[mitad:])
+    return escritas1 + escritas2, rechazadas1 + rechazadas2
+
+
+async def _eliminar(db: AsyncClient, tabla: str, clave: str, ids: List[str]) -> None:
+    try:
+        await db.table(tabla).delete().in_(clave, ids).execute()
+    except Exception as e:
+        logger.error(f"No se pudieron revertir {len(ids)} filas de {tabla}: {e}")
+
+
+class EscrituraCompensada:
+    """
+    Agrupa inserciones dependientes y las revierte si alguna falla
+
+    Uso:
+        async with EscrituraCompensada(db) as escritura:
+            padre = (await escritura.insertar("publicacion", [datos], "id_publicacion"))[0]
+            await escritura.insertar("media", hijos, "id_media")
+    """
+
+    def __init__(self, db: AsyncClient):
+        self.db = db
+        self._insertadas: List[Tuple[str, str, List[str]]] = []
+
+    async def insertar(self, tabla: str, filas: List[dict], clave: str) -> List[dict]:
+        """
+        Inserta un lote y lo registra para revertirlo si la operación falla
+        """
+        insertadas = await insertar_lote(self.db, tabla, filas, clave)
+        if insertadas:
+            self._insertadas.append((tabla, clave, [f[clave] for f in insertadas]))
+        return insertadas
+
+    async def __aenter__(self) -> "EscrituraCompensada":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None:
+            for tabla, clave, ids in reversed(self._insertadas):
+                await _eliminar(self.db, tabla, clave, ids)
+        return False
@@ -0,0 +1,225 @@
+"""
+Lugares ocupados de las rutas de carpooling
+
+Los pasajeros aceptados se guardan desnormalizados en ruta.pasajeros_aceptados
+(ver add_lugares_ruta.sql). El cambio de estado de una solicitud y el ajuste
+del contador se hacen en una sola función de la base de datos que bloquea la
+fila de la ruta, así dos conductores (o dos pestañas) aceptando a la vez no
+pueden superar la capacidad. Un recálculo periódico corrige desvíos; el
+contador guarda la cantidad real, así una ruta sobrevendida de antes no acepta
+a nadie hasta volver a tener lugar.
+
+Bajar la capacidad es una actualización condicionada a que siga cubriendo a
+los aceptados, así no puede cruzarse con una aceptación simultánea.
+
+Si la migración aún no está aplicada, los listados cuentan los pasajeros de
+toda la página con una sola consulta y los cambios de estado validan la
+capacidad con un conteo previo (sin protección ante aceptaciones simultáneas).
+"""
+from collections import Counter
+from typing import List, Optional
+from fastapi import HTTPException, status
+from postgrest.exceptions import APIError
+from supabase import AsyncClient
+import asyncio
+import logging
+
+from app.config import settings
+from app.database import get_db
+from app.utils.lotes import es_funcion_inexistente
+
+logger = logging.getLogger(__name__)
+
+
+async def cambiar_estado_pasajero(db: AsyncClient, id_pasajero_ruta: str, estado: str) -> Optional[dict]:
+    """
+    Cambia el estado de una solicitud ajustando los lugares de la ruta
+
+    Returns:
+        La solicitud actualizada o None si no existe
+
+    Raises:
+        HTTPException: 409 si la ruta ya no tiene lugares
+    """
+    try:
+        response = await db.rpc("cambiar_estado_pasajero", {
+            "p_id_pasajero_ruta": id_pasajero_ruta,
+            "p_estado": estado
+        }).execute()
+    except APIError as e:
+        if es_funcion_inexistente(e):
+            return await _cambiar_estado_sin_contador(db, id_pasajero_ruta, estado)
+        if "ruta_llena" in str(e.message):
+            raise _ruta_llena()
+        raise
+    return response.data[0] if response.data else None
+
+
+def _ruta_llena() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="La ruta ya no tiene lugares disponibles"
+    )
+
+
+async def _cambiar_estado_sin_contador(db: AsyncClient, id_pasajero_ruta: str, estado: str) -> Optional[dict]:
+    """
+    Cambio de estado mientras add_lugares_ruta.sql no está aplicada: la
+    capacidad se valida contando los aceptados antes de actualizar
+    """
+    solicitud = await db.table("pasajeroruta")\
+        .select("estado, id_ruta, ruta:ruta(capacidad_ruta)")\
+        .eq("id_pasajero_ruta", id_pasajero_ruta)\
+        .execute()
+    if not solicitud.data:
+        return None
+    actual = solicitud.data[0]
+    if estado == "aceptado" and actual["estado"] != "aceptado":
+        aceptados = await db.table("pasajeroruta")\
+            .select("id_pasajero_ruta", count="exact")\
+            .eq("id_ruta", actual["id_ruta"])\
+            .eq("estado", "aceptado")\
+            .limit(1)\
+            .execute()
+        if (aceptados.count or 0) >= (actual.get("ruta") or {}).get("capacidad_ruta", 0):
+            raise _ruta_llena()
+
+    response = await db.table("pasajeroruta")\
+        .update({"estado": estado})\
+        .eq("id_pasajero_ruta", id_pasajero_ruta)\
+        .execute()
+    return response.data[0] if response.data else None
+
+
+def _capacidad_insuficiente() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="La capacidad no puede ser menor que los pasajeros aceptados"
+    )
+
+
+async def actualizar_ruta(db: AsyncClient, id_ruta: str, datos: dict) -> Optional[dict]:
+    """
+    Actualiza una ruta sin permitir una capacidad menor que los aceptados
+
+    La condición va en el mismo UPDATE, que se reevalúa sobre la fila
+    bloqueada si otra transacción aceptó a alguien entre medio.
+
+    Returns:
+        La ruta actualizada o None si no existe
+
+    Raises:
+        HTTPException: 400 si la capacidad queda por debajo de los pasajeros aceptados
+    """
+    consulta = db.table("ruta").update(datos).eq("id_ruta", id_ruta)
+    if datos.get("capacidad_ruta") is not None:
+        try:
+            response = await consulta.lte("pasajeros_aceptados", datos["capacidad_ruta"]).execute()
+        except APIError as e:
+            if str(e.code or "") != "42703":
+                raise
+            # Sin add_lugares_ruta.sql no hay contador: se cuenta antes de actualizar
+            aceptados = await db.table("pasajeroruta")\
+                .select("id_pasajero_ruta", count="exact")\
+                .eq("id_ruta", id_ruta)\
+                .eq("estado", "aceptado")\
+                .limit(1)\
+                .execute()
+            if (aceptados.count or 0) > datos["capacidad_ruta"]:
+                raise _capacidad_insuficiente()
+            response = await db.table("ruta").update(datos).eq("id_ruta", id_ruta).execute()
+        if not response.data:
+            existe = await db.table("ruta").select("id_ruta").eq("id_ruta", id_ruta).execute()
+            if existe.data:
+                raise _capacidad_insuficiente()
+    else:
+        response = await consulta.execute()
+    return response.data[0] if response.data else None
+
+
+async def completar_lugares(db: AsyncClient, rutas: List[dict]) -> List[dict]:
+    """
+    Completa `pasajeros_aceptados` y `lugares_disponibles` de una lista de rutas
+
+    Usa el contador de la tabla ruta cuando existe; para las rutas sin él
+    cuenta los pasajeros aceptados en lote. Nunca hace consultas por ruta.
+
+    Returns:
+        La misma lista de rutas (se modifican en el lugar)
+    """
+    sin_contador = [r["id_ruta"] for r in rutas if r.get("pasajeros_aceptados") is None]
+    aceptados: Counter = Counter()
+    if sin_contador:
+        response = await db.table("pasajeroruta")\
+            .select("id_ruta")\
+            .in_("id_ruta", sin_contador)\
+            .eq("estado", "aceptado")\
+            .execute()
+        aceptados = Counter(p["id_ruta"] for p in response.data or [])
+
+    for ruta in rutas:
+        if ruta.get("pasajeros_aceptados") is None:
+            ruta["pasajeros_aceptados"] = aceptados[ruta["id_ruta"]]
+        # Una ruta sobrevendida (datos anteriores al contador) no tiene lugares
+        ruta["lugares_disponibles"] = max(ruta["capacidad_ruta"] - ruta["pasajeros_aceptados"], 0)
+    return rutas
+
+
+class RecalculoLugares:
+    """
+    Recalcula periódicamente los contadores de pasajeros aceptados
+    """
+
+    def __init__(self, intervalo: float = 3600):
+        self.intervalo = intervalo
+        self._tarea: Optional[asyncio.Task] = None
+        self.ejecuciones = 0
+        self.corregidas = 0
+
+    async def iniciar(self) -> None:
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def cerrar(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    async def recalcular(self, db: AsyncClient) -> int:
+        """
+        Corrige los contadores que no coinciden con pasajeroruta
+
+        Returns:
+            Cantidad de rutas corregidas
+        """
+        response = await db.rpc("recalcular_pasajeros_aceptados", {}).execute()
+        corregidas = response.data or 0
+        self.ejecuciones += 1
+        self.corregidas += corregidas
+        if corregidas:
+            logger.warning(f"Se corrigieron los pasajeros aceptados de {corregidas} rutas")
+        return corregidas
+
+    async def _bucle(self) -> None:
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await self.recalcular(await get_db())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"No se pudieron recalcular los lugares de las rutas: {e}")
+
+    def stats(self) -> dict:
+        """
+        Métricas del recálculo para /health
+        """
+        return {"ejecuciones": self.ejecuciones, "corregidas": self.corregidas}
+
+
+# Recálculo global de la aplicación
+recalculo_lugares = RecalculoLugares(intervalo=settings.LUGARES_RECALCULO_SECONDS)
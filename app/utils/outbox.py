@@ -0,0 +1,215 @@
+"""
+Bandeja de salida (outbox) de notificaciones
+
+Las rutas encolan notificaciones sin esperar a la base de datos; un worker en
+segundo plano las agrupa y las inserta en lote en `notificacion`. Si la
+inserción falla por un error transitorio (base caída, timeout), el lote se
+reintenta con espera exponencial hasta que se inserte, sin perder los eventos
+encolados mientras tanto. Solo se descartan, con un log, las filas que fallan
+por errores permanentes (p. ej. un tipo que no admite el CHECK); el resto del
+lote se inserta. Al apagar la aplicación el lote en curso vuelve a la cola y
+la cola se vacía.
+
+Las notificaciones dirigidas "al autor de una publicación" se resuelven en el
+worker con una sola consulta por lote, en lugar de una por request.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+import asyncio
+import logging
+
+from app.config import settings
+from app.database import get_db
+from app.utils.lotes import es_error_permanente, escribir_separando
+from app.utils.realtime import hub
+
+logger = logging.getLogger(__name__)
+
+NOTIFICACION_NUEVA = "notificacion.nueva"
+
+
+class NotificacionOutbox:
+    """
+    Cola de notificaciones pendientes y worker que las persiste en lote
+    """
+
+    def __init__(
+        self,
+        tam_lote: int = 100,
+        intervalo: float = 0.2,
+        max_pendientes: int = 10000,
+        reintento_max: float = 30.0
+    ):
+        self.tam_lote = tam_lote
+        self.intervalo = intervalo
+        self.reintento_max = reintento_max
+        self._cola: asyncio.Queue = asyncio.Queue(maxsize=max_pendientes)
+        self._tarea: Optional[asyncio.Task] = None
+        self.insertadas = 0
+        self.reintentos = 0
+        self.descartadas = 0
+        self.rechazadas = 0
+
+    def encolar(
+        self,
+        id_user: Optional[str],
+        contenido: str,
+        tipo: str,
+        id_referencia: Optional[str] = None,
+        id_publicacion: Optional[str] = None,
+        id_actor: Optional[str] = None
+    ) -> None:
+        """
+        Encola una notificación para insertarla en segundo plano
+
+        Args:
+            id_user: Destinatario (o None si se resuelve por `id_publicacion`)
+            contenido: Texto de la notificación
+            tipo: Tipo de notificación
+            id_referencia: Entidad relacionada (solicitud, postulación, ...)
+            id_publicacion: Notificar al autor de esta publicación
+            id_actor: Usuario que origina el evento; no se le notifica a sí mismo
+        """
+        fila = {
+            "id_user": id_user,
+            "contenido": contenido,
+            "tipo": tipo,
+            "leida": False,
+            "fecha_envio": datetime.utcnow().isoformat(),
+            "id_referencia": id_referencia,
+        }
+        try:
+            self._cola.put_nowait((fila, id_publicacion, id_actor))
+        except asyncio.QueueFull:
+            self.descartadas += 1
+            logger.error(f"Outbox de notificaciones lleno, se descarta: {fila}")
+
+    async def iniciar(self) -> None:
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._worker())
+
+    async def cerrar(self) -> None:
+        """
+        Detiene el worker e inserta lo que quede en la cola
+        """
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+        pendientes = self._tomar_lote(sin_limite=True)
+        if pendientes:
+            try:
+                await self._persistir(pendientes)
+            except Exception as e:
+                logger.error(f"No se pudieron insertar {len(pendientes)} notificaciones al cerrar: {e}")
+
+    def _tomar_lote(self, sin_limite: bool = False) -> List[tuple]:
+        lote = []
+        while not self._cola.empty() and (sin_limite or len(lote) < self.tam_lote):
+            lote.append(self._cola.get_nowait())
+        return lote
+
+    async def _worker(self) -> None:
+        lote: List[tuple] = []
+        espera = 1.0
+        try:
+            while True:
+                if not lote:
+                    lote.append(await self._cola.get())
+                    # Dar tiempo a que lleguen más eventos para agruparlos
+                    await asyncio.sleep(self.intervalo)
+                    lote.extend(self._tomar_lote())
+
+                try:
+                    await self._persistir(lote)
+                    lote = []
+                    espera = 1.0
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if es_error_permanente(e):
+                        # Falló la consulta de autores con datos que no se arreglan reintentando
+                        self.rechazadas += len(lote)
+                        logger.error(f"Se descartan {len(lote)} notificaciones por un error permanente: {e}")
+                        lote = []
+                        continue
+                    self.reintentos += 1
+                    logger.warning(f"Error insertando {len(lote)} notificaciones, reintento en {espera:.0f}s: {e}")
+                    await asyncio.sleep(espera)
+                    espera = min(espera * 2, self.reintento_max)
+        finally:
+            # Cancelado en cualquier punto (incluidas las esperas): devolver el
+            # lote a la cola para que cerrar() lo inserte
+            for item in lote:
+                self._reencolar(item)
+
+    def _reencolar(self, item: tuple) -> None:
+        try:
+            self._cola.put_nowait(item)
+        except asyncio.QueueFull:
+            self.descartadas += 1
+
+    async def _persistir(self, lote: List[tuple]) -> None:
+        """
+        Resuelve destinatarios pendientes e inserta el lote en una sola llamada
+        """
+        db = await get_db()
+
+        ids_publicacion = list({id_pub for _, id_pub, _ in lote if id_pub})
+        autores: Dict[str, str] = {}
+        if ids_publicacion:
+            response = await db.table("publicacion")\
+                .select("id_publicacion, id_user")\
+                .in_("id_publicacion", ids_publicacion)\
+                .execute()
+            autores = {p["id_publicacion"]: p["id_user"] for p in response.data or []}
+
+        filas = []
+        for fila, id_publicacion, id_actor in lote:
+            destinatario = fila["id_user"] or autores.get(id_publicacion)
+            if not destinatario or destinatario == id_actor:
+                continue
+            filas.append({**fila, "id_user": destinatario})
+
+        if not filas:
+            return
+
+        async def insertar(parte: List[dict]) -> List[dict]:
+            response = await db.table("notificacion").insert(parte).execute()
+            return response.data or []
+
+        insertadas, rechazadas = await escribir_separando(insertar, filas)
+        self.insertadas += len(insertadas)
+        if rechazadas:
+            self.rechazadas += len(rechazadas)
+            logger.error(f"Se descartan {len(rechazadas)} notificaciones inválidas: {rechazadas}")
+
+        for notificacion in insertadas:
+            await hub.publicar([notificacion["id_user"]], {
+                "tipo": NOTIFICACION_NUEVA,
+                "data": notificacion,
+            })
+
+    def stats(self) -> dict:
+        """
+        Métricas del outbox para /health
+        """
+        return {
+            "pendientes": self._cola.qsize(),
+            "insertadas": self.insertadas,
+            "reintentos": self.reintentos,
+            "descartadas": self.descartadas,
+            "rechazadas": self.rechazadas,
+        }
+
+
+# Outbox global de la aplicación
+outbox = NotificacionOutbox(
+    tam_lote=settings.OUTBOX_BATCH_SIZE,
+    intervalo=settings.OUTBOX_FLUSH_INTERVAL,
+    max_pendientes=settings.OUTBOX_MAX_PENDING
+)
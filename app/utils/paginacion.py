@@ -0,0 +1,131 @@
+"""
+Paginación por cursor (keyset) para listados ordenados por fecha
+
+El cursor es opaco para el cliente: codifica la fecha y la clave primaria de
+la última fila devuelta. La página siguiente se pide con `cursor` y se filtra
+por (fecha, id) en lugar de saltar filas con OFFSET, así el costo no crece con
+la profundidad y no hay duplicados cuando llegan filas nuevas. Si no se envía
+`cursor`, se respeta `skip` como antes.
+"""
+from fastapi import HTTPException, Response, status
+from typing import List, Optional, Sequence, Tuple
+import base64
+import json
+
+# Header con el cursor de la página siguiente (el cuerpo sigue siendo una lista)
+HEADER_SIGUIENTE_CURSOR = "X-Next-Cursor"
+
+
+def codificar_cursor(fecha: str, id_fila: str) -> str:
+    """
+    Genera un cursor opaco a partir de la fecha y el ID de una fila
+    """
+    crudo = json.dumps({"f": fecha, "id": id_fila}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Obtiene (fecha, id) de un cursor
+
+    Raises:
+        HTTPException: Si el cursor es inválido
+    """
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode())
+        fecha, id_fila = str(datos["f"]), str(datos["id"])
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación inválido"
+        )
+    if '"' in fecha or '"' in id_fila:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación inválido"
+        )
+    return fecha, id_fila
+
+
+async def paginar(
+    query,
+    campo_fecha: str,
+    campo_id: str,
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    desc: bool = True
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Ejecuta una consulta paginada por cursor (o por `skip` si no hay cursor)
+
+    Args:
+        query: Consulta de PostgREST aún sin ejecutar
+        campo_fecha: Columna de fecha por la que se ordena
+        campo_id: Clave primaria, usada para desempatar
+        skip: Filas a saltar cuando no se usa cursor (compatibilidad)
+        limit: Tamaño de página
+        cursor: Cursor recibido del cliente
+        desc: Orden descendente (más recientes primero)
+
+    Returns:
+        Tupla (filas de la página, cursor de la página siguiente o None)
+    """
+    query = query.order(campo_fecha, desc=desc).order(campo_id, desc=desc)
+
+    if cursor:
+        fecha, id_fila = decodificar_cursor(cursor)
+        op = "lt" if desc else "gt"
+        query = query.or_(
+            f'{campo_fecha}.{op}."{fecha}",'
+            f'and({campo_fecha}.eq."{fecha}",{campo_id}.{op}."{id_fila}")'
+        )
+        query = query.limit(limit + 1)
+    else:
+        query = query.range(skip, skip + limit)
+
+    response = await query.execute()
+    filas = response.data or []
+
+    siguiente = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        ultima = filas[-1]
+        siguiente = codificar_cursor(ultima[campo_fecha], ultima[campo_id])
+
+    return filas, siguiente
+
+
+def paginar_en_memoria(
+    claves: Sequence[Tuple[str, str]],
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None
+) -> Tuple[List[str], Optional[str]]:
+    """
+    Pagina una lista ya ordenada de (fecha, id) de más reciente a más antigua
+    con los mismos cursores que `paginar` (para listados filtrados en memoria)
+
+    Returns:
+        Tupla (IDs de la página, cursor de la página siguiente o None)
+    """
+    if cursor:
+        posicion = decodificar_cursor(cursor)
+        claves = [c for c in claves if c < posicion]
+    else:
+        claves = claves[skip:]
+
+    siguiente = None
+    if len(claves) > limit:
+        claves = claves[:limit]
+        siguiente = codificar_cursor(*claves[-1])
+    return [id_fila for _, id_fila in claves], siguiente
+
+
+def exponer_cursor(response: Response, siguiente: Optional[str]) -> None:
+    """
+    Publica el cursor de la página siguiente en el header de la respuesta
+    """
+    if siguiente:
+        response.headers[HEADER_SIGUIENTE_CURSOR] = siguiente
@@ -0,0 +1,239 @@
+"""
+Entrega de eventos en tiempo real (WebSocket / SSE)
+
+Cada conexión abierta se suscribe al canal de su usuario en un hub en memoria.
+Las rutas publican eventos (mensaje nuevo, editado, eliminado, leído) para los
+participantes de una conversación y el hub los reparte a sus conexiones.
+
+Con varios workers el reparto se hace a través de un backend de pub/sub:
+- "memory" (por defecto): solo entrega a las conexiones de este proceso
+- "redis": publica en Redis y cada worker entrega a sus propias conexiones
+  (requiere el paquete opcional `redis`)
+"""
+from typing import Dict, Iterable, List, Optional, Set
+from supabase import AsyncClient
+import asyncio
+import json
+import logging
+
+from app.config import settings
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Tipos de evento
+MENSAJE_NUEVO = "mensaje.nuevo"
+MENSAJE_EDITADO = "mensaje.editado"
+MENSAJE_ELIMINADO = "mensaje.eliminado"
+CONVERSACION_LEIDA = "conversacion.leida"
+
+# Participantes por conversación, para no consultarlos en cada mensaje
+participantes_cache = TTLCache(maxsize=5000, ttl=60)
+
+
+class BackendMemoria:
+    """
+    Backend de un solo proceso: entrega directamente al hub local
+    """
+
+    nombre = "memory"
+
+    def __init__(self):
+        self.hub: Optional["RealtimeHub"] = None
+
+    async def iniciar(self, hub: "RealtimeHub") -> None:
+        self.hub = hub
+
+    async def publicar(self, usuarios: List[str], evento: dict) -> None:
+        self.hub.entregar(usuarios, evento)
+
+    async def cerrar(self) -> None:
+        pass
+
+
+class BackendRedis:
+    """
+    Backend entre workers sobre Redis pub/sub
+
+    Todos los workers escuchan un único canal; cada uno entrega el evento solo
+    a los usuarios que tienen conexiones abiertas en su proceso.
+    """
+
+    nombre = "redis"
+    canal = "realtime:eventos"
+
+    def __init__(self, url: str):
+        self.url = url
+        self.hub: Optional["RealtimeHub"] = None
+        self._redis = None
+        self._pubsub = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    async def iniciar(self, hub: "RealtimeHub") -> None:
+        import redis.asyncio as redis
+
+        self.hub = hub
+        self._redis = redis.from_url(self.url)
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self.canal)
+        self._tarea = asyncio.create_task(self._escuchar())
+
+    async def _escuchar(self) -> None:
+        while True:
+            try:
+                async for item in self._pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    datos = json.loads(item["data"])
+                    self.hub.entregar(datos["usuarios"], datos["evento"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Suscripción a Redis interrumpida, reintentando: {e}")
+                await asyncio.sleep(1)
+
+    async def publicar(self, usuarios: List[str], evento: dict) -> None:
+        mensaje = json.dumps({"usuarios": usuarios, "evento": evento}, default=str)
+        await self._redis.publish(self.canal, mensaje)
+
+    async def cerrar(self) -> None:
+        if self._tarea:
+            self._tarea.cancel()
+        if self._pubsub:
+            await self._pubsub.close()
+        if self._redis:
+            await self._redis.close()
+
+
+class RealtimeHub:
+    """
+    Registro de conexiones por usuario y reparto de eventos
+
+    Cada conexión recibe una cola acotada; si un cliente lento la llena, se
+    descartan sus eventos más antiguos en lugar de frenar al resto.
+    """
+
+    def __init__(self, backend=None, tam_cola: int = 100):
+        self.backend = backend or BackendMemoria()
+        self.backend.hub = self
+        self.tam_cola = tam_cola
+        self._conexiones: Dict[str, Set[asyncio.Queue]] = {}
+        self.descartados = 0
+
+    async def iniciar(self) -> None:
+        try:
+            await self.backend.iniciar(self)
+        except Exception as e:
+            if isinstance(self.backend, BackendMemoria):
+                raise
+            logger.error(f"No se pudo iniciar el backend {self.backend.nombre}, se usa memoria: {e}")
+            self.backend = BackendMemoria()
+            self.backend.hub = self
+
+    async def cerrar(self) -> None:
+        await self.backend.cerrar()
+
+    def suscribir(self, id_user: str) -> asyncio.Queue:
+        """
+        Registra una conexión del usuario y devuelve su cola de eventos
+        """
+        cola: asyncio.Queue = asyncio.Queue(maxsize=self.tam_cola)
+        self._conexiones.setdefault(id_user, set()).add(cola)
+        return cola
+
+    def desuscribir(self, id_user: str, cola: asyncio.Queue) -> None:
+        """
+        Elimina una conexión del usuario
+        """
+        colas = self._conexiones.get(id_user)
+        if colas is None:
+            return
+        colas.discard(cola)
+        if not colas:
+            del self._conexiones[id_user]
+
+    def entregar(self, usuarios: Iterable[str], evento: dict) -> None:
+        """
+        Encola el evento en las conexiones locales de los usuarios indicados
+        """
+        for id_user in usuarios:
+            for cola in self._conexiones.get(id_user, ()):
+                if cola.full():
+                    cola.get_nowait()
+                    self.descartados += 1
+                cola.put_nowait(evento)
+
+    async def publicar(self, usuarios: Iterable[str], evento: dict) -> None:
+        """
+        Publica un evento para un conjunto de usuarios (en todos los workers)
+        """
+        usuarios = list(dict.fromkeys(usuarios))
+        if not usuarios:
+            return
+        try:
+            await self.backend.publicar(usuarios, evento)
+        except Exception as e:
+            logger.warning(f"No se pudo publicar el evento {evento.get('tipo')}: {e}")
+
+    def stats(self) -> dict:
+        """
+        Métricas del hub para /health
+        """
+        return {
+            "backend": self.backend.nombre,
+            "usuarios": len(self._conexiones),
+            "conexiones": sum(len(c) for c in self._conexiones.values()),
+            "descartados": self.descartados,
+        }
+
+
+def _crear_backend():
+    if settings.REALTIME_BACKEND == "redis":
+        try:
+            import redis.asyncio  # noqa: F401
+            return BackendRedis(settings.REDIS_URL)
+        except ImportError:
+            logger.warning("REALTIME_BACKEND=redis pero el paquete 'redis' no está instalado; se usa memoria")
+    return BackendMemoria()
+
+
+# Hub global de la aplicación
+hub = RealtimeHub(_crear_backend(), tam_cola=settings.REALTIME_QUEUE_SIZE)
+
+
+async def obtener_participantes(db: AsyncClient, id_conversacion: str) -> List[str]:
+    """
+    IDs de los participantes de una conversación (con caché corta)
+    """
+    participantes = participantes_cache.get(id_conversacion)
+    if participantes is None:
+        response = await db.table("usuarioconversacion")\
+            .select("id_usuario")\
+            .eq("id_conversacion", id_conversacion)\
+            .execute()
+        participantes = [p["id_usuario"] for p in response.data or []]
+        participantes_cache.set(id_conversacion, participantes)
+    return participantes
+
+
+async def publicar_en_conversacion(
+    db: AsyncClient,
+    id_conversacion: str,
+    tipo: str,
+    datos: dict
+) -> None:
+    """
+    Publica un evento para todos los participantes de una conversación
+
+    Los errores se registran y no se propagan: la escritura ya se hizo y el
+    cliente puede recuperar el estado con los endpoints REST.
+    """
+    try:
+        participantes = await obtener_participantes(db, id_conversacion)
+        await hub.publicar(participantes, {
+            "tipo": tipo,
+            "id_conversacion": id_conversacion,
+            "data": datos,
+        })
+    except Exception as e:
+        logger.warning(f"No se pudo notificar {tipo} en {id_conversacion}: {e}")
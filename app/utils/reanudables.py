@@ -0,0 +1,296 @@
+"""
+Subidas reanudables por partes
+
+El cliente crea una sesión declarando el tamaño total, envía el archivo en
+bloques indicando el offset de cada uno y, si la conexión se corta, consulta
+cuántos bytes llegaron y continúa desde ahí en lugar de empezar de cero. Al
+completar la sesión el archivo se procesa igual que una subida normal (tipo
+por contenido, deduplicación, derivados) y se sube al bucket `media`.
+
+Las partes se guardan en disco local (RESUMABLE_UPLOAD_DIR): cada sesión es un
+archivo `<id>.part` con los bytes recibidos y un `<id>.json` con sus datos. Al
+completar se procesa una copia, así un fallo deja las partes intactas para
+reintentar. Las sesiones vencidas se eliminan periódicamente en segundo plano.
+
+Los workers de un mismo host comparten el directorio: cada bloque se anexa con
+el archivo de partes bloqueado (flock), así dos workers no aceptan el mismo
+offset. Con varios servidores, las peticiones de una misma sesión deben llegar
+al mismo host.
+"""
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Optional
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo el lock en memoria (un único proceso)
+    fcntl = None
+
+from app.config import settings
+from app.utils.archivos import ArchivoTemporal, TAM_BLOQUE, TAM_CABECERA, detectar_tipo_archivo
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se buscan sesiones vencidas (segundos)
+INTERVALO_PURGA = 600
+
+
+class SesionesReanudables:
+    """
+    Almacén en disco de las sesiones de subida en curso
+    """
+
+    def __init__(self, directorio: str, expiracion_horas: int):
+        self.directorio = directorio
+        self.expiracion = timedelta(hours=expiracion_horas)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._ultima_purga = 0.0
+        self._tarea: Optional[asyncio.Task] = None
+        self.purgadas = 0
+
+    async def iniciar(self) -> None:
+        if self._tarea is None:
+            await run_in_threadpool(self.purgar_expiradas, True)
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def cerrar(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    async def _bucle(self) -> None:
+        while True:
+            await asyncio.sleep(INTERVALO_PURGA)
+            try:
+                await run_in_threadpool(self.purgar_expiradas, True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"No se pudieron purgar las sesiones de subida vencidas: {e}")
+
+    def _ruta(self, id_sesion: str, extension: str) -> str:
+        return os.path.join(self.directorio, f"{id_sesion}.{extension}")
+
+    def crear(self, id_user: str, filename: str, content_type: str, size: int) -> dict:
+        """
+        Registra una sesión nueva con su archivo de partes vacío
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        self.purgar_expiradas()
+
+        sesion = {
+            "id_sesion": uuid.uuid4().hex,
+            "id_user": id_user,
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+            "expira": (datetime.utcnow() + self.expiracion).isoformat(),
+        }
+        open(self._ruta(sesion["id_sesion"], "part"), "wb").close()
+        with open(self._ruta(sesion["id_sesion"], "json"), "w") as destino:
+            json.dump(sesion, destino)
+        return sesion
+
+    def obtener(self, id_sesion: str, id_user: str) -> dict:
+        """
+        Datos de una sesión vigente del usuario
+
+        Raises:
+            HTTPException: 404 si no existe o venció, 403 si es de otro usuario
+        """
+        sesion = None
+        if id_sesion.isalnum():
+            try:
+                with open(self._ruta(id_sesion, "json")) as origen:
+                    sesion = json.load(origen)
+            except (OSError, ValueError):
+                sesion = None
+
+        if sesion is None or datetime.fromisoformat(sesion["expira"]) < datetime.utcnow():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Sesión de subida no encontrada o vencida"
+            )
+        if sesion["id_user"] != id_user:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="La sesión de subida pertenece a otro usuario"
+            )
+        return sesion
+
+    def offset(self, sesion: dict) -> int:
+        """Bytes recibidos hasta ahora"""
+        try:
+            return os.path.getsize(self._ruta(sesion["id_sesion"], "part"))
+        except OSError:
+            return 0
+
+    async def anexar(self, sesion: dict, offset: int, bloques: AsyncIterator[bytes]) -> int:
+        """
+        Agrega un bloque al final del archivo de partes
+
+        Si la conexión se corta a mitad del bloque se conservan los bytes que
+        llegaron; el cliente consulta el offset y reenvía desde ahí.
+
+        Args:
+            sesion: Sesión obtenida con `obtener`
+            offset: Posición en la que el cliente cree que empieza el bloque
+            bloques: Cuerpo de la petición
+
+        Returns:
+            Nuevo offset
+
+        Raises:
+            HTTPException: 409 si el offset no coincide con lo recibido, 413 si
+                se supera el tamaño declarado
+        """
+        id_sesion = sesion["id_sesion"]
+        lock = self._locks.setdefault(id_sesion, asyncio.Lock())
+        async with lock:
+            try:
+                destino = open(self._ruta(id_sesion, "part"), "r+b")
+            except FileNotFoundError:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Sesión de subida no encontrada o vencida"
+                )
+            with destino:
+                # Otro worker puede recibir un bloque de la misma sesión: el
+                # tamaño se lee y se escribe con el archivo bloqueado (se libera
+                # al cerrarlo)
+                if fcntl is not None:
+                    await run_in_threadpool(fcntl.flock, destino.fileno(), fcntl.LOCK_EX)
+                actual = destino.seek(0, os.SEEK_END)
+                if offset != actual:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail=f"Offset incorrecto: se esperaba {actual}"
+                    )
+
+                async for bloque in bloques:
+                    if not bloque:
+                        continue
+                    if actual + len(bloque) > sesion["size"]:
+                        raise HTTPException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"El bloque excede el tamaño declarado de {sesion['size']} bytes"
+                        )
+                    await run_in_threadpool(destino.write, bloque)
+                    actual += len(bloque)
+                destino.flush()
+            return actual
+
+    async def como_temporal(self, sesion: dict) -> ArchivoTemporal:
+        """
+        Copia del archivo completo lista para procesarse como una subida normal
+
+        Detecta el tipo por contenido y calcula el SHA-256 en el mismo
+        recorrido. El procesamiento (p. ej. quitar EXIF) modifica la copia y no
+        las partes, que se conservan hasta eliminar la sesión; el llamador
+        elimina la copia con `eliminar()`.
+        """
+        ruta = self._ruta(sesion["id_sesion"], "part")
+
+        def _copiar():
+            descriptor, copia = tempfile.mkstemp(prefix="upload_")
+            try:
+                hash_contenido = hashlib.sha256()
+                with open(ruta, "rb") as origen, os.fdopen(descriptor, "wb") as destino:
+                    cabecera = origen.read(TAM_CABECERA)
+                    hash_contenido.update(cabecera)
+                    destino.write(cabecera)
+                    for bloque in iter(lambda: origen.read(TAM_BLOQUE), b""):
+                        hash_contenido.update(bloque)
+                        destino.write(bloque)
+                return copia, detectar_tipo_archivo(copia, cabecera), hash_contenido.hexdigest()
+            except Exception:
+                os.remove(copia)
+                raise
+
+        copia, content_type, sha256 = await run_in_threadpool(_copiar)
+        temporal = ArchivoTemporal(
+            ruta=copia,
+            tamano=os.path.getsize(copia),
+            content_type=content_type or "",
+            nombre=sesion["filename"],
+            sha256=sha256
+        )
+        if content_type is None:
+            temporal.eliminar()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Tipo de archivo no reconocido: {sesion['filename']}"
+            )
+        return temporal
+
+    def eliminar(self, id_sesion: str) -> None:
+        """Borra los datos y las partes de una sesión"""
+        for extension in ("json", "part"):
+            try:
+                os.remove(self._ruta(id_sesion, extension))
+            except OSError:
+                pass
+        self._locks.pop(id_sesion, None)
+
+    def purgar_expiradas(self, forzar: bool = False) -> int:
+        """
+        Elimina las sesiones vencidas (como mucho una vez cada INTERVALO_PURGA)
+
+        Returns:
+            Cantidad de sesiones eliminadas
+        """
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultima_purga < INTERVALO_PURGA:
+            return 0
+        self._ultima_purga = ahora
+
+        eliminadas = 0
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return 0
+
+        limite = datetime.utcnow()
+        for nombre in nombres:
+            if not nombre.endswith(".json"):
+                continue
+            id_sesion = nombre[:-len(".json")]
+            try:
+                with open(self._ruta(id_sesion, "json")) as origen:
+                    vencida = datetime.fromisoformat(json.load(origen)["expira"]) < limite
+            except (OSError, ValueError, KeyError):
+                vencida = True
+            if vencida and not (id_sesion in self._locks and self._locks[id_sesion].locked()):
+                self.eliminar(id_sesion)
+                eliminadas += 1
+
+        self.purgadas += eliminadas
+        if eliminadas:
+            logger.info(f"Se eliminaron {eliminadas} sesiones de subida vencidas")
+        return eliminadas
+
+    def stats(self) -> dict:
+        """
+        Métricas de las sesiones para /health
+        """
+        return {"purgadas": self.purgadas}
+
+
+# Almacén global de sesiones de subida
+sesiones = SesionesReanudables(
+    directorio=settings.RESUMABLE_UPLOAD_DIR,
+    expiracion_horas=settings.RESUMABLE_UPLOAD_EXPIRE_HOURS
+)
@@ -112,13 +112,50 @@ def create_refresh_token(
     return encoded_jwt
 
 
+def create_upload_token(
+    data: dict,
+    expires_delta: Optional[timedelta] = None
+) -> str:
+    """
+    Crea un token JWT que autoriza completar una subida directa a Storage
+    
+    Args:
+        data: Datos de la subida (ruta, tipo, tamaño, usuario)
+        expires_delta: Tiempo de expiración del token
+        
+    Returns:
+        Token JWT codificado
+    """
+    to_encode = data.copy()
+    
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(
+            minutes=settings.SIGNED_UPLOAD_EXPIRE_MINUTES
+        )
+    
+    to_encode.update({
+        "exp": expire,
+        "type": "upload"
+    })
+    
+    encoded_jwt = jwt.encode(
+        to_encode,
+        settings.SECRET_KEY,
+        algorithm=settings.ALGORITHM
+    )
+    
+    return encoded_jwt
+
+
 def verify_token(token: str, token_type: str = "access") -> Optional[dict]:
     """
     Verifica y decodifica un token JWT
     
     Args:
         token: Token JWT a verificar (sin el prefijo 'Bearer')
-        token_type: Tipo de token esperado ("access" o "refresh")
+        token_type: Tipo de token esperado ("access", "refresh" o "upload")
         
     Returns:
         Payload del token si es válido, None si no
@@ -0,0 +1,293 @@
+"""
+Timelines personalizados del feed (fan-out al escribir)
+
+Al crear una publicación se encola y un worker en segundo plano inserta su ID
+en la tabla `timeline` de cada lector: el autor, sus amigos y los estudiantes
+de su grupo (ver add_timelines.sql). Así una página del feed de un usuario es
+un solo rango sobre `timeline` (id_user, fecha_creacion DESC).
+
+Las cuentas populares (más de TIMELINE_UMBRAL_POPULAR amigos) no se copian a
+sus amigos, que serían miles de filas por publicación: al leer el feed se
+consultan directamente sus publicaciones recientes (fan-out al leer) y se
+mezclan con el timeline. Cada timeline se recorta a TIMELINE_MAX_POR_USUARIO
+publicaciones periódicamente.
+
+Las amistades nuevas no copian publicaciones anteriores: se ven a partir de la
+siguiente publicación.
+
+Una publicación que no se puede distribuir no bloquea la cola: los errores
+transitorios se reintentan hasta TIMELINE_MAX_RETRIES veces; ante un error
+permanente (clave foránea violada) se descarta si la publicación ya se
+eliminó, o se reintenta una vez solo con los lectores que siguen existiendo.
+"""
+from typing import List, Optional, Set, Tuple
+from supabase import AsyncClient
+import asyncio
+import logging
+
+from app.config import settings
+from app.database import get_db
+from app.utils.companeros import companeros
+from app.utils.grafo_amigos import grafo_amigos
+from app.utils.lotes import es_error_permanente
+from app.utils.paginacion import codificar_cursor, paginar
+
+logger = logging.getLogger(__name__)
+
+# IDs por consulta in_() al verificar lectores
+TAM_LOTE_LECTORES = 200
+
+
+class DistribuidorTimelines:
+    """
+    Cola de publicaciones nuevas y worker que las copia a los timelines
+    """
+
+    def __init__(
+        self,
+        tam_lote: int = 1000,
+        max_por_usuario: int = 500,
+        umbral_popular: int = 1000,
+        intervalo_recorte: float = 3600,
+        max_pendientes: int = 10000,
+        reintento_max: float = 30.0,
+        max_intentos: int = 8
+    ):
+        self.tam_lote = tam_lote
+        self.max_por_usuario = max_por_usuario
+        self.umbral_popular = umbral_popular
+        self.intervalo_recorte = intervalo_recorte
+        self.reintento_max = reintento_max
+        self.max_intentos = max_intentos
+        self._cola: asyncio.Queue = asyncio.Queue(maxsize=max_pendientes)
+        self._tareas: List[asyncio.Task] = []
+        self.distribuidas = 0
+        self.filas = 0
+        self.reintentos = 0
+        self.descartadas = 0
+        self.rechazadas = 0
+
+    def distribuir(self, publicacion: dict) -> None:
+        """
+        Encola una publicación recién creada para copiarla a los timelines
+        """
+        try:
+            self._cola.put_nowait({
+                "id_publicacion": publicacion["id_publicacion"],
+                "id_user": publicacion["id_user"],
+                "fecha_creacion": publicacion["fecha_creacion"],
+            })
+        except asyncio.QueueFull:
+            self.descartadas += 1
+            logger.error(f"Cola de timelines llena, se descarta la publicación {publicacion['id_publicacion']}")
+
+    def es_popular(self, id_user: str) -> bool:
+        return grafo_amigos.cantidad_amigos(id_user) > self.umbral_popular
+
+    async def iniciar(self) -> None:
+        if not self._tareas:
+            self._tareas = [
+                asyncio.create_task(self._worker()),
+                asyncio.create_task(self._recortar_periodicamente()),
+            ]
+
+    async def cerrar(self) -> None:
+        """
+        Detiene el worker y distribuye lo que quede en la cola
+        """
+        for tarea in self._tareas:
+            tarea.cancel()
+            try:
+                await tarea
+            except asyncio.CancelledError:
+                pass
+        self._tareas = []
+
+        while not self._cola.empty():
+            publicacion = self._cola.get_nowait()
+            try:
+                await self._persistir(await get_db(), publicacion)
+            except Exception as e:
+                logger.error(f"No se pudo distribuir la publicación {publicacion['id_publicacion']} al cerrar: {e}")
+
+    async def _worker(self) -> None:
+        while True:
+            publicacion = await self._cola.get()
+            pendiente = True
+            try:
+                espera = 1.0
+                for intento in range(1, self.max_intentos + 1):
+                    try:
+                        await self._persistir(await get_db(), publicacion)
+                        break
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        if intento == self.max_intentos:
+                            # No bloquear la cola indefinidamente por una publicación
+                            self.descartadas += 1
+                            logger.error(f"Se descarta la publicación {publicacion['id_publicacion']} tras {intento} intentos: {e}")
+                            break
+                        self.reintentos += 1
+                        logger.warning(f"Error distribuyendo la publicación {publicacion['id_publicacion']}, reintento en {espera:.0f}s: {e}")
+                        await asyncio.sleep(espera)
+                        espera = min(espera * 2, self.reintento_max)
+                pendiente = False
+            finally:
+                if pendiente:
+                    # Cancelado durante la escritura o la espera: devolverla a
+                    # la cola para que cerrar() la distribuya
+                    try:
+                        self._cola.put_nowait(publicacion)
+                    except asyncio.QueueFull:
+                        self.descartadas += 1
+
+    async def _recortar_periodicamente(self) -> None:
+        while True:
+            await asyncio.sleep(self.intervalo_recorte)
+            try:
+                db = await get_db()
+                await db.rpc("recortar_timelines", {"p_max": self.max_por_usuario}).execute()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"No se pudieron recortar los timelines: {e}")
+
+    async def lectores(self, db: AsyncClient, id_autor: str) -> Set[str]:
+        """
+        Usuarios en cuyo timeline se copia una publicación del autor
+        """
+        await asyncio.gather(grafo_amigos.asegurar_cargado(db), companeros.asegurar_cargado(db))
+        lectores = {id_autor}
+        if not self.es_popular(id_autor):
+            lectores.update(grafo_amigos.amigos(id_autor))
+        id_grupo = companeros.grupo_de(id_autor)
+        if id_grupo is not None:
+            lectores |= companeros.miembros(id_grupo)
+        return lectores
+
+    async def _persistir(self, db: AsyncClient, publicacion: dict) -> None:
+        """
+        Inserta la publicación en el timeline de cada lector, en lotes
+        """
+        filas = [
+            {**publicacion, "id_user": id_user}
+            for id_user in await self.lectores(db, publicacion["id_user"])
+        ]
+        escritas = 0
+        for inicio in range(0, len(filas), self.tam_lote):
+            lote = filas[inicio:inicio + self.tam_lote]
+            try:
+                await self._insertar(db, lote)
+                escritas += len(lote)
+            except Exception as e:
+                if not es_error_permanente(e):
+                    raise
+                if not await self._existe(db, publicacion["id_publicacion"]):
+                    logger.info(f"La publicación {publicacion['id_publicacion']} se eliminó antes de distribuirla")
+                    self.descartadas += 1
+                    return
+                # Lectores eliminados que el grafo todavía no reflejaba: un solo reintento
+                lote = await self._existentes(db, lote)
+                try:
+                    await self._insertar(db, lote)
+                    escritas += len(lote)
+                except Exception as e:
+                    if not es_error_permanente(e):
+                        raise
+                    self.rechazadas += len(lote)
+                    logger.error(f"No se pudo distribuir la publicación {publicacion['id_publicacion']} a {len(lote)} lectores: {e}")
+        self.distribuidas += 1
+        self.filas += escritas
+
+    async def _insertar(self, db: AsyncClient, filas: List[dict]) -> None:
+        if filas:
+            # Reintentar un lote ya insertado no duplica filas
+            await db.table("timeline")\
+                .upsert(filas, on_conflict="id_user,id_publicacion", ignore_duplicates=True)\
+                .execute()
+
+    async def _existe(self, db: AsyncClient, id_publicacion: str) -> bool:
+        response = await db.table("publicacion").select("id_publicacion").eq("id_publicacion", id_publicacion).execute()
+        return bool(response.data)
+
+    async def _existentes(self, db: AsyncClient, filas: List[dict]) -> List[dict]:
+        """Filas cuyo lector sigue existiendo en la tabla usuario"""
+        ids = [f["id_user"] for f in filas]
+        existentes: Set[str] = set()
+        for inicio in range(0, len(ids), TAM_LOTE_LECTORES):
+            response = await db.table("usuario")\
+                .select("id_user")\
+                .in_("id_user", ids[inicio:inicio + TAM_LOTE_LECTORES])\
+                .execute()
+            existentes.update(u["id_user"] for u in response.data or [])
+        return [f for f in filas if f["id_user"] in existentes]
+
+    async def leer(
+        self,
+        db: AsyncClient,
+        id_user: str,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[str], Optional[str]]:
+        """
+        IDs de una página del feed del usuario, de la más reciente a la más antigua
+
+        Mezcla su timeline con las publicaciones de sus amigos populares.
+
+        Returns:
+            Tupla (IDs de publicación, cursor de la página siguiente o None)
+        """
+        await grafo_amigos.asegurar_cargado(db)
+        populares = [a for a in grafo_amigos.amigos(id_user) if self.es_popular(a)]
+
+        consultas = [
+            paginar(
+                db.table("timeline").select("id_publicacion, fecha_creacion").eq("id_user", id_user),
+                "fecha_creacion", "id_publicacion", 0, limit, cursor
+            )
+        ]
+        if populares:
+            consultas.append(paginar(
+                db.table("publicacion").select("id_publicacion, fecha_creacion").in_("id_user", populares),
+                "fecha_creacion", "id_publicacion", 0, limit, cursor
+            ))
+        resultados = await asyncio.gather(*consultas)
+
+        # Cada fuente trae hasta limit + 1 filas; se mezclan sin duplicados
+        filas = {}
+        for pagina, _ in resultados:
+            for fila in pagina:
+                filas[fila["id_publicacion"]] = fila
+        ordenadas = sorted(filas.values(), key=lambda f: (f["fecha_creacion"], f["id_publicacion"]), reverse=True)
+
+        siguiente = None
+        if len(ordenadas) > limit or any(s for _, s in resultados):
+            ordenadas = ordenadas[:limit]
+            if ordenadas:
+                ultima = ordenadas[-1]
+                siguiente = codificar_cursor(ultima["fecha_creacion"], ultima["id_publicacion"])
+        return [f["id_publicacion"] for f in ordenadas], siguiente
+
+    def stats(self) -> dict:
+        """
+        Métricas de los timelines para /health
+        """
+        return {
+            "pendientes": self._cola.qsize(),
+            "distribuidas": self.distribuidas,
+            "filas": self.filas,
+            "reintentos": self.reintentos,
+            "descartadas": self.descartadas,
+            "rechazadas": self.rechazadas,
+        }
+
+
+# Distribuidor global de la aplicación
+timelines = DistribuidorTimelines(
+    tam_lote=settings.TIMELINE_BATCH_SIZE,
+    max_por_usuario=settings.TIMELINE_MAX_POR_USUARIO,
+    umbral_popular=settings.TIMELINE_UMBRAL_POPULAR,
+    intervalo_recorte=settings.TIMELINE_RECORTE_SECONDS,
+    max_intentos=settings.TIMELINE_MAX_RETRIES
+)
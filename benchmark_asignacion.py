@@ -0,0 +1,126 @@
+"""
+Benchmark del optimizador de asignación de carpooling (app/utils/asignacion.py)
+
+Genera una instancia sintética de una mañana (rutas desde distintos barrios
+hacia el campus y pasajeros que postulan a rutas que pasan cerca de su casa)
+y compara:
+- aceptar en orden de llegada (lo que pasa hoy con update_estado_pasajero);
+- solo la fase voraz;
+- voraz + mejora local.
+
+Uso:
+    python benchmark_asignacion.py [--solicitudes 5000] [--rutas 1500] [--semilla 1]
+"""
+from collections import defaultdict
+import argparse
+import random
+import time
+
+from app.utils import geo
+from app.utils.asignacion import optimizar
+from app.utils.indice_rutas import IndiceRutas
+
+CAMPUS = (-17.3760, -66.1500)
+RADIO_CIUDAD = 0.08  # grados (~9 km)
+RADIO_POSTULACION = 1500  # metros
+
+
+def punto_aleatorio(rng: random.Random) -> geo.Punto:
+    return CAMPUS[0] + rng.uniform(-RADIO_CIUDAD, RADIO_CIUDAD), CAMPUS[1] + rng.uniform(-RADIO_CIUDAD, RADIO_CIUDAD)
+
+
+def generar_instancia(n_solicitudes: int, n_rutas: int, semilla: int):
+    rng = random.Random(semilla)
+    indice = IndiceRutas()
+    lugares = {}
+    for i in range(n_rutas):
+        inicio = punto_aleatorio(rng)
+        paradas = [
+            {"orden_parada": k + 1, "latitud": lat, "longitud": lon}
+            for k, (lat, lon) in enumerate(punto_aleatorio(rng) for _ in range(rng.randint(0, 2)))
+        ]
+        id_ruta = f"ruta-{i}"
+        indice.actualizar_ruta({
+            "id_ruta": id_ruta,
+            "lat_inicio": inicio[0], "lon_inicio": inicio[1],
+            "lat_destino": CAMPUS[0], "lon_destino": CAMPUS[1],
+        }, paradas)
+        lugares[id_ruta] = rng.randint(1, 4)
+
+    solicitudes = []
+    n_pasajero = 0
+    while len(solicitudes) < n_solicitudes:
+        casa = punto_aleatorio(rng)
+        cercanas = indice.buscar(casa, CAMPUS, RADIO_POSTULACION, limit=20)
+        if not cercanas:
+            continue
+        id_user = f"pasajero-{n_pasajero}"
+        n_pasajero += 1
+        for ruta in rng.sample(cercanas, min(len(cercanas), rng.randint(1, 3))):
+            solicitudes.append({
+                "id_pasajero_ruta": f"sol-{len(solicitudes)}",
+                "id_user": id_user,
+                "id_ruta": ruta["id_ruta"],
+                "lat_recogida": casa[0],
+                "lon_recogida": casa[1],
+            })
+    solicitudes = solicitudes[:n_solicitudes]
+    lineas = {i: indice.linea(i) for i in lugares if indice.linea(i)}
+    return solicitudes, lineas, lugares, rng
+
+
+def orden_de_llegada(solicitudes, lineas, lugares, rng):
+    """Cada conductor acepta en el orden en que llegan las solicitudes"""
+    libres = dict(lugares)
+    servidos = {}
+    llegada = solicitudes[:]
+    rng.shuffle(llegada)
+    for s in llegada:
+        if s["id_user"] not in servidos and libres[s["id_ruta"]] > 0:
+            libres[s["id_ruta"]] -= 1
+            punto = (s["lat_recogida"], s["lon_recogida"])
+            servidos[s["id_user"]] = 2 * geo.distancia_a_linea(punto, lineas[s["id_ruta"]])[0]
+    return len(servidos), sum(servidos.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--solicitudes", type=int, default=5000)
+    parser.add_argument("--rutas", type=int, default=1500)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"🚗 Generando instancia: {args.solicitudes} solicitudes, {args.rutas} rutas...")
+    solicitudes, lineas, lugares, rng = generar_instancia(args.solicitudes, args.rutas, args.semilla)
+    pasajeros = len({s["id_user"] for s in solicitudes})
+    print(f"   {pasajeros} pasajeros, {sum(lugares.values())} lugares libres")
+    print(f"   distancias en lote con numpy: {'sí' if geo.np is not None else 'no (Python puro)'}")
+
+    servidos, desvio = orden_de_llegada(solicitudes, lineas, lugares, rng)
+    print(f"\n1️⃣ Orden de llegada:  {servidos} pasajeros, desvío total {desvio / 1000:.1f} km")
+
+    inicio = time.perf_counter()
+    propuesta = optimizar(solicitudes, lineas, lugares)
+    total = time.perf_counter() - inicio
+    r = propuesta["resumen"]
+    print(f"2️⃣ Voraz:             {r['asignados_voraz']} pasajeros, desvío total {r['desvio_voraz_m'] / 1000:.1f} km")
+    print(f"3️⃣ Voraz + mejora:    {r['asignados']} pasajeros, desvío total {r['desvio_total_m'] / 1000:.1f} km"
+          f" ({r['mejoras']} mejoras)")
+    print(f"\n⏱️  Optimización completa: {total * 1000:.0f} ms")
+
+    # Verificar que la propuesta respeta capacidades y postulaciones
+    postulaciones = {(s["id_user"], s["id_ruta"]) for s in solicitudes}
+    ocupados = defaultdict(int)
+    vistos = set()
+    for id_ruta, asignados in propuesta["asignaciones"].items():
+        for p in asignados:
+            assert (p["id_user"], id_ruta) in postulaciones
+            assert p["id_user"] not in vistos
+            vistos.add(p["id_user"])
+            ocupados[id_ruta] += 1
+    assert all(ocupados[i] <= lugares[i] for i in ocupados)
+    print("✅ Capacidades y postulaciones respetadas")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,9 +15,10 @@ import re
 # Agregar el directorio raíz al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.database import get_supabase_client
+from app.database import get_supabase_client_sync
+from app.utils.lotes import insertar_lote_sync
 
-supabase = get_supabase_client()
+supabase = get_supabase_client_sync()
 
 def es_ci_valido(ci):
     """
@@ -109,51 +110,44 @@ def corregir_estudiantes():
     corregidos = 0
     errores = 0
     
+    # La tabla estudiante usa ci_est como PRIMARY KEY
+    # Para actualizar la PK, necesitamos:
+    # 1. Generar los nuevos registros con CIs únicos
+    # 2. Eliminar los registros viejos (una sola consulta)
+    # 3. Insertar los nuevos registros (una sola inserción)
+    # Si la inserción falla, se restauran los registros originales
+    nuevos_estudiantes = []
     for est in estudiantes_problematicos:
-        usuario = usuarios_map.get(est['id_user'], {})
-        nombre_completo = f"{usuario.get('nombre', 'N/A')} {usuario.get('apellido', 'N/A')}"
-        ci_viejo = est['ci_est']
+        ci_nuevo = generar_ci_unico(base_numero, cis_validos)
+        cis_validos.add(ci_nuevo)
+        base_numero += 1
         
+        nuevos_estudiantes.append({
+            'ci_est': ci_nuevo,
+            'id_user': est['id_user'],
+            'carrera': est['carrera'],
+            'semestre': est['semestre'],
+            'id_grupo': est.get('id_grupo')
+        })
+    
+    cis_viejos = [est['ci_est'] for est in estudiantes_problematicos]
+    try:
+        supabase.table('estudiante').delete().in_('ci_est', cis_viejos).execute()
         try:
-            # Generar nuevo CI único
-            ci_nuevo = generar_ci_unico(base_numero, cis_validos)
-            cis_validos.add(ci_nuevo)
-            base_numero += 1
-            
-            # La tabla estudiante usa ci_est como PRIMARY KEY
-            # Para actualizar la PK, necesitamos:
-            # 1. Guardar el id_user
-            # 2. Eliminar el registro viejo
-            # 3. Insertar un nuevo registro con el nuevo CI
-            
-            id_user = est['id_user']
-            carrera = est['carrera']
-            semestre = est['semestre']
-            id_grupo = est.get('id_grupo')
-            
-            # Eliminar registro viejo
-            supabase.table('estudiante').delete().eq('ci_est', ci_viejo).execute()
-            
-            # Insertar nuevo registro
-            nuevo_estudiante = {
-                'ci_est': ci_nuevo,
-                'id_user': id_user,
-                'carrera': carrera,
-                'semestre': semestre
-            }
-            
-            if id_grupo:
-                nuevo_estudiante['id_grupo'] = id_grupo
-            
-            supabase.table('estudiante').insert(nuevo_estudiante).execute()
-            
-            print(f"   ✅ {nombre_completo}")
-            print(f"      CI: {ci_viejo} → {ci_nuevo}")
-            corregidos += 1
-            
-        except Exception as e:
-            print(f"   ❌ Error al corregir {nombre_completo}: {str(e)}")
-            errores += 1
+            insertar_lote_sync(supabase, 'estudiante', nuevos_estudiantes, 'ci_est')
+        except Exception:
+            insertar_lote_sync(supabase, 'estudiante', estudiantes_problematicos)
+            raise
+        
+        for est, nuevo in zip(estudiantes_problematicos, nuevos_estudiantes):
+            usuario = usuarios_map.get(est['id_user'], {})
+            print(f"   ✅ {usuario.get('nombre', 'N/A')} {usuario.get('apellido', 'N/A')}")
+            print(f"      CI: {est['ci_est']} → {nuevo['ci_est']}")
+        corregidos = len(nuevos_estudiantes)
+        
+    except Exception as e:
+        print(f"   ❌ Error al corregir los CIs (no se modificó ningún estudiante): {str(e)}")
+        errores = len(nuevos_estudiantes)
     
     print(f"\n📊 Resultado final:")
     print(f"   - Corregidos: {corregidos}")
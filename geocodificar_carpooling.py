@@ -0,0 +1,129 @@
+"""
+Script para completar las coordenadas de rutas, paradas y solicitudes de
+carpooling existentes a partir de sus ubicaciones en texto, usando el
+nomenclátor local (app/data/lugares.json). No usa servicios externos.
+
+Solo completa filas sin coordenadas y solo con coincidencias de confianza
+suficiente (--confianza); las demás se informan para revisarlas a mano. Para
+cada texto se muestra el lugar asignado, su confianza y cuántas filas
+cambiarían, de modo que --dry-run sirve para revisar antes de escribir. Las
+filas que resuelven al mismo lugar se actualizan con una sola consulta.
+
+Uso:
+    python geocodificar_carpooling.py [--dry-run] [--confianza 0.9] [--archivo lugares.json]
+"""
+from collections import Counter, defaultdict
+from supabase import create_client
+import argparse
+import os
+from dotenv import load_dotenv
+
+from app.utils.geocodificacion import nomenclator
+
+load_dotenv()
+
+# (tabla, clave, campo de texto, campo de latitud, campo de longitud)
+CAMPOS = [
+    ("ruta", "id_ruta", "punto_inicio", "lat_inicio", "lon_inicio"),
+    ("ruta", "id_ruta", "punto_destino", "lat_destino", "lon_destino"),
+    ("parada", "id_parada", "ubicacion_parada", "latitud", "longitud"),
+    ("pasajeroruta", "id_pasajero_ruta", "ubicacion_recogida", "lat_recogida", "lon_recogida"),
+]
+
+TAM_PAGINA = 1000
+TAM_LOTE = 200
+
+# Confianza mínima por defecto para escribir coordenadas sin revisión
+CONFIANZA_MINIMA = 0.9
+
+
+def leer_sin_coordenadas(supabase, tabla, clave, campo_texto, campo_lat):
+    """Filas sin latitud y con texto, leídas por páginas antes de modificar nada"""
+    filas = []
+    desde = 0
+    while True:
+        response = supabase.table(tabla)\
+            .select(f"{clave}, {campo_texto}")\
+            .is_(campo_lat, "null")\
+            .not_.is_(campo_texto, "null")\
+            .order(clave)\
+            .range(desde, desde + TAM_PAGINA - 1)\
+            .execute()
+        filas.extend(response.data or [])
+        if len(response.data or []) < TAM_PAGINA:
+            return filas
+        desde += TAM_PAGINA
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar lo que se completaría")
+    parser.add_argument("--archivo", help="Archivo de lugares (por defecto LUGARES_ARCHIVO)")
+    parser.add_argument(
+        "--confianza", type=float, default=CONFIANZA_MINIMA,
+        help=f"Confianza mínima para escribir coordenadas (por defecto {CONFIANZA_MINIMA})"
+    )
+    args = parser.parse_args()
+
+    nomenclator.cargar(args.archivo)
+    print(f"📍 Nomenclátor: {len(nomenclator)} lugares ({nomenclator.archivo})")
+
+    url = os.getenv("SUPABASE_URL")
+    service_key = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_SERVICE_ROLE") or os.getenv("SUPABASE_KEY")
+    supabase = create_client(url, service_key)
+
+    for tabla, clave, campo_texto, campo_lat, campo_lon in CAMPOS:
+        print(f"\n🔎 {tabla}.{campo_texto}...")
+        filas = leer_sin_coordenadas(supabase, tabla, clave, campo_texto, campo_lat)
+
+        por_texto = defaultdict(list)
+        for fila in filas:
+            por_texto[fila[campo_texto]].append(fila[clave])
+
+        # Textos distintos ("Plaza Colón", "pza colon") pueden ser el mismo lugar
+        por_lugar = defaultdict(list)
+        asignados = []  # (filas, texto, lugar)
+        dudosos = []
+        sin_resolver = Counter()
+        for texto, ids in por_texto.items():
+            lugar = nomenclator.resolver(texto)
+            if lugar is None:
+                sin_resolver[texto] += len(ids)
+            elif lugar["confianza"] < args.confianza:
+                dudosos.append((len(ids), texto, lugar))
+            else:
+                por_lugar[(lugar["lat"], lugar["lon"])].extend(ids)
+                asignados.append((len(ids), texto, lugar))
+
+        completadas = sum(len(ids) for ids in por_lugar.values())
+        if not args.dry_run:
+            for (lat, lon), ids in por_lugar.items():
+                for inicio in range(0, len(ids), TAM_LOTE):
+                    supabase.table(tabla)\
+                        .update({campo_lat: lat, campo_lon: lon})\
+                        .in_(clave, ids[inicio:inicio + TAM_LOTE])\
+                        .execute()
+
+        accion = "se completarían" if args.dry_run else "completadas"
+        print(f"   ✅ {completadas} de {len(filas)} filas {accion}")
+        for cantidad, texto, lugar in sorted(asignados, key=lambda a: -a[0]):
+            print(
+                f"      {texto!r} -> {lugar['nombre']} ({lugar['lat']}, {lugar['lon']}) "
+                f"confianza {lugar['confianza']}: {cantidad} filas"
+            )
+        for cantidad, texto, lugar in sorted(dudosos, key=lambda a: -a[0]):
+            print(
+                f"   ❔ Confianza baja, no se escribe ({cantidad}): {texto!r} -> "
+                f"{lugar['nombre']} (confianza {lugar['confianza']})"
+            )
+        for texto, cantidad in sin_resolver.most_common(10):
+            print(f"   ⚠️  Sin resolver o ambiguo ({cantidad}): {texto}")
+
+    print("\n✅ Listo. Los textos sin resolver se pueden agregar como lugares o alias en el nomenclátor.")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
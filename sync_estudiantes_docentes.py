@@ -13,10 +13,11 @@ import sys
 # Agregar el directorio raíz al path para importar app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.database import get_supabase_client
+from app.database import get_supabase_client_sync
+from app.utils.lotes import insertar_lote_sync
 
-# Usar el cliente de supabase de la app (ya configurado)
-supabase = get_supabase_client()
+# Usar la configuración de supabase de la app
+supabase = get_supabase_client_sync()
 
 def sincronizar_estudiantes():
     """
@@ -38,29 +39,27 @@ def sincronizar_estudiantes():
     creados = 0
     errores = 0
     
-    for usuario in usuarios_estudiantes:
-        ci_est = usuario['ci_user']
-        
-        # Si ya existe en la tabla estudiante, saltar
-        if ci_est in cis_existentes:
-            continue
-        
-        try:
-            # Crear registro en tabla estudiante
-            nuevo_estudiante = {
-                'ci_est': ci_est,
-                'id_user': usuario['id_user'],
-                'carrera': 'Sin especificar',  # Valor por defecto
-                'semestre': 1  # Valor por defecto
-            }
-            
-            supabase.table('estudiante').insert(nuevo_estudiante).execute()
-            print(f"   ✅ Creado estudiante: {usuario['nombre']} {usuario['apellido']} (CI: {ci_est})")
-            creados += 1
-            
-        except Exception as e:
-            print(f"   ❌ Error al crear estudiante {ci_est}: {str(e)}")
-            errores += 1
+    # Usuarios que aún no están en la tabla estudiante
+    faltantes = [u for u in usuarios_estudiantes if u['ci_user'] not in cis_existentes]
+    nuevos_estudiantes = [
+        {
+            'ci_est': usuario['ci_user'],
+            'id_user': usuario['id_user'],
+            'carrera': 'Sin especificar',  # Valor por defecto
+            'semestre': 1  # Valor por defecto
+        }
+        for usuario in faltantes
+    ]
+    
+    try:
+        # Crear todos los registros en una sola inserción
+        insertar_lote_sync(supabase, 'estudiante', nuevos_estudiantes, 'ci_est')
+        for usuario in faltantes:
+            print(f"   ✅ Creado estudiante: {usuario['nombre']} {usuario['apellido']} (CI: {usuario['ci_user']})")
+        creados = len(faltantes)
+    except Exception as e:
+        print(f"   ❌ Error al crear estudiantes (no se creó ninguno): {str(e)}")
+        errores = len(faltantes)
     
     print(f"\n📊 Resultado estudiantes:")
     print(f"   - Creados: {creados}")
@@ -87,28 +86,26 @@ def sincronizar_docentes():
     creados = 0
     errores = 0
     
-    for usuario in usuarios_docentes:
-        ci_doc = usuario['ci_user']
-        
-        # Si ya existe en la tabla docente, saltar
-        if ci_doc in cis_existentes:
-            continue
-        
-        try:
-            # Crear registro en tabla docente
-            nuevo_docente = {
-                'ci_doc': ci_doc,
-                'id_user': usuario['id_user'],
-                'especialidad_doc': 'Sin especificar'  # Valor por defecto
-            }
-            
-            supabase.table('docente').insert(nuevo_docente).execute()
-            print(f"   ✅ Creado docente: {usuario['nombre']} {usuario['apellido']} (CI: {ci_doc})")
-            creados += 1
-            
-        except Exception as e:
-            print(f"   ❌ Error al crear docente {ci_doc}: {str(e)}")
-            errores += 1
+    # Usuarios que aún no están en la tabla docente
+    faltantes = [u for u in usuarios_docentes if u['ci_user'] not in cis_existentes]
+    nuevos_docentes = [
+        {
+            'ci_doc': usuario['ci_user'],
+            'id_user': usuario['id_user'],
+            'especialidad_doc': 'Sin especificar'  # Valor por defecto
+        }
+        for usuario in faltantes
+    ]
+    
+    try:
+        # Crear todos los registros en una sola inserción
+        insertar_lote_sync(supabase, 'docente', nuevos_docentes, 'ci_doc')
+        for usuario in faltantes:
+            print(f"   ✅ Creado docente: {usuario['nombre']} {usuario['apellido']} (CI: {usuario['ci_user']})")
+        creados = len(faltantes)
+    except Exception as e:
+        print(f"   ❌ Error al crear docentes (no se creó ninguno): {str(e)}")
+        errores = len(faltantes)
     
     print(f"\n📊 Resultado docentes:")
     print(f"   - Creados: {creados}")
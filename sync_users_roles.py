@@ -6,6 +6,8 @@ import os
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+from app.utils.lotes import insertar_lote_sync
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -42,29 +44,27 @@ def sync_estudiantes():
     print(f"\n📝 Creando {len(usuarios_sin_estudiante)} registros de estudiante faltantes...")
     
     created_count = 0
-    for idx, usuario in enumerate(usuarios_sin_estudiante, start=1):
-        try:
-            # Generar CI temporal corto (máximo 20 caracteres)
-            # Usar las últimas 8 caracteres del UUID
-            user_suffix = usuario['id_user'][-8:]
-            ci_temp = f"EST{user_suffix}"
-            
-            nuevo_estudiante = {
-                "ci_est": ci_temp,
-                "id_user": usuario["id_user"],
-                "carrera": "Sin especificar",
-                "semestre": 1,
-                "id_grupo": None
-            }
-            
-            result = supabase.table("estudiante").insert(nuevo_estudiante).execute()
-            
-            if result.data:
-                created_count += 1
-                print(f"   ✅ Estudiante creado: {usuario['nombre']} {usuario['apellido']} (CI: {ci_temp})")
-            
-        except Exception as e:
-            print(f"   ❌ Error creando estudiante para {usuario['nombre']}: {str(e)}")
+    # Generar CI temporal corto (máximo 20 caracteres)
+    # Usar las últimas 8 caracteres del UUID
+    nuevos_estudiantes = [
+        {
+            "ci_est": f"EST{usuario['id_user'][-8:]}",
+            "id_user": usuario["id_user"],
+            "carrera": "Sin especificar",
+            "semestre": 1,
+            "id_grupo": None
+        }
+        for usuario in usuarios_sin_estudiante
+    ]
+    
+    try:
+        # Una sola inserción para todos los registros faltantes
+        result = insertar_lote_sync(supabase, "estudiante", nuevos_estudiantes, "ci_est")
+        created_count = len(result)
+        for usuario, nuevo in zip(usuarios_sin_estudiante, nuevos_estudiantes):
+            print(f"   ✅ Estudiante creado: {usuario['nombre']} {usuario['apellido']} (CI: {nuevo['ci_est']})")
+    except Exception as e:
+        print(f"   ❌ Error creando estudiantes (no se creó ninguno): {str(e)}")
     
     print(f"\n✨ Se crearon {created_count} registros de estudiante")
 
@@ -95,27 +95,25 @@ def sync_docentes():
     print(f"\n📝 Creando {len(usuarios_sin_docente)} registros de docente faltantes...")
     
     created_count = 0
-    for idx, usuario in enumerate(usuarios_sin_docente, start=1):
-        try:
-            # Generar CI temporal corto (máximo 20 caracteres)
-            # Usar las últimas 8 caracteres del UUID
-            user_suffix = usuario['id_user'][-8:]
-            ci_temp = f"DOC{user_suffix}"
-            
-            nuevo_docente = {
-                "ci_doc": ci_temp,
-                "id_user": usuario["id_user"],
-                "especialidad_doc": "Sin especificar"
-            }
-            
-            result = supabase.table("docente").insert(nuevo_docente).execute()
-            
-            if result.data:
-                created_count += 1
-                print(f"   ✅ Docente creado: {usuario['nombre']} {usuario['apellido']} (CI: {ci_temp})")
-            
-        except Exception as e:
-            print(f"   ❌ Error creando docente para {usuario['nombre']}: {str(e)}")
+    # Generar CI temporal corto (máximo 20 caracteres)
+    # Usar las últimas 8 caracteres del UUID
+    nuevos_docentes = [
+        {
+            "ci_doc": f"DOC{usuario['id_user'][-8:]}",
+            "id_user": usuario["id_user"],
+            "especialidad_doc": "Sin especificar"
+        }
+        for usuario in usuarios_sin_docente
+    ]
+    
+    try:
+        # Una sola inserción para todos los registros faltantes
+        result = insertar_lote_sync(supabase, "docente", nuevos_docentes, "ci_doc")
+        created_count = len(result)
+        for usuario, nuevo in zip(usuarios_sin_docente, nuevos_docentes):
+            print(f"   ✅ Docente creado: {usuario['nombre']} {usuario['apellido']} (CI: {nuevo['ci_doc']})")
+    except Exception as e:
+        print(f"   ❌ Error creando docentes (no se creó ninguno): {str(e)}")
     
     print(f"\n✨ Se crearon {created_count} registros de docente")
 
@@ -0,0 +1,93 @@
+"""
+Pruebas de la asignación en lote de pasajeros (app/utils/asignacion.py)
+"""
+import random
+
+import pytest
+
+from app.utils.asignacion import Asignador, optimizar
+
+
+def _comprobar_invariantes(asignador, lugares):
+    """La asignación es consistente y ninguna ruta supera su capacidad"""
+    for id_ruta, capacidad in lugares.items():
+        ocupantes = asignador.ocupantes.get(id_ruta, set())
+        assert len(ocupantes) <= capacidad
+        assert asignador.libres[id_ruta] == capacidad - len(ocupantes)
+    for id_user, id_ruta in asignador.asignado.items():
+        # Solo en rutas a las que postuló
+        assert id_ruta in asignador.costos[id_user]
+        assert id_user in asignador.ocupantes[id_ruta]
+    assert sum(len(o) for o in asignador.ocupantes.values()) == len(asignador.asignado)
+
+
+def _instancia(semilla, pasajeros=40, rutas=8):
+    azar = random.Random(semilla)
+    lugares = {f"r{i}": azar.randint(0, 4) for i in range(rutas)}
+    costos = {}
+    for u in range(pasajeros):
+        elegidas = azar.sample(sorted(lugares), azar.randint(1, 3))
+        costos[f"u{u}"] = {r: (azar.uniform(0, 3000), f"p{u}-{r}") for r in elegidas}
+    return costos, lugares
+
+
+@pytest.mark.parametrize("semilla", range(25))
+def test_capacidad_respetada_tras_voraz_y_mejora(semilla):
+    costos, lugares = _instancia(semilla)
+    asignador = Asignador(costos, lugares)
+
+    asignador.voraz()
+    _comprobar_invariantes(asignador, lugares)
+    servidos, desvio = len(asignador.asignado), asignador.desvio_total()
+
+    asignador.mejorar()
+    _comprobar_invariantes(asignador, lugares)
+    # La mejora nunca sirve a menos pasajeros ni, con los mismos, aumenta el desvío
+    assert len(asignador.asignado) >= servidos
+    if len(asignador.asignado) == servidos:
+        assert asignador.desvio_total() <= desvio + 1e-6
+
+
+def test_insertar_libera_lugar_en_ruta_llena():
+    # u1 ocupa el único lugar de A, pero también puede ir en B; u2 solo puede ir en A
+    costos = {
+        "u1": {"A": (100.0, "p1a"), "B": (200.0, "p1b")},
+        "u2": {"A": (500.0, "p2a")},
+    }
+    asignador = Asignador(costos, {"A": 1, "B": 1})
+    asignador.voraz()
+    assert asignador.asignado == {"u1": "A"}
+
+    asignador.mejorar()
+    assert asignador.asignado == {"u1": "B", "u2": "A"}
+    _comprobar_invariantes(asignador, {"A": 1, "B": 1})
+
+
+def test_intercambio_en_rutas_llenas_no_pasa_la_capacidad():
+    costos = {
+        "u1": {"A": (100.0, "p1a"), "B": (10.0, "p1b")},
+        "u2": {"A": (10.0, "p2a"), "B": (100.0, "p2b")},
+    }
+    asignador = Asignador(costos, {"A": 1, "B": 1})
+    asignador._asignar("u1", "A")
+    asignador._asignar("u2", "B")
+
+    asignador.mejorar()
+    assert asignador.asignado == {"u1": "B", "u2": "A"}
+    assert asignador.desvio_total() == 20.0
+    _comprobar_invariantes(asignador, {"A": 1, "B": 1})
+
+
+def test_optimizar_ignora_rutas_sin_lugar_y_solicitudes_sin_ubicacion():
+    linea = [(-17.40, -66.16), (-17.38, -66.14)]
+    solicitudes = [
+        {"id_pasajero_ruta": "p1", "id_user": "u1", "id_ruta": "A", "lat_recogida": -17.39, "lon_recogida": -66.15},
+        {"id_pasajero_ruta": "p2", "id_user": "u2", "id_ruta": "A", "lat_recogida": None, "lon_recogida": None},
+        {"id_pasajero_ruta": "p3", "id_user": "u3", "id_ruta": "B", "lat_recogida": -17.39, "lon_recogida": -66.15},
+    ]
+    propuesta = optimizar(solicitudes, {"A": linea, "B": linea}, {"A": 2, "B": 0})
+
+    assert [p["id_pasajero_ruta"] for p in propuesta["asignaciones"]["A"]] == ["p1"]
+    assert "B" not in propuesta["asignaciones"]
+    assert propuesta["resumen"]["sin_ubicacion"] == 1
+    assert propuesta["resumen"]["asignados"] == 1
@@ -0,0 +1,57 @@
+"""
+Pruebas de las distancias a polilíneas (app/utils/geo.py)
+"""
+import random
+
+import pytest
+
+from app.utils import geo
+
+
+def _puntos(n, semilla=7):
+    azar = random.Random(semilla)
+    return [(-17.39 + azar.uniform(-0.05, 0.05), -66.15 + azar.uniform(-0.05, 0.05)) for _ in range(n)]
+
+
+LINEAS = {
+    "recta": [(-17.40, -66.20), (-17.38, -66.10)],
+    "quebrada": [(-17.42, -66.18), (-17.39, -66.16), (-17.39, -66.12), (-17.36, -66.11)],
+    "con_segmento_nulo": [(-17.40, -66.17), (-17.40, -66.17), (-17.37, -66.13)],
+}
+
+
+def test_distancia_a_un_vertice_y_a_un_segmento():
+    linea = [(-17.39, -66.16), (-17.39, -66.15)]
+    # Sobre la línea
+    distancia, posicion = geo.distancia_a_linea((-17.39, -66.155), linea)
+    assert distancia == pytest.approx(0, abs=1e-6)
+    assert posicion == pytest.approx(geo.haversine(linea[0], (-17.39, -66.155)), rel=1e-3)
+    # Antes del inicio: la distancia es al primer vértice
+    distancia, posicion = geo.distancia_a_linea((-17.39, -66.17), linea)
+    assert distancia == pytest.approx(geo.haversine((-17.39, -66.17), linea[0]), rel=1e-3)
+    assert posicion == 0
+
+
+@pytest.mark.parametrize("nombre", sorted(LINEAS))
+def test_lote_sin_numpy_coincide_con_punto_por_punto(monkeypatch, nombre):
+    monkeypatch.setattr(geo, "np", None)
+    puntos = _puntos(50)
+    esperadas = [geo.distancia_a_linea(p, LINEAS[nombre])[0] for p in puntos]
+    assert geo.distancias_a_linea(puntos, LINEAS[nombre]) == esperadas
+
+
+@pytest.mark.parametrize("nombre", sorted(LINEAS))
+def test_lote_con_numpy_coincide_sin_numpy(monkeypatch, nombre):
+    pytest.importorskip("numpy")
+    puntos = _puntos(200)
+    con_numpy = geo.distancias_a_linea(puntos, LINEAS[nombre])
+    monkeypatch.setattr(geo, "np", None)
+    sin_numpy = geo.distancias_a_linea(puntos, LINEAS[nombre])
+    assert con_numpy == pytest.approx(sin_numpy, abs=1e-6)
+
+
+def test_lote_vacio_y_linea_de_un_punto():
+    assert geo.distancias_a_linea([], LINEAS["recta"]) == []
+    punto = (-17.38, -66.15)
+    [distancia] = geo.distancias_a_linea([punto], [(-17.39, -66.15)])
+    assert distancia == pytest.approx(geo.haversine(punto, (-17.39, -66.15)), rel=1e-3)
@@ -0,0 +1,100 @@
+"""
+Pruebas del índice de rutas de carpooling (app/utils/indice_rutas.py)
+"""
+import pytest
+
+from app.utils.indice_rutas import IndiceRutas, mascara_dias
+
+LUNES, MARTES, MIERCOLES = mascara_dias(["Lunes"]), mascara_dias(["Martes"]), mascara_dias(["Miércoles"])
+
+# Recorrido oeste -> este a lo largo de una misma latitud
+INICIO, DESTINO = (-17.39, -66.20), (-17.39, -66.10)
+
+
+def _ruta(id_ruta, hora="07:00:00", dias="Lunes,Miércoles", capacidad=4, aceptados=0, fecha="2026-01-01"):
+    return {
+        "id_ruta": id_ruta,
+        "activa": True,
+        "hora_salida": hora,
+        "dias_disponibles": dias,
+        "capacidad_ruta": capacidad,
+        "pasajeros_aceptados": aceptados,
+        "fecha_creacion": fecha,
+        "lat_inicio": INICIO[0], "lon_inicio": INICIO[1],
+        "lat_destino": DESTINO[0], "lon_destino": DESTINO[1],
+    }
+
+
+@pytest.fixture
+def indice():
+    indice = IndiceRutas(tamano_celda=0.01)
+    indice.actualizar_ruta(_ruta("a", hora="06:59:00", fecha="2026-01-01"))
+    indice.actualizar_ruta(_ruta("b", hora="07:00:00", dias="Martes", fecha="2026-01-02"))
+    indice.actualizar_ruta(_ruta("c", hora="07:30", fecha="2026-01-03", capacidad=2, aceptados=2))
+    indice.actualizar_ruta(_ruta("d", hora="07:31:00", dias="Lunes,Martes", fecha="2026-01-04"))
+    return indice
+
+
+def _ids(resultado):
+    return [id_ruta for _, id_ruta in resultado]
+
+
+def test_ventana_incluye_los_extremos(indice):
+    assert _ids(indice.filtrar(desde=7 * 60, hasta=7 * 60 + 30)) == ["c", "b"]
+
+
+def test_ventana_y_dias(indice):
+    assert _ids(indice.filtrar(LUNES, 7 * 60, 8 * 60)) == ["d", "c"]
+    assert _ids(indice.filtrar(MARTES, 7 * 60, 8 * 60)) == ["d", "b"]
+    assert _ids(indice.filtrar(LUNES | MARTES, 7 * 60, 7 * 60)) == ["b"]
+    assert _ids(indice.filtrar(MIERCOLES, hasta=7 * 60)) == ["a"]
+
+
+def test_ventana_abierta_y_sin_filtros(indice):
+    assert _ids(indice.filtrar(desde=7 * 60 + 30)) == ["d", "c"]
+    assert _ids(indice.filtrar()) == ["d", "c", "b", "a"]
+
+
+def test_lugares_minimos(indice):
+    assert _ids(indice.filtrar(LUNES, lugares_min=1)) == ["d", "a"]
+    indice.ajustar_aceptados("c", -1)
+    assert "c" in _ids(indice.filtrar(LUNES, lugares_min=1))
+
+
+def test_cambiar_horario_quita_el_anterior(indice):
+    indice.actualizar_ruta({"id_ruta": "a", "hora_salida": "18:00:00", "dias_disponibles": "Martes"})
+    assert "a" not in _ids(indice.filtrar(LUNES | MIERCOLES))
+    assert _ids(indice.filtrar(MARTES, 17 * 60, 19 * 60)) == ["a"]
+
+    indice.actualizar_ruta({"id_ruta": "a", "activa": False})
+    assert "a" not in _ids(indice.filtrar())
+
+
+def test_buscar_respeta_el_sentido_de_la_ruta(indice):
+    origen, destino = (-17.391, -66.18), (-17.389, -66.12)
+    ida = indice.buscar(origen, destino, radio_m=500)
+    assert {r["id_ruta"] for r in ida} == {"a", "b", "c", "d"}
+    # Cada valor se redondea por separado
+    assert all(abs(r["desvio_m"] - 2 * (r["distancia_origen_m"] + r["distancia_destino_m"])) <= 2 for r in ida)
+
+    # Mismos puntos en sentido contrario al recorrido
+    assert indice.buscar(destino, origen, radio_m=500) == []
+
+
+def test_buscar_descarta_lo_que_queda_fuera_del_radio(indice):
+    # Unos 1,1 km al norte del recorrido
+    lejos = (-17.38, -66.18)
+    assert indice.buscar(lejos, (-17.39, -66.12), radio_m=500) == []
+    assert indice.buscar(lejos, (-17.39, -66.12), radio_m=1500) != []
+
+
+def test_buscar_ordena_por_desvio():
+    indice = IndiceRutas(tamano_celda=0.01)
+    indice.actualizar_ruta(_ruta("cerca"))
+    lejana = _ruta("lejos")
+    lejana["lat_inicio"] = lejana["lat_destino"] = -17.393
+    indice.actualizar_ruta(lejana)
+
+    resultado = indice.buscar((-17.3905, -66.18), (-17.3905, -66.12), radio_m=1000)
+    assert [r["id_ruta"] for r in resultado] == ["cerca", "lejos"]
+    assert resultado[0]["desvio_m"] < resultado[1]["desvio_m"]